@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""Compare the import time and the per-call overhead of the ABI mode and of the compiled module.
+
+The cost of dispatching a call through the Api class is measured as well. The compiled
+module is used if it was built, for instance with:
+
+    $ python setup.py build_ext --inplace
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/bench_api.py
+
+"""
+
+import argparse
+import subprocess
+import sys
+import timeit
+
+IMPORT_ONLY = "import pystassh"
+# libssh is loaded on first use
+IMPORT_ABI_MODE = (
+    "import sys; sys.modules['pystassh._pystassh_ffi'] = None; "
+    "import pystassh; pystassh.api.Api.lib"
+)
+IMPORT_DEFAULT = "import pystassh; pystassh.api.Api.lib"
+
+
+def bench_import(statement, repeat):
+    """Time the import of pystassh in a fresh interpreter, minus the interpreter startup."""
+
+    def run(code):
+        timings = []
+        for _ in range(repeat):
+            timings.append(
+                timeit.timeit(
+                    lambda: subprocess.check_call([sys.executable, "-c", code]),
+                    number=1,
+                )
+            )
+        return min(timings)
+
+    return run(statement) - run("pass")
+
+
+def bench_call(lib, ffi, number):
+    """Time a call to a cheap libssh function, which returns immediately on a NULL session."""
+    function = lib.ssh_is_connected
+    null = ffi.NULL
+    return min(timeit.repeat(lambda: function(null), number=number, repeat=5)) / number
+
+
+def bench_dispatch(number):
+    """Time a call through the Api class, with the bound attribute and with a lookup in lib."""
+    from pystassh.api import Api, ApiMetaclass
+
+    null = Api.NULL
+
+    def bound():
+        Api.ssh_is_connected(null)
+
+    def looked_up():
+        # the dispatch used before the functions were bound on the class
+        ApiMetaclass.__getattr__(Api, "ssh_is_connected")(null)
+
+    return [
+        min(timeit.repeat(function, number=number, repeat=5)) / number
+        for function in (bound, looked_up)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=1000000, help="number of calls")
+    parser.add_argument("--imports", type=int, default=10, help="number of imports")
+    args = parser.parse_args()
+
+    from pystassh import api
+
+    abi_ffi, abi_lib = api._init_abi_api()
+    print(
+        "import without loading libssh: {:.2f} ms".format(
+            bench_import(IMPORT_ONLY, args.imports) * 1000
+        )
+    )
+    print("{:>10} {:>14} {:>14}".format("mode", "import (ms)", "call (ns)"))
+    print(
+        "{:>10} {:>14.2f} {:>14.1f}".format(
+            "abi",
+            bench_import(IMPORT_ABI_MODE, args.imports) * 1000,
+            bench_call(abi_lib, abi_ffi, args.calls) * 1e9,
+        )
+    )
+
+    bound, looked_up = bench_dispatch(args.calls)
+    print(
+        "call through Api: {:.1f} ns bound, {:.1f} ns looked up in lib".format(
+            bound * 1e9, looked_up * 1e9
+        )
+    )
+
+    try:
+        from pystassh._pystassh_ffi import ffi, lib
+    except ImportError:
+        print(
+            "the compiled module is not built, run: python setup.py build_ext --inplace"
+        )
+        return
+    print(
+        "{:>10} {:>14.2f} {:>14.1f}".format(
+            "compiled",
+            bench_import(IMPORT_DEFAULT, args.imports) * 1000,
+            bench_call(lib, ffi, args.calls) * 1e9,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
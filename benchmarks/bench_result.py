@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+""" Measure how the time spent building a Result scales with the size of the output.
+
+The libssh reads are replaced by an in-memory source, so that only the cost of
+accumulating the output is measured. The time per megabyte should stay roughly
+constant from 1 MB up to 1 GB. The memory kept by each Result of a small output is
+measured too, as fleets keep many of them alive.
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/bench_result.py --max-size 1024
+
+"""
+
+import argparse
+import contextlib
+import time
+import tracemalloc
+
+from pystassh import api
+from pystassh.result import Result
+
+MB = 1024 * 1024
+
+
+@contextlib.contextmanager
+def fake_output(size, chunk_size=100000):
+    """Make every channel read return chunks of a fake output of ``size`` bytes."""
+    payload = b"x" * chunk_size
+    remaining = {False: size, True: 0}
+
+    def ssh_channel_poll(_, is_stderr):
+        return remaining[bool(is_stderr)] or api.SSH_EOF
+
+    def ssh_channel_read(_, buffer, buffer_size, is_stderr):
+        count = min(remaining[bool(is_stderr)], buffer_size, chunk_size)
+        remaining[bool(is_stderr)] -= count
+        buffer[0:count] = payload[:count]
+        return count
+
+    previous = {
+        name: api.Api.__dict__.get(name)
+        for name in (
+            "ssh_channel_poll",
+            "ssh_channel_read",
+            "ssh_channel_get_exit_status",
+        )
+    }
+    api.Api.ssh_channel_poll = ssh_channel_poll
+    api.Api.ssh_channel_read = ssh_channel_read
+    api.Api.ssh_channel_get_exit_status = lambda _: 0
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                delattr(api.Api, name)
+            else:
+                setattr(api.Api, name, value)
+
+
+def bench(size):
+    with fake_output(size):
+        start = time.perf_counter()
+        result = Result("<channel object>", "bench")
+        elapsed = time.perf_counter() - start
+    assert len(result.raw_stdout) == size
+    return elapsed
+
+
+def bench_memory(count):
+    """Measure the memory kept per Result, for ``count`` results of small outputs."""
+    outputs = [("uptime", b"up %d days\n" % index, b"", 0) for index in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = [Result.from_output(*output) for output in outputs]
+    for result in results:
+        result.stdout
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size / len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--max-size", type=int, default=1024, help="largest output to test, in MB"
+    )
+    parser.add_argument(
+        "--results", type=int, default=100000, help="number of results to keep alive"
+    )
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12}".format("size (MB)", "time (s)", "ms per MB"))
+    size = 1
+    while size <= args.max_size:
+        elapsed = bench(size * MB)
+        print("{:>10} {:>12.3f} {:>12.3f}".format(size, elapsed, elapsed * 1000 / size))
+        size *= 4
+
+    print("{:.0f} bytes per Result".format(bench_memory(args.results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark pystassh end-to-end against a throwaway local OpenSSH server.
+
+It measures the connection latency, with and without the cache of decrypted private
+keys, the round-trip latency of small commands, the time to run a command on --sessions
+concurrent sessions from a single thread and from a thread per session, the
+throughput of command outputs from 1 KB up to --max-size MB, the throughput of reads and
+writes in shell mode, the throughput of file transfers compared to the scp binary, the
+throughput per cipher and with compression, and the memory peaks. The results are written as JSON so that runs can be compared.
+
+Usage:
+
+    $ PYTHONPATH=. python benchmarks/bench_sshd.py --output bench.json
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from local_sshd import LocalSshd
+
+import pystassh
+from pystassh import Session
+from pystassh.fleet import Fleet
+from pystassh.options import Options
+from pystassh.reactor import Reactor
+
+CIPHERS = [
+    "aes128-gcm@openssh.com",
+    "aes256-gcm@openssh.com",
+    "chacha20-poly1305@openssh.com",
+    "aes128-ctr",
+    "aes256-ctr",
+]
+
+KB = 1024
+MB = 1024 * KB
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def summarize(timings):
+    """Summarize a list of durations, in seconds, as milliseconds."""
+    return {
+        "count": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def bench_connect(session_kwargs, iterations, key_cache=True):
+    timings = []
+    for _ in range(iterations):
+        session = Session(key_cache=key_cache, **session_kwargs)
+        start = time.perf_counter()
+        session.connect()
+        timings.append(time.perf_counter() - start)
+        session.disconnect()
+    return summarize(timings)
+
+
+def bench_round_trip(session, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        session.execute("true")
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def bench_pipelined(session, count):
+    """Compare running ``count`` commands one after the other and pipelined."""
+    commands = ["true"] * count
+    start = time.perf_counter()
+    for command in commands:
+        session.execute(command)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    session.execute_pipelined(commands)
+    pipelined = time.perf_counter() - start
+    return {
+        "count": count,
+        "sequential_ms": sequential * 1000,
+        "pipelined_ms": pipelined * 1000,
+    }
+
+
+def bench_concurrent(session_kwargs, count):
+    """Compare connecting ``count`` sessions and running a command on each of them from a
+    single thread with a Reactor, and from a thread per session with a Fleet."""
+    # each session needs a socket, on both sides
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 4 * count)), hard))
+
+    timings = []
+    errors = 0
+    sessions = [Session(**session_kwargs) for _ in range(count)]
+    start = time.perf_counter()
+    with Reactor() as reactor:
+
+        def _on_done(future):
+            nonlocal errors
+            timings.append(time.perf_counter() - start)
+            errors += future.exception() is not None
+
+        for session in sessions:
+            reactor.execute(session, "true").add_done_callback(_on_done)
+        reactor.run()
+    reactor_time = time.perf_counter() - start
+    for session in sessions:
+        session.disconnect()
+    results = {"count": count, "reactor": summarize(timings)}
+    results["reactor"].update(errors=errors, total_ms=reactor_time * 1000)
+
+    hostname = session_kwargs["hostname"]
+    kwargs = {key: value for key, value in session_kwargs.items() if key != "hostname"}
+    fleet = Fleet([hostname] * count, max_workers=count, **kwargs)
+    timings = []
+    errors = 0
+    start = time.perf_counter()
+    for host_result in fleet.iter_execute("true"):
+        timings.append(time.perf_counter() - start)
+        errors += not host_result.ok
+    results["threads"] = summarize(timings)
+    results["threads"].update(
+        errors=errors, total_ms=(time.perf_counter() - start) * 1000
+    )
+    return results
+
+
+def bench_output(session, size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = session.execute("head -c {} /dev/zero".format(size))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result.raw_stdout) == size
+    return {
+        "size": size,
+        "seconds": elapsed,
+        "mb_per_second": size / MB / elapsed,
+        "python_peak_bytes": peak,
+    }
+
+
+def bench_shell(session, size, chunk_size=64 * KB):
+    channel = session.open_channel()
+    with channel:
+        channel.request_shell()
+        channel.write("head -c {} /dev/zero; exit\n".format(size))
+        buffer = bytearray(chunk_size)
+        received = 0
+        start = time.perf_counter()
+        while received < size:
+            count = channel.readinto(buffer)
+            if count == 0:
+                break
+            received += count
+        read_elapsed = time.perf_counter() - start
+
+    channel = session.open_channel()
+    with channel:
+        channel.request_shell()
+        channel.write("exec cat > /dev/null\n")
+        payload = "x" * chunk_size
+        written = 0
+        start = time.perf_counter()
+        while written < size:
+            written += channel.write(payload)
+        write_elapsed = time.perf_counter() - start
+
+    return {
+        "size": size,
+        "read_mb_per_second": received / MB / read_elapsed,
+        "write_mb_per_second": written / MB / write_elapsed,
+    }
+
+
+def bench_transfer(sshd, session, size):
+    """Compare the throughput of upload() and download() with the scp binary."""
+    directory = tempfile.mkdtemp(prefix="pystassh-bench-")
+    local_path = os.path.join(directory, "local")
+    remote_path = os.path.join(directory, "remote")
+    with open(local_path, "wb") as local_file:
+        local_file.write(os.urandom(size))
+
+    def timed(function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return size / MB / (time.perf_counter() - start)
+
+    def scp(source, destination):
+        subprocess.check_call(
+            ["scp", "-q", "-P", str(sshd.port)]
+            + sshd.ssh_options
+            + [source, destination]
+        )
+
+    remote = "{}@127.0.0.1:{}".format(sshd.session_kwargs["username"], remote_path)
+    try:
+        return {
+            "size": size,
+            "upload_mb_per_second": timed(session.upload, local_path, remote_path),
+            "download_mb_per_second": timed(session.download, remote_path, local_path),
+            "scp_upload_mb_per_second": timed(scp, local_path, remote),
+            "scp_download_mb_per_second": timed(scp, remote, local_path),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_options(session_kwargs, size):
+    """Measure the throughput of a command output with each cipher, and with compression."""
+    variants = [
+        ("cipher={}".format(cipher), Options(ciphers=[cipher])) for cipher in CIPHERS
+    ]
+    variants += [
+        ("compression={}".format(compression), Options(compression=compression))
+        for compression in (False, True)
+    ]
+    results = []
+    for variant, options in variants:
+        with Session(options=options, **session_kwargs) as session:
+            measure = bench_output(session, size)
+        results.append(
+            {
+                "variant": variant,
+                "size": size,
+                "mb_per_second": measure["mb_per_second"],
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--max-size", type=int, default=1024, help="largest output to test, in MB"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="number of round trips to measure"
+    )
+    parser.add_argument(
+        "--connections", type=int, default=20, help="number of connections to measure"
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=1000,
+        help="number of concurrent sessions to measure",
+    )
+    parser.add_argument(
+        "--output", default="bench_sshd.json", help="file to write the results to"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "pystassh": pystassh.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+        }
+    }
+    with LocalSshd() as sshd:
+        results["connect"] = bench_connect(sshd.session_kwargs, args.connections)
+        print(
+            "connect: {p50_ms:.2f} ms (p50), {p99_ms:.2f} ms (p99)".format(
+                **results["connect"]
+            )
+        )
+        for key_cache in (False, True):
+            name = "connect_protected_key_{}".format(
+                "cached" if key_cache else "uncached"
+            )
+            results[name] = bench_connect(
+                sshd.protected_session_kwargs, args.connections, key_cache
+            )
+            print(
+                "{}: {p50_ms:.2f} ms (p50), {p99_ms:.2f} ms (p99)".format(
+                    name, **results[name]
+                )
+            )
+
+        results["concurrent"] = bench_concurrent(sshd.session_kwargs, args.sessions)
+        for name in ("reactor", "threads"):
+            print(
+                "{} sessions with {}: {total_ms:.0f} ms, {p99_ms:.0f} ms (p99), "
+                "{errors} errors".format(
+                    args.sessions, name, **results["concurrent"][name]
+                )
+            )
+
+        with Session(**sshd.session_kwargs) as session:
+            results["round_trip"] = bench_round_trip(session, args.iterations)
+            print(
+                "round trip: {p50_ms:.2f} ms (p50), {p99_ms:.2f} ms (p99)".format(
+                    **results["round_trip"]
+                )
+            )
+
+            results["pipelined"] = bench_pipelined(session, 50)
+            print(
+                "{count} commands: {sequential_ms:.2f} ms sequential, "
+                "{pipelined_ms:.2f} ms pipelined".format(**results["pipelined"])
+            )
+
+            results["output"] = []
+            size = KB
+            while size <= args.max_size * MB:
+                measure = bench_output(session, size)
+                results["output"].append(measure)
+                print(
+                    "output of {size} bytes: {mb_per_second:.1f} MB/s, "
+                    "python peak {python_peak_bytes} bytes".format(**measure)
+                )
+                size *= 32
+
+            results["shell"] = bench_shell(session, min(args.max_size, 64) * MB)
+            print(
+                "shell: read {read_mb_per_second:.1f} MB/s, write {write_mb_per_second:.1f} MB/s".format(
+                    **results["shell"]
+                )
+            )
+
+            results["transfer"] = bench_transfer(
+                sshd, session, min(args.max_size, 256) * MB
+            )
+            print(
+                "transfer: upload {upload_mb_per_second:.1f} MB/s "
+                "(scp {scp_upload_mb_per_second:.1f} MB/s), download "
+                "{download_mb_per_second:.1f} MB/s "
+                "(scp {scp_download_mb_per_second:.1f} MB/s)".format(
+                    **results["transfer"]
+                )
+            )
+
+        results["options"] = bench_options(
+            sshd.session_kwargs, min(args.max_size, 256) * MB
+        )
+        for measure in results["options"]:
+            print("{variant}: {mb_per_second:.1f} MB/s".format(**measure))
+
+    results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
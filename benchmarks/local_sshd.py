@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""A throwaway OpenSSH server, listening on a random local port, to run benchmarks against.
+
+The host key and the client keys are generated in a temporary directory, which is removed
+once the server is stopped. The server accepts the current user, with the client keys only:
+a plain one, and one encrypted with a passphrase.
+
+Examples:
+
+    >>> with LocalSshd() as sshd:
+    ...     with Session(**sshd.session_kwargs) as ssh_session:
+    ...         print(ssh_session.execute('whoami').stdout)
+
+"""
+
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+PASSPHRASE = "pystassh"
+
+SSHD_CONFIG = """\
+ListenAddress 127.0.0.1
+Port {port}
+HostKey {directory}/host_key
+AuthorizedKeysFile {directory}/authorized_keys
+PidFile {directory}/sshd.pid
+StrictModes no
+UsePAM no
+PasswordAuthentication no
+PubkeyAuthentication yes
+MaxSessions 1000
+MaxStartups 1000
+Subsystem sftp internal-sftp
+LogLevel ERROR
+"""
+
+
+def find_sshd():
+    """Find the OpenSSH server binary, which usually is not on the PATH of regular users."""
+    for candidate in (shutil.which("sshd"), "/usr/sbin/sshd", "/usr/local/sbin/sshd"):
+        if candidate and os.access(candidate, os.X_OK):
+            return candidate
+    raise RuntimeError("sshd cannot be found, please install an OpenSSH server")
+
+
+def random_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalSshd:
+    def __init__(self, port=None, startup_timeout=10):
+        """A local OpenSSH server, started on enter and stopped on exit.
+
+        Args:
+            port (int): the port to listen on, defaults to a random free port
+            startup_timeout (float): number of seconds to wait for the server to accept connections
+        """
+        self.port = port or random_port()
+        self._startup_timeout = startup_timeout
+        self._directory = None
+        self._process = None
+
+    @property
+    def session_kwargs(self):
+        """The arguments to give to a Session to connect to this server."""
+        return {
+            "hostname": "127.0.0.1",
+            "port": self.port,
+            "username": getpass.getuser(),
+            "privkey_file": os.path.join(self._directory, "client_key"),
+        }
+
+    @property
+    def protected_session_kwargs(self):
+        """The arguments to give to a Session to connect to this server with a client key
+        encrypted with a passphrase."""
+        return dict(
+            self.session_kwargs,
+            privkey_file=os.path.join(self._directory, "protected_key"),
+            passphrase=PASSPHRASE,
+        )
+
+    @property
+    def ssh_options(self):
+        """The command line options of the OpenSSH clients to connect to this server."""
+        return [
+            "-i",
+            os.path.join(self._directory, "client_key"),
+            "-o",
+            "StrictHostKeyChecking=no",
+            "-o",
+            "UserKnownHostsFile=/dev/null",
+            "-o",
+            "LogLevel=ERROR",
+        ]
+
+    def _keygen(self, name, passphrase=""):
+        subprocess.check_call(
+            [
+                "ssh-keygen",
+                "-q",
+                "-t",
+                "ed25519",
+                "-N",
+                passphrase,
+                "-f",
+                os.path.join(self._directory, name),
+            ]
+        )
+
+    def start(self):
+        self._directory = tempfile.mkdtemp(prefix="pystassh-sshd-")
+        try:
+            self._start()
+        except Exception:
+            self.stop()
+            raise
+
+    def _start(self):
+        self._keygen("host_key")
+        self._keygen("client_key")
+        self._keygen("protected_key", PASSPHRASE)
+        with open(os.path.join(self._directory, "authorized_keys"), "w") as keys_file:
+            for name in ("client_key.pub", "protected_key.pub"):
+                with open(os.path.join(self._directory, name)) as key_file:
+                    keys_file.write(key_file.read())
+        config = os.path.join(self._directory, "sshd_config")
+        with open(config, "w") as config_file:
+            config_file.write(
+                SSHD_CONFIG.format(port=self.port, directory=self._directory)
+            )
+
+        # sshd must be called with an absolute path to accept connections
+        self._process = subprocess.Popen([find_sshd(), "-D", "-e", "-f", config])
+        deadline = time.monotonic() + self._startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(
+                    "sshd exited with code {}".format(self._process.returncode)
+                )
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("sshd did not start in {}s".format(self._startup_timeout))
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
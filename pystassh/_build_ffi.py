@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Build script of the compiled module of pystassh, in cffi's out-of-line API mode.
+
+Calls to libssh through the compiled module skip the dynamic calls of libffi, and the
+declarations do not need to be parsed at import time. The module is optional: if it
+cannot be built, pystassh falls back to loading libssh in ABI mode.
+
+Usage:
+
+    $ python pystassh/_build_ffi.py
+
+"""
+
+import os
+
+from cffi import FFI
+
+# this file is executed by cffi outside of the package: _cdef is loaded from its path
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "_cdef.py")) as f:
+    _namespace = {}
+    exec(f.read(), _namespace)
+
+ffibuilder = FFI()
+ffibuilder.cdef(
+    _namespace["CDEF"] + _namespace["SFTP_AIO_CDEF"] + "#define PYSTASSH_SFTP_AIO ..."
+)
+ffibuilder.set_source(
+    "pystassh._pystassh_ffi",
+    """
+    #include <sys/time.h>
+    #include <libssh/libssh.h>
+    #include <libssh/sftp.h>
+
+    #if LIBSSH_VERSION_INT >= SSH_VERSION_INT(0, 11, 0)
+    #define PYSTASSH_SFTP_AIO 1
+    #else
+    /* placeholders for older versions, they are never called */
+    #define PYSTASSH_SFTP_AIO 0
+    static ssize_t sftp_aio_begin_write(void* f, const void* b, size_t l, void** a) { return SSH_ERROR; }
+    static ssize_t sftp_aio_wait_write(void** a) { return SSH_ERROR; }
+    static void sftp_aio_free(void* a) {}
+    #endif
+    """,
+    libraries=["ssh"],
+    # channels, keys and sftp handles are declared as void pointers rather than libssh's opaque types
+    extra_compile_args=["-Wno-incompatible-pointer-types"],
+)
+
+if __name__ == "__main__":
+    ffibuilder.compile(
+        tmpdir=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        verbose=True,
+    )
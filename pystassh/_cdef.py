@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""The declarations of the libssh functions used by pystassh.
+
+They are shared by the ABI mode loader in api.py and by the build script of the compiled
+module, _build_ffi.py, so this module must not import anything.
+"""
+
+CDEF = """
+struct timeval {
+    long tv_sec;
+    long tv_usec;
+};
+
+void* ssh_new();
+void ssh_free(void*);
+int ssh_options_set(void*, int, const void*);
+int ssh_connect(void*);
+void ssh_disconnect(void*);
+int ssh_is_connected(void*);
+const char* ssh_get_error(void*);
+void ssh_set_blocking(void*, int);
+int ssh_is_blocking(void*);
+int ssh_get_fd(void*);
+int ssh_get_poll_flags(void*);
+
+int ssh_userauth_password(void*, char*, char*);
+int ssh_userauth_autopubkey(void*, char*);
+int ssh_userauth_publickey(void*, const char*, void*);
+
+int ssh_pki_import_privkey_file(const char*, const char*, void*, void*, void**);
+void ssh_key_free(void*);
+
+void* ssh_channel_new(void*);
+int ssh_channel_open_session(void*);
+int ssh_channel_is_open(void*);
+int ssh_channel_is_closed(void*);
+void ssh_channel_free(void*);
+int ssh_channel_request_exec(void*, char*);
+int ssh_channel_request_pty(void*);
+int ssh_channel_request_shell(void*);
+
+int ssh_channel_get_exit_status(void*);
+int ssh_channel_read(void*, char*, int, int);
+int ssh_channel_read_timeout(void*, void*, uint32_t, int, int);
+int ssh_channel_send_eof(void*);
+int ssh_channel_is_eof(void*);
+int ssh_channel_write(void*, const void*, uint32_t);
+uint32_t ssh_channel_window_size(void*);
+int ssh_channel_read_nonblocking(void*, void*, uint32_t, int);
+int ssh_channel_poll(void*, int);
+int ssh_channel_select(void**, void**, void**, struct timeval*);
+void* ssh_channel_get_session(void*);
+int ssh_channel_request_send_signal(void*, const char*);
+
+void* sftp_new(void*);
+int sftp_init(void*);
+void sftp_free(void*);
+int sftp_get_error(void*);
+void* sftp_open(void*, const char*, int, unsigned int);
+int sftp_close(void*);
+int sftp_seek64(void*, uint64_t);
+ssize_t sftp_write(void*, const void*, size_t);
+int sftp_async_read_begin(void*, uint32_t);
+int sftp_async_read(void*, void*, uint32_t, uint32_t);
+"""
+
+# the asynchronous writes of sftp, only available from libssh 0.11
+SFTP_AIO_CDEF = """
+ssize_t sftp_aio_begin_write(void*, const void*, size_t, void**);
+ssize_t sftp_aio_wait_write(void**);
+void sftp_aio_free(void*);
+"""
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+"""An asyncio front-end to run commands without blocking the event loop.
+
+The libssh's session is put in nonblocking mode and its socket is watched by the
+event loop, so that a single thread can drive many concurrent commands.
+
+Examples:
+
+    Run two commands concurrently on the same server.
+
+    >>> async def main():
+    ...     async with AsyncSession('localhost', 'foo', 'bar') as ssh_session:
+    ...         results = await asyncio.gather(
+    ...             ssh_session.execute('uptime'), ssh_session.execute('whoami')
+    ...         )
+    ...         print([result.stdout for result in results])
+
+"""
+
+import asyncio
+import collections
+
+from . import exceptions
+from .channel import _deadline
+from .session import Session
+from .tasks import CommandTask, ConnectTask, TaskRunner
+
+
+def _blocking(name):
+    """A method of Session that would block the event loop, and that AsyncSession refuses."""
+
+    def _method(self, *args, **kwargs):
+        raise TypeError(
+            "{}() is blocking and cannot be used with an AsyncSession".format(name)
+        )
+
+    _method.__name__ = name
+    _method.__doc__ = "Not supported by an AsyncSession, it would block the event loop."
+    return _method
+
+
+class AsyncSession(Session):
+    def __init__(self, *args, loop=None, **kwargs):
+        """An AsyncSession is a Session whose connection and commands are coroutines.
+
+        It accepts the same arguments as Session. The blocking methods of Session, such as
+        open_channel(), execute_pipelined() or upload(), raise a TypeError.
+
+        Args:
+            loop: the event loop to run on, defaults to the current event loop
+        """
+        super().__init__(*args, **kwargs)
+        self._loop = loop
+        self._runner = TaskRunner()
+        self._watched = {}
+        self._timer = None
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def _submit(self, task):
+        """Run a task on the event loop.
+
+        Returns:
+            asyncio.Future: resolved with the result of the task once it is done
+        """
+        future = self._get_loop().create_future()
+
+        def _on_done(task, error):
+            if future.cancelled():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result)
+
+        def _on_cancelled(future):
+            if future.cancelled():
+                self._runner.cancel(task)
+                self._watch()
+
+        future.add_done_callback(_on_cancelled)
+        self._runner.add(task, _on_done)
+        self._drive()
+        return future
+
+    def _drive(self):
+        self._runner.run()
+        self._watch()
+
+    def _watch(self):
+        loop = self._get_loop()
+        wanted = dict(self._runner.waiting_sockets())
+        for fd, wants_write in list(self._watched.items()):
+            if fd not in wanted:
+                loop.remove_reader(fd)
+            if wants_write and not wanted.get(fd):
+                loop.remove_writer(fd)
+        for fd, wants_write in wanted.items():
+            loop.add_reader(fd, self._drive)
+            if wants_write:
+                loop.add_writer(fd, self._drive)
+        self._watched = wanted
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if len(self._runner):
+            self._timer = loop.call_later(self._runner.poll_timeout(), self._drive)
+
+    async def connect(self):
+        """Initiate the connection and authentication process on the remote server.
+
+        Raises:
+            ConnectionException: if an error occurred during the connection process
+            AuthenticationException: if an error occurred during the authentication process
+        """
+        if self.is_connected():
+            return
+        await self._submit(ConnectTask(self))
+
+    def _unwatch(self):
+        if self._loop is None:
+            return
+        for fd, wants_write in self._watched.items():
+            self._loop.remove_reader(fd)
+            if wants_write:
+                self._loop.remove_writer(fd)
+        self._watched = {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def disconnect(self):
+        """Close the current connection and cancel the running commands."""
+        if getattr(self, "_runner", None) is not None:
+            self._runner.cancel_all()
+            self._unwatch()
+        super().disconnect()
+
+    def _attach(self, session):
+        self._session = session
+        self._channel = AsyncChannel(self)
+
+    async def execute(self, command, stdin=None, limits=None, timeout=None):
+        """Execute a command on the remote server.
+
+        Args:
+            command (str): the command to run
+            stdin: optional data to write to the standard input of the command, see
+                   Session.execute(). File objects are read from the event loop.
+            limits (OutputLimits): limits on the size of the outputs, see Session.execute()
+            timeout (float): number of seconds after which the command is killed and a
+                             TimeoutException raised, with the output received so far
+
+        Returns:
+            Result: the Result object for this command
+        """
+        if not self.is_connected():
+            raise exceptions.PystasshException(
+                "The session is not ready, call the connect() method first"
+            )
+        return await AsyncChannel(self).execute(
+            command, stdin=stdin, limits=limits, timeout=timeout
+        )
+
+    def execute_stream(self, command, max_pending=16):
+        """Execute a command on the remote server and stream its output as it arrives.
+
+        Args:
+            command (str): the command to run
+            max_pending (int): number of chunks that can wait to be consumed before reading pauses
+
+        Returns:
+            AsyncResultStream: an asynchronous iterator over the output of the command
+        """
+        if not self.is_connected():
+            raise exceptions.PystasshException(
+                "The session is not ready, call the connect() method first"
+            )
+        return AsyncChannel(self).execute_stream(command, max_pending=max_pending)
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with an AsyncSession")
+
+    # the session is left in nonblocking mode once connected, these would fail or block
+    open_channel = _blocking("open_channel")
+    execute_batch = _blocking("execute_batch")
+    iter_execute_batch = _blocking("iter_execute_batch")
+    execute_pipelined = _blocking("execute_pipelined")
+    iter_execute_pipelined = _blocking("iter_execute_pipelined")
+    open_sftp = _blocking("open_sftp")
+    upload = _blocking("upload")
+    download = _blocking("download")
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_):
+        self.disconnect()
+
+
+class AsyncChannel:
+    def __init__(self, session):
+        """An AsyncChannel runs commands on an AsyncSession, each in its own libssh's channel.
+
+        Args:
+            session (AsyncSession): the session the channel is bound to
+        """
+        self._session = session
+        self._tasks = []
+
+    def _submit(self, task):
+        self._tasks.append(task)
+        future = self._session._submit(task)
+        future.add_done_callback(lambda _: self._tasks.remove(task))
+        return future
+
+    async def execute(self, command, stdin=None, limits=None, timeout=None):
+        """Execute a command.
+
+        Args:
+            command (str): the command to run
+            stdin: optional data to write to the standard input of the command
+            limits (OutputLimits): limits on the size of the outputs kept in the Result
+            timeout (float): number of seconds after which the command is killed, None to
+                             wait for it forever
+
+        Returns:
+            Result: the Result object for this command
+
+        Raises:
+            OutputLimitException: if an output exceeds its limits and the command is aborted
+            TimeoutException: if the command is not over in time
+        """
+        task = CommandTask(
+            self._session._session,
+            command,
+            buffer_pool=self._session._buffer_pool,
+            instrument=self._session._instrument,
+            stdin=stdin,
+            limits=limits,
+            deadline=_deadline(timeout),
+        )
+        return await self._submit(task)
+
+    def execute_stream(self, command, max_pending=16):
+        """Execute a command and stream its output as it arrives.
+
+        Args:
+            command (str): the command to run
+            max_pending (int): number of chunks that can wait to be consumed before reading pauses
+
+        Returns:
+            AsyncResultStream: an asynchronous iterator over the output of the command
+        """
+        return AsyncResultStream(self, command, max_pending=max_pending)
+
+    def close(self):
+        """Cancel the commands running in this channel."""
+        for task in list(self._tasks):
+            self._session._runner.cancel(task)
+
+
+class AsyncResultStream:
+    def __init__(self, channel, command, max_pending=16):
+        """An asynchronous iterator over the output chunks of a running command.
+
+        Each item is a ``(is_stderr, chunk)`` tuple. Reading from the channel is paused while
+        ``max_pending`` chunks are waiting to be consumed, so that memory stays bounded.
+
+        Args:
+            channel (AsyncChannel): the channel in which the command runs
+            command (str): the command to run
+            max_pending (int): number of chunks that can wait to be consumed before reading pauses
+        """
+        if max_pending <= 0:
+            raise ValueError(
+                "Max pending must be positive but received '{}'".format(max_pending)
+            )
+        session = channel._session
+        self._session = session
+        self._command = command
+        self._max_pending = max_pending
+        self._chunks = collections.deque()
+        self._waiter = None
+        self._task = CommandTask(
+            session._session,
+            command,
+            buffer_pool=session._buffer_pool,
+            on_output=self._on_output,
+            instrument=session._instrument,
+        )
+        self._future = channel._submit(self._task)
+        self._future.add_done_callback(self._on_done)
+
+    def _wake_up(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _on_output(self, is_stderr, chunk):
+        self._chunks.append((is_stderr, chunk))
+        if len(self._chunks) >= self._max_pending:
+            self._task.paused = True
+        self._wake_up()
+
+    def _on_done(self, future):
+        if future.cancelled():
+            self._chunks.clear()
+        self._wake_up()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._chunks:
+            if self._future.done():
+                if not self._future.cancelled() and self._future.exception():
+                    raise self._future.exception()
+                raise StopAsyncIteration
+            self._waiter = self._session._get_loop().create_future()
+            await self._waiter
+
+        chunk = self._chunks.popleft()
+        if self._task.paused and len(self._chunks) < self._max_pending:
+            self._task.paused = False
+            self._session._get_loop().call_soon(self._session._drive)
+        return chunk
+
+    def close(self):
+        """Stop reading the output and close the channel."""
+        if not self._future.done():
+            self._future.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    @property
+    def command(self):
+        """The command from wich the current output comes from."""
+        return self._command
+
+    @property
+    def return_code(self):
+        """The return code of the command as an int, or None until the stream is exhausted."""
+        if self._chunks or not self._future.done() or self._future.cancelled():
+            return None
+        if self._future.exception() is not None:
+            return None
+        return self._future.result().return_code
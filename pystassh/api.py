@@ -1,24 +1,117 @@
 # -*- coding: utf-8 -*-
 
-import ctypes.util
 import os
-
-from cffi import FFI
+import threading
 
 from . import exceptions
+from ._cdef import CDEF, SFTP_AIO_CDEF
 
 SSH_OK = 0
 SSH_ERROR = -1
+SSH_AGAIN = -2
+SSH_EOF = -127
 SSH_AUTH_SUCCESS = 0
+SSH_AUTH_AGAIN = 4
+
+SSH_WRITE_PENDING = 0x08
 
 SSH_OPTIONS_HOST = 0
 SSH_OPTIONS_PORT_STR = 2
 SSH_OPTIONS_USER = 4
+SSH_OPTIONS_TIMEOUT = 9
+SSH_OPTIONS_TIMEOUT_USEC = 10
+SSH_OPTIONS_CIPHERS_C_S = 15
+SSH_OPTIONS_CIPHERS_S_C = 16
+SSH_OPTIONS_COMPRESSION = 22
+SSH_OPTIONS_COMPRESSION_LEVEL = 23
+SSH_OPTIONS_KEY_EXCHANGE = 24
+SSH_OPTIONS_HOSTKEYS = 25
+SSH_OPTIONS_HMAC_C_S = 29
+SSH_OPTIONS_HMAC_S_C = 30
+SSH_OPTIONS_NODELAY = 36
+SSH_OPTIONS_REKEY_DATA = 39
+SSH_OPTIONS_REKEY_TIME = 40
+
+# environment variable giving the path of the libssh library to load
+LIBRARY_PATH_ENV = "PYSTASSH_LIBSSH_PATH"
+
+_configured_path = None
+_resolved_path = None
+_load_lock = threading.Lock()
+
+
+def configure(library_path=None):
+    """Set the path of the libssh library to load, so that it is not searched for.
+
+    It takes precedence over the PYSTASSH_LIBSSH_PATH environment variable, and must be
+    called before libssh is first used.
+
+    Args:
+        library_path (str): path of the libssh library, None to search for it again
+
+    Raises:
+        PystasshException: if libssh is already loaded
+    """
+    global _configured_path, _resolved_path
+    with _load_lock:
+        if is_loaded():
+            raise exceptions.PystasshException(
+                "libssh is already loaded from '{}'".format(_resolved_path)
+            )
+        _configured_path = library_path
+        _resolved_path = None
+
+
+def _explicit_path():
+    return _configured_path or os.environ.get(LIBRARY_PATH_ENV) or None
+
+
+def library_path():
+    """The path of the libssh library to load in ABI mode.
+
+    The configured path is used if any, otherwise the library is searched for, which may
+    spawn subprocesses. The result is cached.
+
+    Returns:
+        str: the path or name of the library, None if it cannot be found
+    """
+    global _resolved_path
+    if _resolved_path is None:
+        _resolved_path = _explicit_path()
+    if _resolved_path is None:
+        import ctypes.util
+
+        _resolved_path = ctypes.util.find_library("ssh")
+    return _resolved_path
+
+
+def is_loaded():
+    """Whether or not libssh has been loaded yet. It is loaded on its first use."""
+    return "lib" in Api.__dict__
 
 
 def _init_api():
+    """Load libssh, through the compiled module if it was built at install time.
+
+    A libssh library configured explicitly is always loaded in ABI mode.
+
+    Returns:
+        tuple: the ``ffi`` and ``lib`` objects
+    """
+    if _explicit_path() is None:
+        try:
+            from ._pystassh_ffi import ffi, lib
+        except ImportError:
+            pass
+        else:
+            return ffi, lib
+    return _init_abi_api()
+
 
-    lib_name = ctypes.util.find_library("ssh")
+def _init_abi_api():
+    from cffi import FFI
+
+    lib_name = library_path()
     if not lib_name and not os.environ.get("READTHEDOCS"):
         raise exceptions.PystasshException(
             "libssh not found, please visit https://www.libssh.org/get-it/"
@@ -26,66 +119,95 @@ def _init_api():
 
     ffi = FFI()
     lib = ffi.dlopen(lib_name)
-    ffi.cdef(
-        """
-        void* ssh_new();
-        int ssh_free(void*);
-        int ssh_options_set(void*, int, char*);
-        int ssh_connect(void*);
-        int ssh_disconnect(void*);
-        int ssh_is_connected(void*);
-        char* ssh_get_error(void*);
-
-        int ssh_userauth_password(void*, char*, char*);
-        int ssh_userauth_autopubkey(void*, char*);
-        int ssh_userauth_publickey(void*, const char*, const void*);
-
-        int ssh_pki_import_privkey_file(const char*, const char*, void*, void*, void**);
-        void ssh_key_free(void*);
-
-        void* ssh_channel_new(void*);
-        int ssh_channel_open_session(void*);
-        int ssh_channel_is_open(void*);
-        void ssh_channel_free(void*);
-        int ssh_channel_request_exec(void*, char*);
-        int ssh_channel_request_pty(void*);
-        int ssh_channel_request_shell(void*);
-
-        int ssh_channel_get_exit_status(void*);
-        int ssh_channel_read(void*, char*, int, int);
-        int ssh_channel_send_eof(void*);
-        int ssh_channel_is_eof(void*);
-        int ssh_channel_write(void*, const void*, uint32_t);
-        int ssh_channel_read_nonblocking(void*, void*, uint32_t, int);
-    """
-    )
+    ffi.cdef(CDEF + SFTP_AIO_CDEF)
     return ffi, lib
 
 
 class ApiMetaclass(type):
     def __getattr__(cls, name):
+        # only called for the attributes that are not bound on the class
+        if name.startswith("__"):
+            raise AttributeError("Api has no attribute {}".format(name))
+        if "lib" not in cls.__dict__:
+            cls._load()
+            return getattr(cls, name)
         if hasattr(cls.lib, name):
             return getattr(cls.lib, name)
         raise AttributeError("Api has no attribute {}".format(name))
 
+    def _load(cls):
+        # libssh is only loaded on first use, so that importing pystassh stays cheap
+        with _load_lock:
+            if "lib" not in cls.__dict__:
+                ffi, lib = _init_api()
+                cls.ffi, cls.NULL = ffi, ffi.NULL
+                cls._bind(lib)
+                cls.lib = lib
+
+    def _bind(cls, lib):
+        # the libssh functions become plain class attributes, so that calls skip
+        # __getattr__; they can still be replaced with monkeypatch.setattr()
+        for name in dir(lib):
+            if not name.startswith(("ssh_", "sftp_")) or name in cls.__dict__:
+                continue
+            try:
+                setattr(cls, name, getattr(lib, name))
+            except AttributeError:
+                # not exported by this version of libssh, fail on use only
+                pass
 
-class Api(metaclass=ApiMetaclass):
 
-    ffi, lib = _init_api()
-    NULL = ffi.NULL
+class Api(metaclass=ApiMetaclass):
 
     @classmethod
     def to_string(cls, chars):
         return cls.ffi.string(chars)
 
+    @classmethod
+    def to_bytes(cls, chars, size):
+        return cls.ffi.buffer(chars, size)[:]
+
+    @classmethod
+    def to_buffer(cls, chars, size):
+        return cls.ffi.buffer(chars, size)
+
+    @classmethod
+    def from_buffer(cls, buffer, writable=True):
+        return cls.ffi.from_buffer(buffer, require_writable=writable)
+
     @classmethod
     def new_chars(cls, size):
         return cls.ffi.new("char[{}]".format(size))
 
+    @classmethod
+    def new_channels(cls, channels):
+        return cls.ffi.new("void*[]", list(channels) + [cls.NULL])
+
+    @classmethod
+    def new_timeval(cls, milliseconds):
+        seconds, milliseconds = divmod(milliseconds, 1000)
+        return cls.ffi.new("struct timeval*", [seconds, milliseconds * 1000])
+
     @classmethod
     def new_key_pointer(cls):
         return cls.ffi.new("void**")
 
+    @classmethod
+    def new_value(cls, ctype, value):
+        return cls.ffi.new("{}*".format(ctype), value)
+
+    @classmethod
+    def new_pointer(cls):
+        return cls.ffi.new("void**")
+
+    @classmethod
+    def has_sftp_aio(cls):
+        """Whether or not libssh provides the asynchronous sftp writes, from version 0.11."""
+        lib = cls.lib  # loads libssh if needed, before looking for the bound functions
+        return bool(
+            getattr(lib, "PYSTASSH_SFTP_AIO", "sftp_aio_begin_write" in cls.__dict__)
+        )
+
     @classmethod
     def get_error_message(cls, session):
         try:
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Run many commands in a single shell, to save the round trips of a channel per command.
+
+The commands are written to the standard input of a shell, each one followed by a
+sentinel line on both its standard output and its standard error. The sentinel holds a
+random token, the index of the command and, on the standard output, its return code, so
+that the output can be split back into one Result per command while it arrives.
+
+Each command is run with ``sh -c`` and its standard input closed: commands are isolated
+from each other, like with Session.execute(), and a syntax error in one of them does not
+affect the following ones.
+"""
+
+import shlex
+import uuid
+
+from .result import Result
+
+# index of the sentinel written before the first command, to skip what the shell may print at startup
+_PREAMBLE = -1
+
+
+class BatchParser:
+    def __init__(self, commands, token):
+        """Split the output of a batch of commands into one Result per command.
+
+        Args:
+            commands (list): the commands of the batch
+            token (bytes): the random token of the sentinels
+        """
+        self._commands = list(commands)
+        self._marker = b"\n" + token + b" "
+        self._pending = [bytearray(), bytearray()]
+        self._searched = [0, 0]
+        self._outputs = [[], []]
+        self._count = 0
+
+    @property
+    def done(self):
+        """Whether or not the Results of all the commands were parsed."""
+        return self._count == len(self._commands)
+
+    def feed(self, is_stderr, data):
+        """Parse a chunk of output.
+
+        Args:
+            is_stderr (bool): whether the chunk comes from the standard error or the standard output
+            data: a bytes-like object
+        """
+        pending = self._pending[is_stderr]
+        pending += data
+        while True:
+            # only search the part of the output that is new since the last search
+            start = pending.find(self._marker, self._searched[is_stderr])
+            if start < 0:
+                self._searched[is_stderr] = max(0, len(pending) - len(self._marker))
+                return
+            fields_start = start + len(self._marker)
+            end = pending.find(b"\n", fields_start)
+            if end < 0:
+                self._searched[is_stderr] = start
+                return
+
+            fields = pending[fields_start:end].split()
+            if int(fields[0]) != _PREAMBLE:
+                self._outputs[is_stderr].append((bytes(pending[:start]), fields))
+            del pending[: end + 1]
+            self._searched[is_stderr] = 0
+
+    def results(self):
+        """Yield the Results of the commands whose outputs are complete.
+
+        Yields:
+            Result: the Result objects, in the order of the commands
+        """
+        stdouts, stderrs = self._outputs
+        while stdouts and stderrs:
+            (stdout, fields), (stderr, _) = stdouts.pop(0), stderrs.pop(0)
+            command = self._commands[self._count]
+            self._count += 1
+            yield Result.from_output(command, stdout, stderr, int(fields[1]))
+
+
+def new_token():
+    """A random token, unlikely to appear in the output of the commands."""
+    return "PYSTASSH-{}".format(uuid.uuid4().hex)
+
+
+def sentinels(token, index):
+    """The shell lines writing the sentinels of the command at ``index``."""
+    return "printf '\\n%s %d %d\\n' {token} {index} $?; printf '\\n%s %d\\n' {token} {index} >&2\n".format(
+        token=token, index=index
+    )
+
+
+def script(token, index, command):
+    """The shell lines running the command at ``index`` of a batch and writing its sentinels."""
+    return "sh -c {} < /dev/null; {}".format(
+        shlex.quote(command), sentinels(token, index)
+    )
+
+
+def preamble(token):
+    """The shell lines to write before the first command of a batch."""
+    return sentinels(token, _PREAMBLE)
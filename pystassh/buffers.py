@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import threading
+
+from . import api
+
+DEFAULT_BUFFER_SIZE = 100000
+DEFAULT_POOL_CAPACITY = 4
+
+
+class BufferPool:
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, capacity=DEFAULT_POOL_CAPACITY):
+        """A thread-safe pool of native buffers that can be reused across reads and commands.
+
+        Buffers are allocated on demand and, once released, kept for later use as long as
+        the pool holds less than ``capacity`` buffers. Requests for buffers larger than
+        ``buffer_size`` are served by one-off allocations that are never kept.
+
+        Args:
+            buffer_size (int): size in bytes of the pooled buffers
+            capacity (int): maximum number of idle buffers kept by the pool
+        """
+        if buffer_size <= 0:
+            raise ValueError(
+                "Buffer size must be positive but received '{}'".format(buffer_size)
+            )
+        if capacity < 0:
+            raise ValueError(
+                "Capacity must not be negative but received '{}'".format(capacity)
+            )
+        self._buffer_size = buffer_size
+        self._capacity = capacity
+        self._free = []
+        self._lock = threading.Lock()
+        self._allocations = 0
+        self._reuses = 0
+
+    @property
+    def buffer_size(self):
+        """The size in bytes of the pooled buffers."""
+        return self._buffer_size
+
+    @property
+    def capacity(self):
+        """The maximum number of idle buffers kept by the pool."""
+        return self._capacity
+
+    @property
+    def stats(self):
+        """Usage counters of the pool, as a dict.
+
+        ``allocations`` is the number of native buffers allocated so far, ``reuses`` the number
+        of times a buffer was served from the pool and ``available`` the number of idle buffers.
+        """
+        with self._lock:
+            return {
+                "allocations": self._allocations,
+                "reuses": self._reuses,
+                "available": len(self._free),
+            }
+
+    def acquire(self, size=None):
+        """Get a native buffer of at least ``size`` bytes.
+
+        Args:
+            size (int): minimum size of the buffer, defaults to the pool's buffer size
+
+        Returns:
+            a cffi ``char[]`` buffer, to be given back with release(). Its content is undefined.
+        """
+        size = self._buffer_size if size is None else size
+        with self._lock:
+            if size <= self._buffer_size and self._free:
+                self._reuses += 1
+                return self._free.pop()
+            self._allocations += 1
+        return api.Api.new_chars(max(size, self._buffer_size))
+
+    def release(self, buffer):
+        """Give a buffer back to the pool.
+
+        Args:
+            buffer: a buffer previously returned by acquire()
+        """
+        with self._lock:
+            if len(buffer) == self._buffer_size and len(self._free) < self._capacity:
+                self._free.append(buffer)
+
+    @contextlib.contextmanager
+    def buffer(self, size=None):
+        """Context manager acquiring a buffer and releasing it on exit.
+
+        Args:
+            size (int): minimum size of the buffer, defaults to the pool's buffer size
+        """
+        buffer = self.acquire(size)
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
@@ -1,24 +1,64 @@
 # -*- coding: utf-8 -*-
 
-from . import api, exceptions
+import threading
+import time
+
+from . import api, batch, exceptions
+from .buffers import DEFAULT_BUFFER_SIZE, BufferPool
+from .expect import Expecter
 from .result import Result
+from .stats import CommandStats, new_stats
+from .stream import ResultStream, drain
+
+
+def _deadline(timeout):
+    if timeout is None:
+        return None
+    if timeout < 0:
+        raise ValueError(
+            "Timeout must not be negative but received '{}'".format(timeout)
+        )
+    return time.monotonic() + timeout
 
 
 class Channel:
-    def __init__(self, session):
+    def __init__(self, session, buffer_pool=None, lock=None, instrument=False):
         """A channel is an environment bound to a session in which commands can be run.
 
+        Several channels can be bound to the same session and used from different threads,
+        as long as they share the same ``lock``: it serializes the calls to libssh, which
+        does not support concurrent calls on a session. A channel runs one command at a time.
+
         Args:
             session: the libssh's session instance the channel will be bound to
+            buffer_pool (BufferPool): pool in which read buffers are taken
+            lock (threading.RLock): the lock of the session, if it is shared with other channels
+            instrument: True to collect the CommandStats of the commands, or a callable
+                        receiving them once complete
         """
         self._session = session
+        self._buffer_pool = buffer_pool or BufferPool()
+        self._session_lock = lock
+        self._lock = lock or threading.RLock()
+        self._busy = False
+        self._instrument = instrument
         self._channel = None
         self._stdout = None
         self._stderr = None
         self._shell_requested = False
+        self._expecter = None
 
     def _is_open(self):
-        return bool(self._channel and api.Api.ssh_channel_is_open(self._channel))
+        with self._lock:
+            return bool(self._channel and api.Api.ssh_channel_is_open(self._channel))
+
+    def _claim(self):
+        with self._lock:
+            if self._busy:
+                raise exceptions.ChannelException(
+                    "A command is already running in this channel."
+                )
+            self._busy = True
 
     def open(self):
         """Open a new channel.
@@ -26,32 +66,37 @@ class Channel:
         Raises:
             ChannelException: if the channel could not be correctly initialized
         """
-        if self._is_open():
-            return
+        with self._lock:
+            if self._is_open():
+                return
 
-        channel = api.Api.ssh_channel_new(self._session)
-        if channel is None:
-            raise exceptions.ChannelException(
-                "Channel cannot be created: {}".format(self.get_error_message())
-            )
+            channel = api.Api.ssh_channel_new(self._session)
+            if channel is None:
+                raise exceptions.ChannelException(
+                    "Channel cannot be created: {}".format(self.get_error_message())
+                )
 
-        ret = api.Api.ssh_channel_open_session(channel)
-        if ret != api.SSH_OK:
-            api.Api.ssh_channel_free(channel)
-            raise exceptions.ChannelException(
-                "Channel cannot be opened: {}".format(self.get_error_message())
-            )
+            ret = api.Api.ssh_channel_open_session(channel)
+            if ret != api.SSH_OK:
+                api.Api.ssh_channel_free(channel)
+                raise exceptions.ChannelException(
+                    "Channel cannot be opened: {}".format(self.get_error_message())
+                )
 
-        self._shell_requested = False
-        self._channel = channel
+            self._shell_requested = False
+            self._expecter = None
+            self._channel = channel
 
     def close(self):
         """Close the current channel."""
-        if self._channel is not None:
-            api.Api.ssh_channel_send_eof(self._channel)
-            api.Api.ssh_channel_free(self._channel)
-        self._shell_requested = False
-        self._channel = None
+        with self._lock:
+            if self._channel is not None:
+                api.Api.ssh_channel_send_eof(self._channel)
+                api.Api.ssh_channel_free(self._channel)
+            self._shell_requested = False
+            self._expecter = None
+            self._busy = False
+            self._channel = None
 
     def __enter__(self):
         self.open()
@@ -65,19 +110,22 @@ class Channel:
         if not self._is_open():
             raise exceptions.ChannelException("The channel is not open.")
 
-        if request_pty:
-            ret = api.Api.ssh_channel_request_pty(self._channel)
+        with self._lock:
+            if request_pty:
+                ret = api.Api.ssh_channel_request_pty(self._channel)
+                if ret != api.SSH_OK:
+                    raise exceptions.ChannelException(
+                        "Request a pseudo-TTY failed: {}".format(
+                            self.get_error_message()
+                        )
+                    )
+
+            ret = api.Api.ssh_channel_request_shell(self._channel)
             if ret != api.SSH_OK:
                 raise exceptions.ChannelException(
-                    "Request a pseudo-TTY failed: {}".format(self.get_error_message())
+                    "Request a shell failed: {}".format(self.get_error_message())
                 )
-
-        ret = api.Api.ssh_channel_request_shell(self._channel)
-        if ret != api.SSH_OK:
-            raise exceptions.ChannelException(
-                "Request a shell failed: {}".format(self.get_error_message())
-            )
-        self._shell_requested = True
+            self._shell_requested = True
 
     def read_nonblocking(self, size=2048, from_stderr=False):
         """Do a nonblocking read on the channel.
@@ -87,8 +135,8 @@ class Channel:
             from_stderr (bool): read from standard error instead from stdout.
 
         Returns:
-            string (str): the string read. It may be shorter than the expected size.
-                          An empty string does not imply an EOF: you still have to check it.
+            bytes: the data read. It may be shorter than the expected size.
+                   An empty result does not imply an EOF: you still have to check it.
         """
         if size <= 0:
             raise ValueError("Size must be positive but received '{}'".format(size))
@@ -99,30 +147,97 @@ class Channel:
                 "No shell was requested for this channel."
             )
 
-        buf = api.Api.new_chars(size)
         from_stderr = int(from_stderr)
-        ret = api.Api.ssh_channel_read_nonblocking(
-            self._channel, buf, size, from_stderr
-        )
-        if ret == api.SSH_ERROR:
-            raise exceptions.ChannelException(
-                "Read failed: {}".format(self.get_error_message())
+        with self._buffer_pool.buffer(size) as buf, self._lock:
+            ret = api.Api.ssh_channel_read_nonblocking(
+                self._channel, buf, size, from_stderr
             )
+            if ret == api.SSH_ERROR:
+                raise exceptions.ChannelException(
+                    "Read failed: {}".format(self.get_error_message())
+                )
+            if ret <= 0:
+                return b""
 
-        return api.Api.to_string(buf)
+            return api.Api.to_bytes(buf, ret)
 
-    def read(self, size=2048, from_stderr=False):
+    def read(self, size=2048, from_stderr=False, timeout=None):
         """Reads data from a channel. The read will block.
 
+        The session is locked until some data is received: on a session shared with
+        other threads, prefer read_nonblocking().
+
         Args:
             size (int): bytes to read.
             from_stderr (bool): read from standard error instead from stdout.
+            timeout (float): maximum number of seconds to wait for data, None to wait forever
 
         Returns:
-            string (str): the string read. Returns an empty string on EOF.
+            bytes: the data read. Returns an empty bytes object on EOF.
+
+        Raises:
+            TimeoutException: if no data was received in time. The channel can still be used.
         """
         if size <= 0:
             raise ValueError("Size must be positive but received '{}'".format(size))
+        self._check_shell()
+
+        with self._buffer_pool.buffer(size) as buf:
+            ret = self._read(buf, size, from_stderr, timeout)
+            return api.Api.to_bytes(buf, ret)
+
+    def readinto(self, buffer, from_stderr=False, timeout=None):
+        """Reads data from a channel directly into a writable buffer. The read will block.
+
+        The data is written by libssh in the memory of the given buffer, without any
+        intermediate copy.
+
+        Args:
+            buffer: a writable bytes-like object, such as a bytearray or a memoryview
+            from_stderr (bool): read from standard error instead from stdout.
+            timeout (float): maximum number of seconds to wait for data, None to wait forever
+
+        Returns:
+            int: the number of bytes read. Returns 0 on EOF.
+
+        Raises:
+            TimeoutException: if no data was received in time. The channel can still be used.
+        """
+        self._check_shell()
+
+        size = memoryview(buffer).nbytes
+        if size <= 0:
+            raise ValueError("Buffer must not be empty")
+
+        return self._read(api.Api.from_buffer(buffer), size, from_stderr, timeout)
+
+    def expect(self, patterns, timeout=None, from_stderr=False):
+        """Wait until one of the patterns is found in the output of the shell.
+
+        The output is searched as it arrives. The output read by expect() and not part of
+        a match is kept for the next call to expect(), it is not returned by read().
+
+        Args:
+            patterns: a regular expression or a list of them, as strings, bytes or compiled
+                      bytes patterns
+            timeout (float): maximum number of seconds to wait, None to wait forever
+            from_stderr (bool): search the standard error instead of the standard output
+
+        Returns:
+            ExpectMatch: the pattern found, and the output before it
+
+        Raises:
+            TimeoutException: if no pattern was found in time. The channel can still be used.
+            ChannelException: if the remote side sent EOF before any pattern was found
+        """
+        self._check_shell()
+        if self._expecter is None:
+            self._expecter = Expecter(
+                self._channel, lock=self._session_lock, buffer_pool=self._buffer_pool
+            )
+        return self._expecter.expect(patterns, timeout, from_stderr)
+
+    def _check_shell(self):
         if not self._is_open():
             raise exceptions.ChannelException("The channel is not open.")
         if not self._shell_requested:
@@ -130,15 +245,28 @@ class Channel:
                 "No shell was requested for this channel."
             )
 
-        buf = api.Api.new_chars(size)
-        from_stderr = int(from_stderr)
-        ret = api.Api.ssh_channel_read(self._channel, buf, size, from_stderr)
-        if ret == api.SSH_ERROR or ret < 0:
-            raise exceptions.ChannelException(
-                "Read failed: {}".format(self.get_error_message())
-            )
-
-        return api.Api.to_string(buf)
+    def _read(self, buf, size, from_stderr, timeout):
+        with self._lock:
+            if timeout is None:
+                ret = api.Api.ssh_channel_read(
+                    self._channel, buf, size, int(from_stderr)
+                )
+            else:
+                ret = api.Api.ssh_channel_read_timeout(
+                    self._channel, buf, size, int(from_stderr), int(timeout * 1000)
+                )
+                # libssh returns nothing both on EOF and once the timeout is over
+                if ret in (0, api.SSH_AGAIN) and not api.Api.ssh_channel_is_eof(
+                    self._channel
+                ):
+                    raise exceptions.TimeoutException(
+                        "No data received in {} seconds".format(timeout)
+                    )
+            if ret == api.SSH_ERROR or ret < 0:
+                raise exceptions.ChannelException(
+                    "Read failed: {}".format(self.get_error_message())
+                )
+        return ret
 
     def write(self, data):
         """Blocking write on a channel.
@@ -159,11 +287,12 @@ class Channel:
         data = str.encode(data)
         sz = len(data)
 
-        ret = api.Api.ssh_channel_write(self._channel, data, sz)
-        if ret == api.SSH_ERROR:
-            raise exceptions.ChannelException(
-                "Write failed: {}".format(self.get_error_message())
-            )
+        with self._lock:
+            ret = api.Api.ssh_channel_write(self._channel, data, sz)
+            if ret == api.SSH_ERROR:
+                raise exceptions.ChannelException(
+                    "Write failed: {}".format(self.get_error_message())
+                )
 
         return ret
 
@@ -171,19 +300,72 @@ class Channel:
         """Check if remote has sent an EOF."""
         if not self._is_open():
             raise exceptions.ChannelException("The channel is not open.")
-        ret = api.Api.ssh_channel_is_eof(self._channel)
+        with self._lock:
+            ret = api.Api.ssh_channel_is_eof(self._channel)
         return bool(ret)
 
-    def execute(self, command):
+    def execute(self, command, stdin=None, limits=None, timeout=None):
         """Execute a command.
 
         Args:
             command (str): the command to run
+            stdin: optional data to write to the standard input of the command: a bytes-like
+                   object, a binary file object or an iterable of bytes-like objects. The
+                   outputs are read while it is written, and EOF is sent once it is over.
+            limits (OutputLimits): limits on the size of the outputs kept in the Result, and
+                                   on the size kept in memory
+            timeout (float): number of seconds after which the command is killed, None to
+                             wait for it forever. Opening the channel and requesting the
+                             command are bounded by the timeout of the session instead.
 
         Returns:
             Result: the Result object for this command
+
+        Raises:
+            ChannelException: if a command is already running in this channel
+            OutputLimitException: if an output exceeds its limits and the command is aborted,
+                                  the channel is closed
+            TimeoutException: if the command is not over in time, the channel is closed
         """
-        with self:
+        deadline = _deadline(timeout)
+        stats = new_stats(self._instrument, CommandStats, command)
+        self._claim()
+        try:
+            self._start(command, stats)
+            with self:
+                return Result(
+                    self._channel,
+                    command,
+                    buffer_pool=self._buffer_pool,
+                    lock=self._session_lock,
+                    stats=stats,
+                    stdin=stdin,
+                    limits=limits,
+                    deadline=deadline,
+                )
+        finally:
+            self._busy = False
+
+    def _start(self, command, stats):
+        """Open the channel and request the execution of a command.
+
+        The channel is closed and the stats finished if it fails.
+        """
+        try:
+            self.open()
+            if stats:
+                stats.mark("channel_open_time")
+            self._request_exec(command)
+            if stats:
+                stats.mark("exec_time")
+        except Exception as error:
+            self.close()
+            if stats:
+                stats.finish(error)
+            raise
+
+    def _request_exec(self, command):
+        with self._lock:
             ret = api.Api.ssh_channel_request_exec(self._channel, str.encode(command))
             if ret != api.SSH_OK:
                 raise exceptions.ChannelException(
@@ -191,7 +373,106 @@ class Channel:
                         command, self.get_error_message()
                     )
                 )
-            return Result(self._channel, command)
+
+    def execute_stream(
+        self, command, chunk_size=DEFAULT_BUFFER_SIZE, stdin=None, timeout=None
+    ):
+        """Execute a command and stream its output as it arrives.
+
+        The channel stays open until the returned stream is exhausted or closed, and cannot be
+        used to run other commands in the meantime.
+
+        Args:
+            command (str): the command to run
+            chunk_size (int): maximum size of the chunks yielded by the stream
+            stdin: optional data to write to the standard input of the command, see execute()
+            timeout (float): number of seconds after which the command is killed and the
+                             stream closed, None to wait for it forever
+
+        Returns:
+            ResultStream: an iterator over the output of the command
+
+        Raises:
+            ChannelException: if a command is already running in this channel
+        """
+        deadline = _deadline(timeout)
+        stats = new_stats(self._instrument, CommandStats, command)
+        self._claim()
+        try:
+            self._start(command, stats)
+        except Exception:
+            self._busy = False
+            raise
+        return ResultStream(
+            self,
+            command,
+            chunk_size=chunk_size,
+            buffer_pool=self._buffer_pool,
+            stats=stats,
+            stdin=stdin,
+            deadline=deadline,
+        )
+
+    def execute_batch(self, commands):
+        """Execute several commands in a single shell.
+
+        Only one channel is opened for the whole batch, which saves several round trips per
+        command compared to execute(). See the batch module for the details. The Results
+        have no stats, even if the channel is instrumented.
+
+        Args:
+            commands (list): the commands to run
+
+        Returns:
+            list: the Result objects of the commands, in the same order
+        """
+        return list(self.iter_execute_batch(commands))
+
+    def iter_execute_batch(self, commands):
+        """Execute several commands in a single shell, and yield their Results as they complete.
+
+        Args:
+            commands (list): the commands to run
+
+        Yields:
+            Result: the Result objects of the commands, in the same order
+
+        Raises:
+            ChannelException: if the shell exits before all the commands are run
+        """
+        commands = list(commands)
+        token = batch.new_token()
+        parser = batch.BatchParser(commands, str.encode(token))
+        self._claim()
+        try:
+            self.open()
+            self.request_shell()
+            with self._buffer_pool.buffer() as buffer:
+                lines = [
+                    batch.script(token, index, command)
+                    for index, command in enumerate(commands)
+                ]
+                # read what is available after each command, so that neither side
+                # blocks on a full window
+                for data in [batch.preamble(token)] + lines + ["exit\n"]:
+                    self.write(data)
+                    for is_stderr, count in drain(
+                        self._channel, buffer, lock=self._session_lock, wait=False
+                    ):
+                        parser.feed(is_stderr, api.Api.to_buffer(buffer, count))
+                    yield from parser.results()
+
+                for is_stderr, count in drain(
+                    self._channel, buffer, lock=self._session_lock
+                ):
+                    parser.feed(is_stderr, api.Api.to_buffer(buffer, count))
+                    yield from parser.results()
+            if not parser.done:
+                raise exceptions.ChannelException(
+                    "The shell exited before the end of the batch."
+                )
+        finally:
+            self.close()
 
     def get_error_message(self):
         """Tries to retrieve an error message in case of error.
@@ -200,6 +481,7 @@ class Channel:
             str: An error message
         """
         try:
-            return api.Api.get_error_message(self._session)
+            with self._lock:
+                return api.Api.get_error_message(self._session)
         except exceptions.UnknownException:
             return "<error message irrecoverable>"
@@ -29,3 +29,31 @@ class UnknownException(PystasshException):
     """Sometimes we just don't know what happened..."""
 
     pass
+
+
+class PoolException(PystasshException):
+    """Raised when a session cannot be obtained from or given back to a pool."""
+
+    pass
+
+
+class SftpException(PystasshException):
+    """Raised when an error occurred during a file transfer."""
+
+    pass
+
+
+class OutputLimitException(ChannelException):
+    """Raised when the output of a command exceeds its limits and the command is aborted."""
+
+    pass
+
+
+class TimeoutException(ChannelException):
+    """Raised when a command is not over before its timeout. The output received so far is
+    given by the ``stdout`` and ``stderr`` attributes."""
+
+    def __init__(self, message, stdout=b"", stderr=b""):
+        super().__init__(message)
+        self.stdout = stdout
+        self.stderr = stderr
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""Wait for patterns in the output of an interactive shell, such as the prompt of a CLI.
+
+The output is read as it arrives, waiting on the channel when nothing is available rather
+than polling it in a loop. It is kept in a bounded buffer, and each new chunk is searched
+together with the last ``search_window`` bytes before it only: a match must not be longer
+than ``search_window`` bytes, but the cost of a search does not grow with the output.
+
+Examples:
+
+    >>> with Session('switch.example.com', 'admin', 'secret') as ssh_session:
+    ...     channel = ssh_session.channel
+    ...     channel.request_shell(request_pty=True)
+    ...     channel.expect(r'[>#] ?$', timeout=10)
+    ...     channel.write('show version\\n')
+    ...     print(channel.expect([r'[>#] ?$', r'--More--'], timeout=10).before)
+
+"""
+
+import re
+import threading
+import time
+
+from . import api, exceptions
+from .buffers import BufferPool
+from .stream import _read_error, _wait
+
+DEFAULT_MAX_SIZE = 1024 * 1024
+DEFAULT_SEARCH_WINDOW = 8192
+
+
+class ExpectMatch:
+    def __init__(self, index, match, before):
+        """The pattern found by expect().
+
+        Args:
+            index (int): index of the pattern that matched, in the list of patterns
+            match: the ``re.Match`` object, over bytes
+            before (bytes): the output received before the match, since the previous one
+        """
+        self.index = index
+        self.match = match
+        self.before = before
+
+    def __repr__(self):
+        return "<ExpectMatch index={} match={!r}>".format(
+            self.index, self.match.group()
+        )
+
+
+# re.Pattern only exists from Python 3.7
+_Pattern = type(re.compile(b""))
+
+
+def _compile(patterns):
+    if isinstance(patterns, (str, bytes, _Pattern)):
+        patterns = [patterns]
+    compiled = []
+    for pattern in patterns:
+        if isinstance(pattern, str):
+            pattern = pattern.encode("utf8")
+        pattern = re.compile(pattern)
+        if not isinstance(pattern.pattern, bytes):
+            raise TypeError(
+                "Patterns must match bytes but received '{}'".format(pattern.pattern)
+            )
+        compiled.append(pattern)
+    if not compiled:
+        raise ValueError("At least one pattern is expected")
+    return compiled
+
+
+def _expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class Expecter:
+    def __init__(
+        self,
+        channel,
+        lock=None,
+        buffer_pool=None,
+        max_size=DEFAULT_MAX_SIZE,
+        search_window=DEFAULT_SEARCH_WINDOW,
+    ):
+        """Search patterns in the outputs of a channel as they arrive.
+
+        The output following a match is kept for the next search. Beyond ``max_size``
+        bytes, the oldest output is dropped.
+
+        Args:
+            channel: the libssh's channel instance to read from
+            lock: the lock of the session, if it is shared with other threads
+            buffer_pool (BufferPool): pool in which read buffers are taken
+            max_size (int): maximum number of bytes kept per output
+            search_window (int): maximum length of a match, in bytes
+        """
+        if search_window <= 0 or max_size < search_window:
+            raise ValueError(
+                "Max size and search window must be positive, and the max size at least "
+                "the search window, but received '{}' and '{}'".format(
+                    max_size, search_window
+                )
+            )
+        self._channel = channel
+        self._lock = lock
+        self._buffer_pool = buffer_pool or BufferPool(capacity=0)
+        self._max_size = max_size
+        self._search_window = search_window
+        self._outputs = [bytearray(), bytearray()]
+        # number of bytes of each output already searched without match
+        self._searched = [0, 0]
+
+    def expect(self, patterns, timeout=None, from_stderr=False):
+        """Wait until one of the patterns is found in an output.
+
+        When several patterns match, the one starting first wins, then the first one in
+        the list.
+
+        Args:
+            patterns: a regular expression or a list of them, as strings, bytes or compiled
+                      bytes patterns
+            timeout (float): maximum number of seconds to wait, None to wait forever
+            from_stderr (bool): search the standard error instead of the standard output
+
+        Returns:
+            ExpectMatch: the pattern found, and the output before it
+
+        Raises:
+            TimeoutException: if no pattern was found in time, the outputs received so far
+                              are given in its ``stdout`` and ``stderr`` attributes
+            ChannelException: if the remote side sent EOF before any pattern was found
+        """
+        patterns = _compile(patterns)
+        deadline = None
+        if timeout is not None:
+            if timeout < 0:
+                raise ValueError(
+                    "Timeout must not be negative but received '{}'".format(timeout)
+                )
+            deadline = time.monotonic() + timeout
+        filled = False
+        while True:
+            found = self._search(patterns, from_stderr)
+            if found is not None:
+                return found
+            # a remote side sending output without end must not delay the timeout
+            if filled and _expired(deadline):
+                raise self._timeout()
+            if not self._fill(from_stderr, deadline):
+                raise exceptions.ChannelException(
+                    "EOF reached before any pattern was found"
+                )
+            filled = True
+
+    def _search(self, patterns, from_stderr):
+        output = self._outputs[from_stderr]
+        start = max(0, self._searched[from_stderr] - self._search_window)
+        found = None
+        for index, pattern in enumerate(patterns):
+            match = pattern.search(output, start)
+            if match is not None and (found is None or match.start() < found.start()):
+                found, found_index = match, index
+        if found is None:
+            self._searched[from_stderr] = len(output)
+            return None
+
+        # the output is not modified anymore, the match keeps referring to it
+        end = found.end()
+        self._outputs[from_stderr] = output[end:]
+        self._searched[from_stderr] = 0
+        return ExpectMatch(found_index, found, bytes(output[: found.start()]))
+
+    def _fill(self, from_stderr, deadline):
+        """Wait for more output, until the deadline.
+
+        Both outputs are read on each pass, as drain() does: they share the window of the
+        channel, and a remote side writing a lot on the other one would stop sending the
+        one searched.
+
+        Returns:
+            bool: False on EOF of the searched output
+        """
+        session_lock = self._lock or threading.Lock()
+        with self._buffer_pool.buffer() as buffer:
+            while True:
+                has_read = found = eof = False
+                for is_stderr in (False, True):
+                    with session_lock:
+                        available = api.Api.ssh_channel_poll(
+                            self._channel, int(is_stderr)
+                        )
+                        if available == api.SSH_EOF:
+                            eof = eof or is_stderr == from_stderr
+                            continue
+                        if available < 0:
+                            raise _read_error(self._channel)
+                        if available == 0:
+                            continue
+
+                        count = api.Api.ssh_channel_read(
+                            self._channel,
+                            buffer,
+                            min(available, len(buffer)),
+                            int(is_stderr),
+                        )
+                        if count < 0:
+                            raise _read_error(self._channel)
+                    if count > 0:
+                        has_read = True
+                        found = found or is_stderr == from_stderr
+                        self._append(is_stderr, api.Api.to_buffer(buffer, count))
+                if found:
+                    return True
+                if eof:
+                    return False
+
+                if _expired(deadline):
+                    raise self._timeout()
+                if not has_read:
+                    _wait(self._channel, self._lock, deadline)
+
+    def _timeout(self):
+        return exceptions.TimeoutException(
+            "No pattern was found in time",
+            stdout=bytes(self._outputs[False]),
+            stderr=bytes(self._outputs[True]),
+        )
+
+    def _append(self, from_stderr, data):
+        output = self._outputs[from_stderr]
+        output += data
+        excess = len(output) - self._max_size
+        if excess > 0:
+            # deleting the beginning of a bytearray does not move the rest of it
+            del output[:excess]
+            self._searched[from_stderr] = max(0, self._searched[from_stderr] - excess)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""A Fleet runs the same command on many servers in parallel.
+
+Connections and commands run in a bounded pool of threads: libssh is called without
+holding the GIL, so the hosts are served concurrently.
+
+Examples:
+
+    Run a command on several servers and print the results as they arrive.
+
+    >>> fleet = Fleet(['web1', 'web2', 'db1'], username='foo', max_workers=16)
+    >>> for host_result in fleet.iter_execute('uptime'):
+    ...     if host_result.ok:
+    ...         print(host_result.hostname, host_result.result.stdout)
+    ...     else:
+    ...         print(host_result.hostname, 'failed:', host_result.error)
+
+"""
+
+import collections
+import concurrent.futures
+import inspect
+import time
+
+from .session import Session
+
+
+class HostResult:
+    def __init__(
+        self, hostname, result=None, error=None, connect_time=0.0, execute_time=0.0
+    ):
+        """The outcome of a command on one of the hosts of a fleet.
+
+        Args:
+            hostname (str): the host the command was run on
+            result (Result): the Result object of the command, if it could be run
+            error (Exception): the exception raised while connecting or running the command
+            connect_time (float): time spent connecting and authenticating, in seconds
+            execute_time (float): time spent running the command and reading its output, in seconds
+        """
+        self.hostname = hostname
+        self.result = result
+        self.error = error
+        self.connect_time = connect_time
+        self.execute_time = execute_time
+
+    @property
+    def ok(self):
+        """Whether or not the command could be run. Its return code is not taken into account."""
+        return self.error is None
+
+    def __repr__(self):
+        return "<HostResult {} {}>".format(
+            self.hostname, "ok" if self.ok else repr(self.error)
+        )
+
+
+class Fleet:
+    def __init__(self, hosts, max_workers=32, pool=None, **session_kwargs):
+        """A Fleet is a set of servers on which commands are run in parallel.
+
+        Args:
+            hosts (list): the hostnames of the servers
+            max_workers (int): maximum number of hosts handled at the same time
+            pool (SessionPool): optional pool in which the sessions are taken, so that they
+                                are reused by the next commands
+            session_kwargs: the arguments given to each Session, such as ``username`` or ``port``,
+                            or to SessionPool.acquire() if a pool is given
+
+        Raises:
+            ValueError: if a host is listed several times
+            TypeError: if a hostname is given in ``session_kwargs``, or if a pool is given
+                       with arguments SessionPool.acquire() does not accept
+        """
+        if max_workers <= 0:
+            raise ValueError(
+                "Max workers must be positive but received '{}'".format(max_workers)
+            )
+        hosts = list(hosts)
+        duplicates = sorted(
+            hostname
+            for hostname, count in collections.Counter(hosts).items()
+            if count > 1
+        )
+        if duplicates:
+            raise ValueError(
+                "Hosts must be unique but received several times: {}".format(
+                    ", ".join(duplicates)
+                )
+            )
+        if "hostname" in session_kwargs:
+            raise TypeError("The hostnames are given by the hosts of the fleet")
+        if pool is not None:
+            unsupported = set(session_kwargs) - set(
+                inspect.signature(pool.acquire).parameters
+            )
+            if unsupported:
+                raise TypeError(
+                    "Arguments not supported with a pool: {}".format(
+                        ", ".join(sorted(unsupported))
+                    )
+                )
+        self._hosts = hosts
+        self._max_workers = max_workers
+        self._pool = pool
+        self._session_kwargs = session_kwargs
+
+    @property
+    def hosts(self):
+        """The hostnames of the servers of the fleet."""
+        return list(self._hosts)
+
+    def _connect(self, hostname):
+        if self._pool is not None:
+            return self._pool.acquire(hostname, **self._session_kwargs)
+        session = Session(hostname, **self._session_kwargs)
+        session.connect()
+        return session
+
+    def _release(self, session, error):
+        if self._pool is not None:
+            self._pool.release(session, discard=error is not None)
+        else:
+            session.disconnect()
+
+    def _run(self, hostname, command):
+        host_result = HostResult(hostname)
+        start = time.perf_counter()
+        try:
+            session = self._connect(hostname)
+        except Exception as error:
+            host_result.error = error
+            host_result.connect_time = time.perf_counter() - start
+            return host_result
+        host_result.connect_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            host_result.result = session.execute(command)
+        except Exception as error:
+            host_result.error = error
+        finally:
+            host_result.execute_time = time.perf_counter() - start
+            self._release(session, host_result.error)
+        return host_result
+
+    def iter_execute(self, command):
+        """Run a command on all the hosts, and yield the outcomes as soon as they are available.
+
+        Hosts that are not started yet are skipped if the iteration is stopped early.
+
+        Args:
+            command (str): the command to run
+
+        Yields:
+            HostResult: the outcome of the command on each host, in order of completion
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        futures = [
+            executor.submit(self._run, hostname, command) for hostname in self._hosts
+        ]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def execute(self, command):
+        """Run a command on all the hosts and wait for all of them.
+
+        Args:
+            command (str): the command to run
+
+        Returns:
+            dict: a mapping of each hostname to the Result of the command, or to the exception
+                  raised while connecting or running it
+        """
+        outcomes = {}
+        for host_result in self.iter_execute(command):
+            outcomes[host_result.hostname] = (
+                host_result.result if host_result.ok else host_result.error
+            )
+        return outcomes
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""A process-level cache of the private keys used to authenticate.
+
+Importing a private key reads the file and, when it is encrypted, derives the decryption
+key from the passphrase. For OpenSSH keys protected with bcrypt, this derivation takes
+hundreds of milliseconds of CPU on purpose, and it used to be paid on each connection.
+The keys are now imported once per file and passphrase, and the native key is shared by
+the sessions authenticating with it. A key is imported again when its file is modified.
+
+Examples:
+
+    >>> cache = KeyCache(capacity=4)
+    >>> for hostname in ('web1', 'web2', 'web3'):
+    ...     with Session(hostname, 'foo', privkey_file='id_ed25519', passphrase='bar',
+    ...                  key_cache=cache) as ssh_session:
+    ...         print(ssh_session.execute('uptime').stdout)
+    >>> cache.stats['hits']
+    2
+
+"""
+
+import atexit
+import collections
+import hashlib
+import os
+import threading
+
+from . import api, exceptions
+
+DEFAULT_CAPACITY = 32
+
+
+def import_key(path, passphrase, session=None):
+    """Import a private key from a file.
+
+    Args:
+        path (bytes): path of the private key file
+        passphrase (bytes): passphrase the key is encrypted with, empty if it is not
+        session: the libssh's session instance the key is imported for, whose last error
+                 is reported if the import fails
+
+    Returns:
+        the libssh's key instance, to be freed with ``ssh_key_free``
+
+    Raises:
+        AuthenticationException: if the key cannot be imported
+    """
+    null = api.Api.NULL
+    pkey = api.Api.new_key_pointer()
+    ret = api.Api.ssh_pki_import_privkey_file(path, passphrase, null, null, pkey)
+    if ret != api.SSH_OK:
+        message = "Private key '{}' could not be used (return code: {})".format(
+            os.fsdecode(path), ret
+        )
+        if session is not None:
+            try:
+                message += ": {}".format(api.Api.get_error_message(session))
+            except exceptions.UnknownException:
+                message += ": <error message irrecoverable>"
+        raise exceptions.AuthenticationException(message)
+    return pkey[0]  # dereference the pointer to get the key
+
+
+def _modification_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        # the import will fail and report the error
+        return None
+
+
+class _Entry:
+    def __init__(self, key, mtime):
+        self.key = key
+        self.mtime = mtime
+        self.users = 0
+        self.evicted = False
+
+
+class _Import:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # number of callers importing the key or waiting for its import
+        self.waiters = 0
+
+
+class KeyCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """A thread-safe cache of imported private keys, identified by their path and
+        passphrase.
+
+        A key is lent by acquire() and given back with release(). Keys are freed when they
+        are evicted, because their file was modified or because the cache holds more than
+        ``capacity`` keys, as soon as no session uses them anymore. Callers asking for a key
+        being imported wait for this import instead of importing the key again.
+
+        Args:
+            capacity (int): maximum number of keys kept by the cache
+        """
+        if capacity <= 0:
+            raise ValueError(
+                "Capacity must be positive but received '{}'".format(capacity)
+            )
+        self._capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._in_use = {}
+        self._imports = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def capacity(self):
+        """The maximum number of keys kept by the cache."""
+        return self._capacity
+
+    @property
+    def stats(self):
+        """Usage counters of the cache, as a dict.
+
+        ``hits`` is the number of keys served from the cache, ``misses`` the number of keys
+        imported, ``evictions`` the number of keys removed from the cache and ``size`` the
+        number of keys currently cached.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._entries),
+            }
+
+    def acquire(self, path, passphrase, session=None):
+        """Get the key stored in a file, importing it if it is not cached or if the file was
+        modified since it was imported.
+
+        Args:
+            path (bytes): path of the private key file
+            passphrase (bytes): passphrase the key is encrypted with, empty if it is not
+            session: the libssh's session instance the key is imported for, see import_key()
+
+        Returns:
+            the libssh's key instance, to be given back with release() and never freed by
+            the caller
+
+        Raises:
+            AuthenticationException: if the key cannot be imported
+        """
+        # the passphrase is not kept in memory, only its digest
+        name = (path, hashlib.sha256(passphrase).hexdigest())
+        with self._lock:
+            pending = self._imports.get(name)
+            if pending is None:
+                pending = self._imports[name] = _Import()
+            pending.waiters += 1
+
+        try:
+            with pending.lock:
+                return self._acquire(name, path, passphrase, session)
+        finally:
+            with self._lock:
+                pending.waiters -= 1
+                if not pending.waiters:
+                    del self._imports[name]
+
+    def _acquire(self, name, path, passphrase, session):
+        mtime = _modification_time(path)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.mtime == mtime:
+                self._entries.move_to_end(name)
+                self._hits += 1
+                return self._lend(entry)
+            if entry is not None:
+                self._evict(name)
+            self._misses += 1
+
+        # the import is slow, other keys can be served meanwhile
+        key = import_key(path, passphrase, session)
+        with self._lock:
+            entry = self._entries[name] = _Entry(key, mtime)
+            while len(self._entries) > self._capacity:
+                self._evict(next(iter(self._entries)))
+            return self._lend(entry)
+
+    def release(self, key):
+        """Give back a key obtained with acquire().
+
+        Args:
+            key: the libssh's key instance
+        """
+        with self._lock:
+            entry = self._in_use.get(key)
+            if entry is None:
+                raise ValueError("This key does not come from this cache")
+            entry.users -= 1
+            if not entry.users:
+                del self._in_use[key]
+                if entry.evicted:
+                    api.Api.ssh_key_free(entry.key)
+
+    def clear(self):
+        """Remove all the keys from the cache. The keys in use are freed once released."""
+        with self._lock:
+            for name in list(self._entries):
+                self._evict(name)
+
+    def _lend(self, entry):
+        entry.users += 1
+        self._in_use[entry.key] = entry
+        return entry.key
+
+    def _evict(self, name):
+        entry = self._entries.pop(name)
+        entry.evicted = True
+        self._evictions += 1
+        if not entry.users:
+            api.Api.ssh_key_free(entry.key)
+
+
+# the cache shared by the sessions of the process, unless they are given their own
+default_cache = KeyCache()
+atexit.register(default_cache.clear)
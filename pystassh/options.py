@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""Options of the SSH transport, to trade CPU, bandwidth and latency.
+
+The defaults of libssh suit most uses. Bulk transfers on a fast network are usually bound
+by the cipher, so a cipher with hardware support such as AES-GCM, or ChaCha20 on CPUs
+without AES instructions, is faster. Compression helps on slow links only, it costs more
+than it saves on a LAN. Disabling Nagle's algorithm lowers the latency of interactive uses
+that send small writes.
+
+Examples:
+
+    >>> options = Options(ciphers=FAST_CIPHERS, compression=False, nodelay=True)
+    >>> with Session('localhost', 'foo', 'bar', options=options) as ssh_session:
+    ...     ssh_session.download('/var/backups/db.tar', 'db.tar')
+
+"""
+
+from . import api, exceptions
+
+# ciphers with authenticated encryption, and no separate MAC to compute
+FAST_CIPHERS = ("aes128-gcm@openssh.com", "chacha20-poly1305@openssh.com")
+
+
+def _algorithms(name, value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    value = tuple(value)
+    if not value or not all(isinstance(item, str) and item for item in value):
+        raise ValueError(
+            "{} must be a non-empty list of names but received '{}'".format(name, value)
+        )
+    return value
+
+
+def _number(name, value, minimum, maximum=None):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError("{} must be a number but received '{}'".format(name, value))
+    if value < minimum:
+        raise ValueError(
+            "{} must be at least {} but received '{}'".format(name, minimum, value)
+        )
+    if maximum is not None and value > maximum:
+        raise ValueError(
+            "{} must be at most {} but received '{}'".format(name, maximum, value)
+        )
+    return value
+
+
+def _flag(name, value):
+    if value is not None and not isinstance(value, bool):
+        raise TypeError("{} must be a boolean but received '{}'".format(name, value))
+    return value
+
+
+def _names_to_c(value):
+    return str.encode(",".join(value))
+
+
+def _flag_to_c(value):
+    return b"yes" if value else b"no"
+
+
+def _int_to_c(value):
+    return api.Api.new_value("int", int(value))
+
+
+def _seconds_to_c(value):
+    return api.Api.new_value("long", int(value))
+
+
+def _microseconds_to_c(value):
+    return api.Api.new_value("long", int(value % 1 * 1000000))
+
+
+def _bytes_to_c(value):
+    return api.Api.new_value("uint64_t", int(value))
+
+
+def _milliseconds_to_c(value):
+    return api.Api.new_value("uint32_t", int(value * 1000))
+
+
+# how each option is set: its name, the libssh option and the conversion of its value
+_SETTINGS = [
+    ("ciphers", api.SSH_OPTIONS_CIPHERS_C_S, _names_to_c),
+    ("ciphers", api.SSH_OPTIONS_CIPHERS_S_C, _names_to_c),
+    ("macs", api.SSH_OPTIONS_HMAC_C_S, _names_to_c),
+    ("macs", api.SSH_OPTIONS_HMAC_S_C, _names_to_c),
+    ("key_exchange", api.SSH_OPTIONS_KEY_EXCHANGE, _names_to_c),
+    ("host_key_types", api.SSH_OPTIONS_HOSTKEYS, _names_to_c),
+    ("compression", api.SSH_OPTIONS_COMPRESSION, _flag_to_c),
+    ("compression_level", api.SSH_OPTIONS_COMPRESSION_LEVEL, _int_to_c),
+    ("nodelay", api.SSH_OPTIONS_NODELAY, _int_to_c),
+    ("timeout", api.SSH_OPTIONS_TIMEOUT, _seconds_to_c),
+    ("timeout", api.SSH_OPTIONS_TIMEOUT_USEC, _microseconds_to_c),
+    ("rekey_data", api.SSH_OPTIONS_REKEY_DATA, _bytes_to_c),
+    ("rekey_time", api.SSH_OPTIONS_REKEY_TIME, _milliseconds_to_c),
+]
+
+
+class Options:
+    def __init__(
+        self,
+        ciphers=None,
+        macs=None,
+        key_exchange=None,
+        host_key_types=None,
+        compression=None,
+        compression_level=None,
+        nodelay=None,
+        timeout=None,
+        rekey_data=None,
+        rekey_time=None,
+    ):
+        """Options given to libssh before connecting. Options left to None keep the
+        default of libssh.
+
+        Lists of algorithms are given in order of preference, as lists or comma-separated
+        strings. The names are checked by libssh when the session is connected.
+
+        Args:
+            ciphers (list): ciphers to negotiate, in both directions
+            macs (list): MAC algorithms to negotiate, in both directions. They are not used
+                         by the ciphers with authenticated encryption.
+            key_exchange (list): key exchange algorithms to negotiate
+            host_key_types (list): host key algorithms accepted from the server
+            compression (bool): whether or not to compress the data, in both directions
+            compression_level (int): compression level, from 1 (fast) to 9 (small)
+            nodelay (bool): disable Nagle's algorithm on the socket
+            timeout (float): timeout of the connection, in seconds
+            rekey_data (int): number of bytes after which the session keys are renegotiated
+            rekey_time (float): number of seconds after which the session keys are renegotiated
+        """
+        self.ciphers = _algorithms("ciphers", ciphers)
+        self.macs = _algorithms("macs", macs)
+        self.key_exchange = _algorithms("key_exchange", key_exchange)
+        self.host_key_types = _algorithms("host_key_types", host_key_types)
+        self.compression = _flag("compression", compression)
+        self.compression_level = _number("compression_level", compression_level, 1, 9)
+        self.nodelay = _flag("nodelay", nodelay)
+        self.timeout = _number("timeout", timeout, 0)
+        self.rekey_data = _number("rekey_data", rekey_data, 0)
+        self.rekey_time = _number("rekey_time", rekey_time, 0)
+
+    def _values(self):
+        return {
+            name: value
+            for name, value in sorted(vars(self).items())
+            if value is not None
+        }
+
+    def apply(self, session):
+        """Set the options on a libssh's session, before it is connected.
+
+        Args:
+            session: the libssh's session instance
+
+        Raises:
+            ConnectionException: if libssh refused one of the options
+        """
+        values = self._values()
+        for name, option, to_c in _SETTINGS:
+            if name not in values:
+                continue
+            ret = api.Api.ssh_options_set(session, option, to_c(values[name]))
+            if ret != api.SSH_OK:
+                try:
+                    message = api.Api.get_error_message(session)
+                except exceptions.UnknownException:
+                    message = "<error message irrecoverable>"
+                raise exceptions.ConnectionException(
+                    "Option '{}' cannot be set to '{}' (return code: {}): {}".format(
+                        name, values[name], ret, message
+                    )
+                )
+
+    def __eq__(self, other):
+        return isinstance(other, Options) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(tuple(self._values().items()))
+
+    def __repr__(self):
+        return "<Options {}>".format(
+            " ".join(
+                "{}={!r}".format(name, value) for name, value in self._values().items()
+            )
+        )
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""Limits on the output kept by a Result, so that a runaway command cannot exhaust memory.
+
+An output can be capped to ``max_bytes``: the rest is read and discarded, or the command is
+aborted. Above ``spill_threshold`` bytes, an output is written to an anonymous temporary
+file instead of being kept in memory, and it is memory-mapped when it is accessed.
+
+Examples:
+
+    >>> limits = OutputLimits(max_bytes=1024 ** 3, spill_threshold=64 * 1024 ** 2)
+    >>> with Session('localhost', 'foo', 'bar') as ssh_session:
+    ...     result = ssh_session.execute('cat /var/log/syslog', limits=limits)
+    ...     errors = sum(1 for line in result.iter_lines() if 'error' in line)
+
+"""
+
+import mmap
+import tempfile
+
+from . import exceptions
+
+TRUNCATE = "truncate"
+ABORT = "abort"
+
+
+class OutputLimits:
+    def __init__(
+        self, max_bytes=None, overflow=TRUNCATE, spill_threshold=None, spill_dir=None
+    ):
+        """Limits applied to each output of a command, its standard output and its standard
+        error being limited separately.
+
+        Args:
+            max_bytes (int): maximum number of bytes kept, None for no limit
+            overflow (str): what to do with an output longer than ``max_bytes``: TRUNCATE to
+                            keep its beginning, or ABORT to stop the command
+            spill_threshold (int): number of bytes above which an output is written to a
+                                   temporary file, None to always keep outputs in memory
+            spill_dir (str): directory of the temporary files, defaults to the one of the
+                             tempfile module
+        """
+        for name, value in (
+            ("max_bytes", max_bytes),
+            ("spill_threshold", spill_threshold),
+        ):
+            if value is not None and value < 0:
+                raise ValueError(
+                    "{} must not be negative but received '{}'".format(name, value)
+                )
+        if overflow not in (TRUNCATE, ABORT):
+            raise ValueError(
+                "overflow must be '{}' or '{}' but received '{}'".format(
+                    TRUNCATE, ABORT, overflow
+                )
+            )
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+
+
+class OutputCollector:
+    def __init__(self, limits=None, name="output"):
+        """Accumulate an output of a command, within limits.
+
+        Args:
+            limits (OutputLimits): the limits of the output, none by default
+            name (str): name of the output, for the error messages
+        """
+        self._limits = limits or OutputLimits()
+        self._name = name
+        # a bytearray grows in amortized constant time, whereas concatenating
+        # bytes objects would copy the whole content on each read
+        self._data = bytearray()
+        self._file = None
+        self.size = 0
+        self.truncated = False
+
+    def write(self, data):
+        """Add a chunk to the output.
+
+        Args:
+            data: a bytes-like object, which is copied
+
+        Raises:
+            OutputLimitException: if the output is too long and the command must be aborted
+        """
+        limits = self._limits
+        if limits.max_bytes is not None and self.size + len(data) > limits.max_bytes:
+            if limits.overflow == ABORT:
+                raise exceptions.OutputLimitException(
+                    "The {} of the command exceeds {} bytes".format(
+                        self._name, limits.max_bytes
+                    )
+                )
+            self.truncated = True
+            data = memoryview(data)[: limits.max_bytes - self.size]
+            if not data:
+                return
+
+        if (
+            self._file is None
+            and limits.spill_threshold is not None
+            and len(self._data) + len(data) > limits.spill_threshold
+        ):
+            self._file = tempfile.TemporaryFile(dir=limits.spill_dir)
+            self._file.write(self._data)
+            self._data = bytearray()
+
+        if self._file is None:
+            self._data += data
+        else:
+            self._file.write(data)
+        self.size += len(data)
+
+    def getvalue(self):
+        """Get the output, as bytes or as a temporary file to give to map_output()."""
+        if self._file is None:
+            return bytes(self._data)
+        self._file.flush()
+        return self._file
+
+
+def map_output(output):
+    """Memory-map an output written to a temporary file. Other outputs are left as they are.
+
+    Args:
+        output: an output as given by OutputCollector.getvalue()
+
+    Returns:
+        the output, as bytes or as a read-only mmap
+    """
+    if isinstance(output, (bytes, mmap.mmap)):
+        return output
+    with output:
+        # the mapping stays valid once the file is closed
+        return mmap.mmap(output.fileno(), 0, access=mmap.ACCESS_READ)
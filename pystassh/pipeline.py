@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Run several commands over one connection with their requests pipelined.
+
+A command run with Session.execute() costs several round trips before its output starts
+to arrive: the channel is opened, then the command is requested, each time waiting for
+the reply of the server. Here, the session is put in nonblocking mode and the requests
+of all the commands are sent before waiting for any reply, so that running N commands
+costs about as many round trips as running one, plus the duration of the slowest one.
+
+Examples:
+
+    >>> with Session('localhost', 'foo', 'bar') as ssh_session:
+    ...     for index, result in ssh_session.iter_execute_pipelined(['uptime', 'df -h']):
+    ...         print(index, result.stdout)
+
+"""
+
+import select
+
+from . import api
+from .tasks import CommandTask, TaskRunner
+
+# default limit of channels per connection of OpenSSH servers, see MaxSessions in sshd_config
+DEFAULT_MAX_CHANNELS = 10
+
+
+def _wait(runner):
+    """Wait for the sockets of the tasks to be ready, until the runner must be polled."""
+    readers, writers = [], []
+    for fd, wants_write in runner.waiting_sockets():
+        readers.append(fd)
+        if wants_write:
+            writers.append(fd)
+    select.select(readers, writers, [], runner.poll_timeout())
+
+
+def iter_pipelined(
+    handle, commands, lock, buffer_pool=None, max_channels=None, instrument=False
+):
+    """Run commands in concurrent channels, sending all their requests before waiting.
+
+    The libssh's session is only in nonblocking mode while ``lock`` is held, so that it
+    can still be used by other threads in the meantime. Its mode is restored afterwards.
+
+    Args:
+        handle: the libssh's session instance, connected
+        commands (list): the commands to run
+        lock: the lock serializing the calls to the libssh's session
+        buffer_pool (BufferPool): pool in which the read buffers are taken
+        max_channels (int): maximum number of channels open at the same time, defaults to
+                            DEFAULT_MAX_CHANNELS
+        instrument: True to collect the CommandStats of the commands, or a callable
+                    receiving them once complete
+
+    Yields:
+        tuple: ``(index, result)`` where ``index`` is the position of the command in
+               ``commands`` and ``result`` its Result object, in order of completion
+
+    Raises:
+        ChannelException: if one of the commands cannot be run, the others are cancelled
+    """
+    if max_channels is None:
+        max_channels = DEFAULT_MAX_CHANNELS
+    if max_channels <= 0:
+        raise ValueError(
+            "Max channels must be positive but received '{}'".format(max_channels)
+        )
+
+    pending = list(enumerate(commands))
+    pending.reverse()
+    runner = TaskRunner()
+    indexes = {}
+    completed = []
+    errors = []
+
+    def _on_done(task, error):
+        if error is not None:
+            errors.append(error)
+        else:
+            completed.append((indexes.pop(task), task.result))
+
+    try:
+        while pending or len(runner):
+            with lock:
+                while pending and len(runner) < max_channels:
+                    index, command = pending.pop()
+                    task = CommandTask(
+                        handle, command, buffer_pool=buffer_pool, instrument=instrument
+                    )
+                    indexes[task] = index
+                    runner.add(task, _on_done)
+                # sessions driven by an event loop are nonblocking, and must stay so
+                blocking = api.Api.ssh_is_blocking(handle)
+                api.Api.ssh_set_blocking(handle, 0)
+                try:
+                    runner.run()
+                finally:
+                    api.Api.ssh_set_blocking(handle, blocking)
+            if errors:
+                raise errors[0]
+
+            # yield outside the lock, the caller may use the session meanwhile
+            while completed:
+                yield completed.pop(0)
+            if len(runner) and not (pending and len(runner) < max_channels):
+                _wait(runner)
+    finally:
+        with lock:
+            runner.cancel_all()
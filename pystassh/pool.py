@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+""" A SessionPool keeps connected sessions around so that they can be reused.
+
+Examples:
+
+    Run commands on a server without paying the connection cost each time.
+
+    >>> pool = SessionPool(max_per_key=2, idle_ttl=60)
+    >>> with pool.session('localhost', 'foo', 'bar') as ssh_session:
+    ...     print(ssh_session.execute('uptime').stdout)
+    >>> with pool.session('localhost', 'foo', 'bar') as ssh_session:
+    ...     print(ssh_session.execute('whoami').stdout)
+    >>> pool.stats['hits']
+    1
+
+"""
+
+import contextlib
+import hashlib
+import threading
+import time
+
+from . import exceptions
+from .options import Options
+from .session import Session
+
+
+class SessionPool:
+    def __init__(self, max_per_key=4, max_total=64, idle_ttl=300, timeout=None):
+        """A thread-safe pool of connected sessions.
+
+        Sessions are identified by their hostname, port, username and credentials.
+        A session is given to a single caller at a time, and is checked to still be connected
+        before being handed out again. Sessions idle for more than ``idle_ttl`` seconds are
+        disconnected lazily, by acquire() and evict_idle(): the pool runs no timer, so a pool
+        that is not used anymore keeps its connections open until evict_idle() or close() is
+        called. Call evict_idle() periodically to bound the lifetime of idle connections.
+
+        Args:
+            max_per_key (int): maximum number of sessions opened to the same server with the
+                               same credentials
+            max_total (int): maximum number of sessions opened by the pool
+            idle_ttl (float): number of seconds after which an idle session is disconnected by
+                              the next call to acquire() or evict_idle()
+            timeout (float): default number of seconds to wait for a session when the limits
+                             are reached, None to wait forever
+        """
+        if max_per_key <= 0 or max_total <= 0:
+            raise ValueError("Pool limits must be positive")
+        self._max_per_key = max_per_key
+        self._max_total = max_total
+        self._idle_ttl = idle_ttl
+        self._timeout = timeout
+        self._condition = threading.Condition()
+        self._idle = {}
+        self._counts = {}
+        self._keys = {}
+        self._closed = False
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(hostname, username, password, passphrase, port, privkey_file, options):
+        if password:
+            auth_method = "password"
+        elif privkey_file:
+            auth_method = "privkey:{}".format(privkey_file)
+        else:
+            auth_method = "autopubkey"
+        # sessions are only reused with the same secrets, which are not kept in clear
+        credentials = hashlib.sha256(
+            b"\0".join(
+                str.encode(value) for value in (password, passphrase, privkey_file)
+            )
+        ).hexdigest()
+        return (
+            hostname,
+            int(port),
+            username,
+            auth_method,
+            credentials,
+            options or Options(),
+        )
+
+    @property
+    def stats(self):
+        """Usage counters of the pool, as a dict.
+
+        ``hits`` is the number of sessions reused from the pool, ``misses`` the number of new
+        connections, ``evictions`` the number of idle or broken sessions disconnected by the
+        pool, ``idle`` and ``in_use`` the number of sessions currently in each state.
+        """
+        with self._condition:
+            idle = sum(len(sessions) for sessions in self._idle.values())
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "idle": idle,
+                "in_use": sum(self._counts.values()) - idle,
+            }
+
+    def _pop_expired(self, now):
+        expired = []
+        for key, sessions in list(self._idle.items()):
+            while sessions and now - sessions[0][1] >= self._idle_ttl:
+                expired.append(self._pop_idle(key, 0))
+        return expired
+
+    def _pop_idle(self, key, index=-1):
+        session, _ = self._idle[key].pop(index)
+        if not self._idle[key]:
+            del self._idle[key]
+        self._forget(key, session)
+        self._evictions += 1
+        return session
+
+    def _forget(self, key, session):
+        self._counts[key] -= 1
+        if not self._counts[key]:
+            del self._counts[key]
+        self._keys.pop(id(session), None)
+        self._condition.notify_all()
+
+    def _pop_oldest_idle(self):
+        key = min(self._idle, key=lambda key: self._idle[key][0][1])
+        return self._pop_idle(key, 0)
+
+    @staticmethod
+    def _disconnect(sessions):
+        for session in sessions:
+            session.disconnect()
+
+    def acquire(
+        self,
+        hostname="localhost",
+        username="",
+        password="",
+        passphrase="",
+        port=22,
+        privkey_file="",
+        timeout=None,
+        options=None,
+    ):
+        """Get a connected session, reusing an idle one if possible.
+
+        The session must be given back with release() once it is not needed anymore.
+
+        Args:
+            hostname (str): hostname
+            username (str): user name
+            password (str): user password
+            passphrase (str): optional passphrase to be used with a public key authentication
+            port (int): SSH remote port
+            privkey_file (str): optional file name which has a private key
+            timeout (float): number of seconds to wait for a session when the limits are
+                             reached, defaults to the timeout of the pool
+            options (Options): options of the SSH transport, sessions are only reused
+                               with the same options
+
+        Returns:
+            Session: a connected session
+
+        Raises:
+            PoolException: if no session could be obtained before the timeout
+            ConnectionException: if an error occurred during the connection process
+            AuthenticationException: if an error occurred during the authentication process
+        """
+        key = self._key(
+            hostname, username, password, passphrase, port, privkey_file, options
+        )
+        timeout = self._timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        to_disconnect = []
+        try:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise exceptions.PoolException("The pool is closed")
+
+                    to_disconnect.extend(self._pop_expired(time.monotonic()))
+                    while self._idle.get(key):
+                        session, _ = self._idle[key].pop()
+                        if not self._idle[key]:
+                            del self._idle[key]
+                        if session.is_connected():
+                            self._hits += 1
+                            return session
+                        self._forget(key, session)
+                        self._evictions += 1
+                        to_disconnect.append(session)
+
+                    if self._counts.get(key, 0) < self._max_per_key:
+                        if sum(self._counts.values()) >= self._max_total and self._idle:
+                            to_disconnect.append(self._pop_oldest_idle())
+                        if sum(self._counts.values()) < self._max_total:
+                            break
+
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise exceptions.PoolException(
+                                "No session available for {}@{}:{}".format(
+                                    username, hostname, port
+                                )
+                            )
+                    self._condition.wait(remaining)
+
+                # reserve the slot while connecting, outside of the lock
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._misses += 1
+        finally:
+            self._disconnect(to_disconnect)
+
+        session = Session(
+            hostname,
+            username,
+            password,
+            passphrase,
+            port,
+            privkey_file,
+            options=options,
+        )
+        try:
+            session.connect()
+        except Exception:
+            with self._condition:
+                self._forget(key, session)
+            raise
+
+        with self._condition:
+            self._keys[id(session)] = key
+        return session
+
+    def release(self, session, discard=False):
+        """Give a session back to the pool.
+
+        Args:
+            session (Session): a session obtained with acquire()
+            discard (bool): disconnect the session instead of keeping it for later use
+        """
+        with self._condition:
+            key = self._keys.get(id(session))
+            if key is None:
+                raise exceptions.PoolException(
+                    "This session does not belong to the pool"
+                )
+
+            if discard or self._closed or not session.is_connected():
+                self._forget(key, session)
+            else:
+                self._idle.setdefault(key, []).append((session, time.monotonic()))
+                self._condition.notify_all()
+                return
+        session.disconnect()
+
+    @contextlib.contextmanager
+    def session(self, *args, **kwargs):
+        """Context manager acquiring a session and giving it back to the pool on exit.
+
+        It accepts the same arguments as acquire(). The session is discarded if an exception
+        related to SSH is raised within the block.
+        """
+        session = self.acquire(*args, **kwargs)
+        try:
+            yield session
+        except exceptions.PystasshException:
+            self.release(session, discard=True)
+            raise
+        except BaseException:
+            self.release(session)
+            raise
+        else:
+            self.release(session)
+
+    def evict_idle(self):
+        """Disconnect the sessions that have been idle for longer than the TTL.
+
+        It is also done by acquire(), but an unused pool must be evicted explicitly.
+
+        Returns:
+            int: the number of sessions disconnected
+        """
+        with self._condition:
+            expired = self._pop_expired(time.monotonic())
+        self._disconnect(expired)
+        return len(expired)
+
+    def close(self):
+        """Disconnect all the idle sessions. Sessions in use are disconnected when released."""
+        with self._condition:
+            self._closed = True
+            idle = []
+            while self._idle:
+                idle.append(self._pop_oldest_idle())
+        self._disconnect(idle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
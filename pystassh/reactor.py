@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+"""A Reactor drives many sessions from a single thread, without asyncio.
+
+The sessions are put in nonblocking mode and their connection, authentication, commands
+and outputs are run as tasks. The Reactor waits for the sockets of all the sessions at
+once with the most efficient mechanism of the platform, such as epoll, and only steps the
+sessions whose socket is ready. A thousand hosts are served by one thread, instead of a
+thread each with its stack and its share of the GIL.
+
+Each operation returns a ``concurrent.futures.Future``, resolved while run() is running.
+Callbacks added to the futures are called from the thread of the Reactor, and can start
+new operations.
+
+Examples:
+
+    Run a command on many servers, and print the results as they arrive.
+
+    >>> reactor = Reactor()
+    >>> for hostname in hostnames:
+    ...     future = reactor.execute(Session(hostname, 'foo'), 'uptime')
+    ...     future.add_done_callback(lambda future: print(future.result().stdout))
+    >>> reactor.run()
+
+"""
+
+import concurrent.futures
+import selectors
+import time
+
+from . import api, exceptions
+from .tasks import CommandTask, ConnectTask, TaskRunner
+
+
+class Reactor:
+    def __init__(self):
+        """A Reactor runs operations on many sessions concurrently, in a single thread.
+
+        A Reactor is not thread-safe: it must be used from the thread calling run(). The
+        sessions it runs commands on are left in nonblocking mode, they must only be used
+        through it until they are disconnected. They cannot be disconnected while the
+        Reactor has operations pending on them.
+        """
+        self._selector = selectors.DefaultSelector()
+        self._runners = {}
+        self._connecting = {}
+        # socket registered for each session, as (fd, events)
+        self._sockets = {}
+        # sessions to step on the next iteration, in order
+        self._ready = {}
+        # time at which the runners must be polled, see TaskRunner.poll_deadline()
+        self._next_tick = 0.0
+
+    def __len__(self):
+        """The number of operations still running."""
+        return sum(len(runner) for runner in self._runners.values())
+
+    def connect(self, session):
+        """Connect and authenticate a session.
+
+        Args:
+            session (Session): the session to connect
+
+        Returns:
+            concurrent.futures.Future: resolved with None once the session is connected
+        """
+        future = self._connecting.get(session)
+        if future is not None:
+            return future
+        if session.is_connected():
+            future = concurrent.futures.Future()
+            future.set_result(None)
+            return future
+
+        future = self._submit(session, ConnectTask(session))
+        self._connecting[session] = future
+        future.add_done_callback(lambda _: self._connecting.pop(session, None))
+        return future
+
+    def execute(self, session, command, on_output=None):
+        """Execute a command on a session, connecting it first if it is not connected.
+
+        Args:
+            session (Session): the session to run the command on
+            command (str): the command to run
+            on_output (callable): optional callback receiving each ``(is_stderr, chunk)`` of
+                                  the output as it is read, which is then not kept in the
+                                  Result
+
+        Returns:
+            concurrent.futures.Future: resolved with the Result object of the command
+        """
+        if session.is_connected() and session not in self._connecting:
+            return self._submit_command(session, command, on_output)
+
+        future = concurrent.futures.Future()
+
+        def _on_connected(connect_future):
+            if future.cancelled():
+                return
+            error = (
+                exceptions.PystasshException("The connection was cancelled")
+                if connect_future.cancelled()
+                else connect_future.exception()
+            )
+            if error is not None:
+                future.set_exception(error)
+                return
+            _chain(self._submit_command(session, command, on_output), future)
+
+        self.connect(session).add_done_callback(_on_connected)
+        return future
+
+    def _submit_command(self, session, command, on_output):
+        # sessions connected elsewhere are in blocking mode
+        api.Api.ssh_set_blocking(session._session, 0)
+        task = CommandTask(
+            session._session,
+            command,
+            buffer_pool=session._buffer_pool,
+            on_output=on_output,
+            instrument=session._instrument,
+        )
+        return self._submit(session, task)
+
+    def _submit(self, session, task):
+        future = concurrent.futures.Future()
+        runner = self._runners.get(session)
+        if runner is None:
+            runner = self._runners[session] = TaskRunner()
+            session._claim()
+
+        def _on_done(task, error):
+            if future.cancelled():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result)
+
+        def _on_cancelled(future):
+            if future.cancelled():
+                runner.cancel(task)
+                self._ready[session] = None
+
+        future.add_done_callback(_on_cancelled)
+        runner.add(task, _on_done)
+        self._ready[session] = None
+        return future
+
+    def run(self, timeout=None):
+        """Run the operations until they are all over, or until the timeout.
+
+        Args:
+            timeout (float): maximum number of seconds to run, None to run until the end
+
+        Returns:
+            int: the number of operations still running
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self._next_tick:
+                self._poll(now)
+
+            ready, self._ready = self._ready, {}
+            for session in ready:
+                self._step(session)
+            if not self._runners:
+                return 0
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return len(self)
+            wait = self._next_tick - now
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            if self._ready:
+                wait = 0
+            for key, _ in self._selector.select(max(0, wait)):
+                self._ready[key.data] = None
+
+    def _poll(self, now):
+        """Mark the sessions whose runner must be polled as ready, and find when the next one is."""
+        self._next_tick = float("inf")
+        for session, runner in self._runners.items():
+            deadline = runner.poll_deadline()
+            if deadline <= now:
+                self._ready[session] = None
+            else:
+                self._next_tick = min(self._next_tick, deadline)
+
+    def _step(self, session):
+        runner = self._runners.get(session)
+        if runner is None:
+            return
+        runner.run()
+        if not len(runner):
+            del self._runners[session]
+            session._unclaim()
+        else:
+            self._next_tick = min(self._next_tick, runner.poll_deadline())
+        self._watch(session, runner.waiting_sockets() if len(runner) else [])
+
+    def _watch(self, session, sockets):
+        current = self._sockets.get(session)
+        wanted = None
+        if sockets:
+            fd, wants_write = sockets[0]
+            events = selectors.EVENT_READ
+            if wants_write:
+                events |= selectors.EVENT_WRITE
+            wanted = (fd, events)
+        if wanted == current:
+            return
+
+        if current is not None:
+            self._selector.unregister(current[0])
+            del self._sockets[session]
+        if wanted is not None:
+            self._selector.register(wanted[0], wanted[1], session)
+            self._sockets[session] = wanted
+
+    def cancel_all(self):
+        """Stop all the operations and release their resources.
+
+        Their futures are resolved with a PystasshException.
+        """
+        runners, self._runners = self._runners, {}
+        for session, runner in runners.items():
+            runner.cancel_all()
+            session._unclaim()
+            self._watch(session, [])
+        self._ready = {}
+
+    def close(self):
+        """Stop all the operations, and release the resources of the Reactor."""
+        self.cancel_all()
+        self._selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _chain(source, destination):
+    """Resolve a future with the outcome of another one."""
+
+    def _on_done(source):
+        if destination.cancelled():
+            return
+        if source.cancelled():
+            destination.cancel()
+        elif source.exception() is not None:
+            destination.set_exception(source.exception())
+        else:
+            destination.set_result(source.result())
+
+    def _on_cancelled(destination):
+        if destination.cancelled():
+            source.cancel()
+
+    source.add_done_callback(_on_done)
+    destination.add_done_callback(_on_cancelled)
@@ -1,42 +1,132 @@
 # -*- coding: utf-8 -*-
 
-from . import api
+import threading
+
+from . import api, exceptions
+from .buffers import BufferPool
+from .output import OutputCollector, map_output
+from .stream import drain, pump
 
 
 class Result:
-    def __init__(self, channel, command):
+    # tens of thousands of results can be kept alive at once, slots save a dict per object
+    __slots__ = (
+        "_channel",
+        "_command",
+        "_lock",
+        "_stats",
+        "_stdout",
+        "_stderr",
+        "_return_code",
+        "_truncated",
+        "_stdout_text",
+        "_stderr_text",
+    )
+
+    def __init__(
+        self,
+        channel,
+        command,
+        buffer_pool=None,
+        lock=None,
+        stats=None,
+        stdin=None,
+        limits=None,
+        deadline=None,
+    ):
         """A Result object contains the execution details of a command.
 
         Args:
             channel: the libssh's channel instance the result will be attached to
             command: the last command that was run
+            buffer_pool (BufferPool): pool in which the read buffer is taken
+            lock: the lock of the session, if it is shared with other threads
+            stats (CommandStats): the stats in which the output is measured, if any
+            stdin: optional data to write to the standard input of the command, see
+                   stream.iter_stdin() for the accepted types
+            limits (OutputLimits): limits on the outputs kept, none by default
+            deadline (float): time.monotonic() value after which the command is killed, None
+                              to wait for it forever
+
+        Raises:
+            OutputLimitException: if an output exceeds its limits and the command is aborted
+            TimeoutException: if the command is not over before the deadline
         """
         self._channel = channel
         self._command = command
-        self._buffer_size = 100000
-        self._stdout = self._read_stdout_or_stderr(False)
-        self._stderr = self._read_stdout_or_stderr(True)
-        self._return_code = self._read_return_code()
-
-    def __read(self, is_stderr):
-        buffer = api.Api.new_chars(self._buffer_size)
-        return (
-            api.Api.ssh_channel_read(
-                self._channel, buffer, self._buffer_size, int(is_stderr)
-            ),
-            api.Api.to_string(buffer),
-        )
-
-    def _read_stdout_or_stderr(self, is_stderr):
-        content = b""
-        count, buffer = self.__read(is_stderr)
-        while count > 0:
-            content += buffer
-            count, buffer = self.__read(is_stderr)
-        return content
+        self._lock = lock
+        self._stats = stats
+        self._truncated = False
+        self._stdout_text = self._stderr_text = None
+        buffer_pool = buffer_pool or BufferPool(capacity=0)
+        try:
+            with buffer_pool.buffer() as buffer:
+                self._stdout, self._stderr = self._read_output(
+                    buffer, stdin, limits, deadline
+                )
+            self._return_code = self._read_return_code()
+        except Exception as error:
+            if stats:
+                stats.finish(error)
+            raise
+        if stats:
+            stats.finish()
+
+    @classmethod
+    def from_output(
+        cls, command, stdout, stderr, return_code, stats=None, truncated=False
+    ):
+        """Build a Result from the output of a command that was already read.
+
+        Args:
+            command (str): the command that was run
+            stdout (bytes): the content of the standard output
+            stderr (bytes): the content of the standard error output
+            return_code (int): the return code of the command
+            stats (CommandStats): the stats of the command, if any
+            truncated (bool): whether or not an output was truncated to its limits
+
+        Returns:
+            Result: the Result object for this command
+        """
+        result = cls.__new__(cls)
+        result._channel = None
+        result._command = command
+        result._lock = None
+        result._stats = stats
+        result._stdout = stdout
+        result._stderr = stderr
+        result._return_code = return_code
+        result._truncated = truncated
+        result._stdout_text = result._stderr_text = None
+        return result
+
+    def _read_output(self, buffer, stdin=None, limits=None, deadline=None):
+        contents = [
+            OutputCollector(limits, "standard output"),
+            OutputCollector(limits, "standard error"),
+        ]
+        if stdin is None:
+            outputs = drain(self._channel, buffer, lock=self._lock, deadline=deadline)
+        else:
+            outputs = pump(
+                self._channel, stdin, buffer, lock=self._lock, deadline=deadline
+            )
+        try:
+            for is_stderr, count in outputs:
+                if self._stats:
+                    self._stats.received(is_stderr, count)
+                contents[is_stderr].write(api.Api.to_buffer(buffer, count))
+        except exceptions.TimeoutException as error:
+            error.stdout = map_output(contents[False].getvalue())
+            error.stderr = map_output(contents[True].getvalue())
+            raise
+        self._truncated = contents[False].truncated or contents[True].truncated
+        return contents[False].getvalue(), contents[True].getvalue()
 
     def _read_return_code(self):
-        return api.Api.ssh_channel_get_exit_status(self._channel)
+        with self._lock or threading.Lock():
+            return api.Api.ssh_channel_get_exit_status(self._channel)
 
     @property
     def command(self):
@@ -45,25 +135,89 @@ class Result:
 
     @property
     def raw_stdout(self):
-        """The raw content of the standard output, as a list of bytes."""
+        """The raw content of the standard output, as bytes.
+
+        An output written to a temporary file because of its limits is given as a read-only
+        ``mmap.mmap`` of this file instead. The mapping belongs to the Result and is only
+        valid while the Result is alive: copy it with ``bytes()`` to keep the content longer.
+        """
+        self._stdout = map_output(self._stdout)
         return self._stdout
 
     @property
     def stdout(self):
         """The content of the standard output, as a string. Decoding errors are not caught at this level."""
-        return self.raw_stdout.decode("utf8", "replace").rstrip("\r\n")
+        if self._stdout_text is None:
+            self._stdout_text = _decode(self.raw_stdout)
+        return self._stdout_text
 
     @property
     def raw_stderr(self):
-        """The raw content of the standard error output, as a list of bytes."""
+        """The raw content of the standard error output, as bytes, or as a read-only
+        ``mmap.mmap`` only valid while the Result is alive, see raw_stdout."""
+        self._stderr = map_output(self._stderr)
         return self._stderr
 
     @property
     def stderr(self):
         """The content of the standard error output, as a string. Decoding errors are not caught at this level."""
-        return self.raw_stderr.decode("utf8", "replace").rstrip("\r\n")
+        if self._stderr_text is None:
+            self._stderr_text = _decode(self.raw_stderr)
+        return self._stderr_text
+
+    def iter_raw_lines(self, from_stderr=False):
+        """Iterate over the lines of an output without copying them.
+
+        Lines are split like with ``splitlines()``, on ``"\\n"`` and ``"\\r\\n"`` only.
+
+        Args:
+            from_stderr (bool): iterate over the standard error instead of the standard output
+
+        Returns:
+            iterator: the lines, as memoryview slices of the raw output, without their line
+                      ending
+        """
+        data = self.raw_stderr if from_stderr else self.raw_stdout
+        view = memoryview(data)
+        start = 0
+        while start < len(data):
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = next_start = len(data)
+            else:
+                next_start = end + 1
+                if end > start and data[end - 1] == ord("\r"):
+                    end -= 1
+            yield view[start:end]
+            start = next_start
+
+    def iter_lines(self, from_stderr=False):
+        """Iterate over the lines of an output, decoding them one at a time.
+
+        Args:
+            from_stderr (bool): iterate over the standard error instead of the standard output
+
+        Returns:
+            iterator: the lines, as strings without their line ending
+        """
+        for line in self.iter_raw_lines(from_stderr):
+            yield str(line, "utf8", "replace")
+
+    @property
+    def truncated(self):
+        """Whether or not an output was cut to the maximum size set by the limits."""
+        return self._truncated
 
     @property
     def return_code(self):
         """The return code of the last command as an int."""
         return self._return_code
+
+    @property
+    def stats(self):
+        """The CommandStats of the command, or None if the session is not instrumented."""
+        return self._stats
+
+
+def _decode(data):
+    return str(data, "utf8", "replace").rstrip("\r\n")
@@ -10,10 +10,35 @@ Examples:
     ...     result = ssh_session.execute('ls')
     ...     print(result.stdout)
 
+    Run commands concurrently over the same connection.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with Session('localhost', 'foo', 'bar') as ssh_session:
+    ...     with ThreadPoolExecutor() as executor:
+    ...         results = list(executor.map(ssh_session.execute, ['uptime', 'whoami']))
+
+Thread-safety:
+
+    A session can be shared between threads once connected: each call to execute() runs in
+    its own channel, and open_channel() gives independent channels that can run commands
+    concurrently. The calls to libssh are serialized by a lock held by the session, which
+    is released while waiting for the output of a command. A channel runs one command at
+    a time. connect() must not be called while commands are running, and disconnect()
+    raises a PystasshException if commands or transfers are running, including streams
+    not closed and pipelines not exhausted.
+
 """
 
-from . import api, exceptions
+import threading
+import weakref
+
+from . import api, exceptions, keys
+from .buffers import DEFAULT_BUFFER_SIZE, DEFAULT_POOL_CAPACITY, BufferPool
 from .channel import Channel
+from .options import Options
+from .pipeline import iter_pipelined
+from .sftp import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_REQUESTS, Sftp
+from .stats import ConnectStats, new_stats
 
 
 class Session:
@@ -25,6 +50,11 @@ class Session:
         passphrase="",
         port=22,
         privkey_file="",
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        buffer_pool_capacity=DEFAULT_POOL_CAPACITY,
+        instrument=False,
+        options=None,
+        key_cache=True,
     ):
 
         """A session object correspond to a unique SSH connexion from which commands can be run.
@@ -36,6 +66,15 @@ class Session:
             passphrase (str): optional passphrase to be used with a public key authentication
             port (int): SSH remote port
             privkey_file (str): optional file name which has a private key (optionally encrypted with the passphrase)
+            buffer_size (int): size in bytes of the buffers used to read the outputs
+            buffer_pool_capacity (int): maximum number of idle read buffers kept for reuse
+            instrument: True to collect the timings of the connection and of the commands, or a
+                        callable receiving each ConnectStats and CommandStats once complete
+            options (Options): options of the SSH transport, such as the ciphers or the
+                               compression
+            key_cache: True to share the private key with the other sessions of the process
+                       through the default KeyCache, a KeyCache to use instead, or False to
+                       import the key on each connection
         """
         # Keep a reference to the Api class so we can access it from __del__().
         # During the deinitialization of the Python VM, the module 'api' may not
@@ -47,9 +86,20 @@ class Session:
         self._passphrase = str.encode(passphrase)
         self._privkey_file = str.encode(privkey_file)
         self._port = str.encode(str(port))
+        self._buffer_pool = BufferPool(buffer_size, buffer_pool_capacity)
+        self._instrument = instrument
+        self._options = options or Options()
+        self._key_cache = keys.default_cache if key_cache is True else key_cache or None
+        self._connect_stats = None
+
+        self._lock = threading.RLock()
+        self._channels = weakref.WeakSet()
+        # number of pipelines and reactors running tasks on the session
+        self._claims = 0
 
         self._session = None
         self._channel = None
+        self._sftp = None
 
     def is_connected(self):
         """Check if the connexion is currently active.
@@ -70,6 +120,44 @@ class Session:
         if self.is_connected():
             return
 
+        stats = new_stats(self._instrument, ConnectStats, self._hostname.decode())
+        self._connect_stats = stats
+        try:
+            self._connect(stats)
+        except Exception as error:
+            if stats:
+                stats.finish(error)
+            raise
+        if stats:
+            stats.finish()
+
+    def _connect(self, stats):
+        session = self._new_session()
+        if stats:
+            stats.mark("setup_time")
+        try:
+            ret = self._api.ssh_connect(session)
+            self._check_connect(ret, session)
+            if stats:
+                stats.mark("handshake_time")
+
+            key = self._import_key(session)
+            try:
+                ret = self._userauth(session, key)
+            finally:
+                # once authenticated we don't need the key anymore
+                self._release_key(key)
+            self._check_userauth(ret, session)
+            if stats:
+                stats.mark("auth_time")
+
+            self._attach(session)
+        except Exception:
+            self._api.ssh_free(session)
+            self._session = self._channel = None
+            raise
+
+    def _new_session(self):
         session = self._api.ssh_new()
         if session is None:
             raise exceptions.ConnectionException(
@@ -107,92 +195,368 @@ class Session:
                     )
                 )
 
-            ret = self._api.ssh_connect(session)
-            if ret != api.SSH_OK:
-                raise exceptions.ConnectionException(
-                    "Connection cannot be made (return code: {}): {}".format(
-                        ret, self.get_error_message(session)
-                    )
+            self._options.apply(session)
+        except Exception:
+            self._api.ssh_free(session)
+            self._session = self._channel = None
+            raise
+
+        return session
+
+    def _check_connect(self, ret, session):
+        if ret != api.SSH_OK:
+            raise exceptions.ConnectionException(
+                "Connection cannot be made (return code: {}): {}".format(
+                    ret, self.get_error_message(session)
                 )
+            )
 
-            if self._password:
-                ret = self._api.ssh_userauth_password(
-                    session, self._username, self._password
+    def _import_key(self, session):
+        """Load the private key to authenticate with, if any.
+
+        Returns:
+            the libssh's key instance, to be given back with _release_key(), or None
+        """
+        if self._password or not self._privkey_file:
+            return None
+        if self._key_cache is None:
+            return keys.import_key(self._privkey_file, self._passphrase, session)
+        return self._key_cache.acquire(self._privkey_file, self._passphrase, session)
+
+    def _release_key(self, key):
+        if key is None:
+            return
+        if self._key_cache is None:
+            self._api.ssh_key_free(key)
+        else:
+            self._key_cache.release(key)
+
+    def _userauth(self, session, key):
+        """Run the userauth call matching the credentials of this session.
+
+        Returns:
+            int: the libssh's return code of the userauth call
+        """
+        if self._password:
+            return self._api.ssh_userauth_password(
+                session, self._username, self._password
+            )
+        if key is not None:
+            return self._api.ssh_userauth_publickey(session, self._api.NULL, key)
+        return self._api.ssh_userauth_autopubkey(session, self._passphrase)
+
+    def _check_userauth(self, ret, session):
+        # check last userauth call and see if we had been authenticated or not.
+        if ret == api.SSH_AUTH_SUCCESS:
+            return
+        if self._password:
+            raise exceptions.AuthenticationException(
+                "Authentication cannot be made with username and password (return code: {}): {}".format(
+                    ret, self.get_error_message(session)
                 )
-                if ret != api.SSH_AUTH_SUCCESS:
-                    raise exceptions.AuthenticationException(
-                        "Authentication cannot be made with username and password (return code: {}): {}".format(
-                            ret, self.get_error_message(session)
-                        )
-                    )
-            else:
-                if self._privkey_file:
-                    null = self._api.NULL
-                    pkey = self._api.new_key_pointer()
+            )
+        raise exceptions.AuthenticationException(
+            "Authentication cannot be made with public key (return code: {}): {}".format(
+                ret, self.get_error_message(session)
+            )
+        )
+
+    def _attach(self, session):
+        self._session = session
+        self._channel = Channel(
+            self._session,
+            buffer_pool=self._buffer_pool,
+            lock=self._lock,
+            instrument=self._instrument,
+        )
+
+    def _claim(self):
+        """Mark the session as used by tasks run outside of its channels, until _unclaim()."""
+        with self._lock:
+            self._claims += 1
+
+    def _unclaim(self):
+        with self._lock:
+            self._claims -= 1
 
-                    ret = self._api.ssh_pki_import_privkey_file(
-                        self._privkey_file, self._passphrase, null, null, pkey
-                    )
+    def disconnect(self):
+        """Close the current connection, and all the channels opened on it.
 
-                    if ret != api.SSH_OK:
-                        raise exceptions.AuthenticationException(
-                            "Private key could not be used (return code: {}): {}".format(
-                                ret, self.get_error_message(session)
-                            )
-                        )
-
-                    key = pkey[0]  # dereference the pointer to get the key
-                    ret = self._api.ssh_userauth_publickey(session, null, key)
-
-                    # once authenticated we don't need the key anymore
-                    self._api.ssh_key_free(key)
-                else:
-                    ret = self._api.ssh_userauth_autopubkey(session, self._passphrase)
-
-                # check last userauth call and see if we had been authenticated
-                # or not.
-                if ret != api.SSH_AUTH_SUCCESS:
-                    raise exceptions.AuthenticationException(
-                        "Authentication cannot be made with public key (return code: {}): {}".format(
-                            ret, self.get_error_message(session)
-                        )
+        Raises:
+            PystasshException: if a command is still running in one of the channels, such
+                               as a ResultStream not exhausted nor closed, if a file is
+                               being transferred, or if tasks are pending in a pipeline
+                               or a Reactor
+        """
+        with self._lock:
+            if self.is_connected():
+                channels = list(self._channels)
+                if self._channel:
+                    channels.append(self._channel)
+                # freeing a channel read by another thread would make it use freed memory
+                if self._claims or any(
+                    isinstance(channel, (Channel, Sftp)) and channel._busy
+                    for channel in channels
+                ):
+                    raise exceptions.PystasshException(
+                        "Commands or transfers are still running on this session, "
+                        "they must be over or closed before disconnecting"
                     )
+                for channel in channels:
+                    channel.close()
+                self._api.ssh_disconnect(self._session)
+                self._api.ssh_free(self._session)
+            self._channel = None
+            self._sftp = None
+            self._session = None
 
-            self._session = session
-            self._channel = Channel(self._session)
-        except Exception:
-            self._api.ssh_free(session)
-            self._session = self._channel = None
-            raise
+    def open_channel(self):
+        """Get a new channel bound to this session.
 
-    def disconnect(self):
-        """Close the current connection."""
-        if self.is_connected():
-            self._channel and self._channel.close()
-            self._api.ssh_disconnect(self._session)
-            self._api.ssh_free(self._session)
-        self._channel = None
-        self._session = None
+        Channels are independent of each other: they can run commands concurrently, from
+        different threads, over the same connection. They are closed on disconnect.
 
-    def execute(self, command):
+        Returns:
+            Channel: a new channel, not opened yet
+        """
+        if not self.is_connected():
+            raise exceptions.PystasshException(
+                "The session is not ready, call the connect() method first"
+            )
+        channel = Channel(
+            self._session,
+            buffer_pool=self._buffer_pool,
+            lock=self._lock,
+            instrument=self._instrument,
+        )
+        self._channels.add(channel)
+        return channel
+
+    def execute(self, command, stdin=None, limits=None, timeout=None):
         """Execute a command on the remote server.
 
         Args:
             command (str): the command to run
+            stdin: optional data to write to the standard input of the command: a bytes-like
+                   object, a binary file object or an iterable of bytes-like objects
+            limits (OutputLimits): limits on the size of the outputs, to truncate them, abort
+                                   the command or write them to temporary files
+            timeout (float): number of seconds after which the command is killed and a
+                             TimeoutException raised, with the output received so far
 
         Returns:
             Result: the Result object for this command
         """
+        return self.open_channel().execute(
+            command, stdin=stdin, limits=limits, timeout=timeout
+        )
+
+    def execute_stream(
+        self, command, chunk_size=DEFAULT_BUFFER_SIZE, stdin=None, timeout=None
+    ):
+        """Execute a command on the remote server and stream its output as it arrives.
+
+        Args:
+            command (str): the command to run
+            chunk_size (int): maximum size of the chunks yielded by the stream
+            stdin: optional data to write to the standard input of the command, see execute()
+            timeout (float): number of seconds after which the command is killed and the
+                             stream closed
+
+        Returns:
+            ResultStream: an iterator over the output of the command
+        """
+        return self.open_channel().execute_stream(
+            command, chunk_size=chunk_size, stdin=stdin, timeout=timeout
+        )
+
+    def execute_batch(self, commands):
+        """Execute several commands on the remote server, in a single shell.
+
+        The Results have no stats, even if the session is instrumented.
+
+        Args:
+            commands (list): the commands to run
+
+        Returns:
+            list: the Result objects of the commands, in the same order
+        """
+        return self.open_channel().execute_batch(commands)
+
+    def iter_execute_batch(self, commands):
+        """Execute several commands on the remote server, in a single shell, and yield their
+        Results as they complete.
+
+        Args:
+            commands (list): the commands to run
+
+        Returns:
+            iterator: the Result objects of the commands, in the same order
+        """
+        return self.open_channel().iter_execute_batch(commands)
+
+    def execute_pipelined(self, commands, max_channels=None):
+        """Execute several commands on the remote server, with their requests pipelined.
+
+        Args:
+            commands (list): the commands to run
+            max_channels (int): maximum number of commands running at the same time
+
+        Returns:
+            list: the Result objects of the commands, in the same order
+        """
+        commands = list(commands)
+        results = [None] * len(commands)
+        for index, result in self.iter_execute_pipelined(commands, max_channels):
+            results[index] = result
+        return results
+
+    def iter_execute_pipelined(self, commands, max_channels=None):
+        """Execute several commands on the remote server, with their requests pipelined,
+        and yield their Results as they complete.
+
+        All the channels are opened and all the commands are requested before waiting for
+        the replies of the server, see the pipeline module for the details.
+
+        Args:
+            commands (list): the commands to run
+            max_channels (int): maximum number of commands running at the same time
+
+        Returns:
+            iterator: ``(index, result)`` tuples, where ``index`` is the position of the
+                      command in ``commands``, in order of completion
+        """
+        if not self.is_connected():
+            raise exceptions.PystasshException(
+                "The session is not ready, call the connect() method first"
+            )
+        return self._iter_pipelined(list(commands), max_channels)
+
+    def _iter_pipelined(self, commands, max_channels):
+        # the session is claimed until the generator is over, so that it is not freed
+        # under the tasks suspended between two results
+        with self._lock:
+            if not self.is_connected():
+                raise exceptions.PystasshException(
+                    "The session is not ready, call the connect() method first"
+                )
+            self._claim()
+            handle = self._session
+        try:
+            yield from iter_pipelined(
+                handle,
+                commands,
+                self._lock,
+                buffer_pool=self._buffer_pool,
+                max_channels=max_channels,
+                instrument=self._instrument,
+            )
+        finally:
+            self._unclaim()
+
+    def open_sftp(self):
+        """Open a new SFTP session bound to this session, to transfer files.
+
+        It is closed on disconnect.
+
+        Returns:
+            Sftp: a new SFTP session, opened
+        """
         if not self.is_connected():
             raise exceptions.PystasshException(
                 "The session is not ready, call the connect() method first"
             )
-        return self._channel.execute(command)
+        sftp = Sftp(self._session, buffer_pool=self._buffer_pool, lock=self._lock)
+        self._channels.add(sftp)
+        sftp.open()
+        return sftp
+
+    def _get_sftp(self):
+        with self._lock:
+            if self._sftp is None or not self._sftp.is_open():
+                self._sftp = self.open_sftp()
+            return self._sftp
+
+    def upload(
+        self,
+        local_path,
+        remote_path,
+        mode=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_requests=DEFAULT_MAX_REQUESTS,
+        progress=None,
+    ):
+        """Copy a local file to the remote server over SFTP.
+
+        Args:
+            local_path (str): path of the file to send
+            remote_path (str): path of the file to create on the remote server
+            mode (int): permissions of the remote file if it is created, defaults to the
+                        permissions of the local file
+            chunk_size (int): size in bytes of each write request
+            max_requests (int): maximum number of write requests waiting for a reply
+            progress: optional callable receiving the number of bytes sent so far
+
+        Returns:
+            int: the number of bytes sent
+        """
+        return self._get_sftp().upload(
+            local_path,
+            remote_path,
+            mode=mode,
+            chunk_size=chunk_size,
+            max_requests=max_requests,
+            progress=progress,
+        )
+
+    def download(
+        self,
+        remote_path,
+        local_path,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_requests=DEFAULT_MAX_REQUESTS,
+        progress=None,
+    ):
+        """Copy a remote file to the local disk over SFTP.
+
+        Args:
+            remote_path (str): path of the file to get from the remote server
+            local_path (str): path of the local file to write
+            chunk_size (int): size in bytes of each read request
+            max_requests (int): maximum number of read requests waiting for a reply
+            progress: optional callable receiving the number of bytes received so far
+
+        Returns:
+            int: the number of bytes received
+        """
+        return self._get_sftp().download(
+            remote_path,
+            local_path,
+            chunk_size=chunk_size,
+            max_requests=max_requests,
+            progress=progress,
+        )
 
     @property
     def channel(self):
+        """The default channel of the session, for interactive use such as shells."""
         return self._channel
 
+    @property
+    def options(self):
+        """The Options of the SSH transport of this session."""
+        return self._options
+
+    @property
+    def connect_stats(self):
+        """The ConnectStats of the last connection, or None if the session is not instrumented."""
+        return self._connect_stats
+
+    @property
+    def buffer_pool(self):
+        """The pool of read buffers shared by the channels of this session."""
+        return self._buffer_pool
+
     def __enter__(self):
         self.connect()
         return self
@@ -201,7 +565,11 @@ class Session:
         self.disconnect()
 
     def __del__(self):
-        self.disconnect()
+        try:
+            self.disconnect()
+        except exceptions.PystasshException:
+            # the channels still in use keep the connection, it cannot be freed safely
+            pass
         del self._api
 
     def get_error_message(self, session=None):
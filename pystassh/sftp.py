@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""Transfer files over SFTP, with several requests in flight at once.
+
+Waiting for the reply of each read or write before sending the next request would limit
+the throughput to one chunk per round trip. Up to ``max_requests`` requests are sent
+ahead instead, so that the connection stays busy. The local files are never copied in
+Python objects: uploaded files are memory-mapped and given to libssh as they are, and
+downloaded data is written to the local file straight from the native read buffer.
+
+The writes can only be pipelined from libssh 0.11, they are sent one at a time otherwise.
+
+Examples:
+
+    >>> with Session('localhost', 'foo', 'bar') as ssh_session:
+    ...     ssh_session.upload('backup.tar', '/tmp/backup.tar')
+    ...     ssh_session.download('/var/log/syslog', 'syslog', progress=print)
+
+"""
+
+import collections
+import mmap
+import os
+import stat
+import threading
+
+from . import api, exceptions
+from .buffers import BufferPool
+
+DEFAULT_CHUNK_SIZE = 32768
+DEFAULT_MAX_REQUESTS = 16
+
+
+def _check_transfer_options(chunk_size, max_requests):
+    if chunk_size <= 0:
+        raise ValueError(
+            "Chunk size must be positive but received '{}'".format(chunk_size)
+        )
+    if max_requests <= 0:
+        raise ValueError(
+            "Max requests must be positive but received '{}'".format(max_requests)
+        )
+
+
+class Sftp:
+    def __init__(self, session, buffer_pool=None, lock=None):
+        """A SFTP session, bound to a SSH session, to transfer files.
+
+        It runs one transfer at a time, calls from other threads wait for their turn.
+
+        Args:
+            session: the libssh's session instance the SFTP session will be bound to
+            buffer_pool (BufferPool): pool in which read buffers are taken
+            lock (threading.RLock): the lock of the session, if it is shared with channels
+        """
+        self._session = session
+        self._buffer_pool = buffer_pool or BufferPool()
+        self._lock = lock or threading.RLock()
+        self._transfer_lock = threading.Lock()
+        self._sftp = None
+
+    def is_open(self):
+        """Check if the SFTP session is currently open."""
+        return self._sftp is not None
+
+    @property
+    def _busy(self):
+        # a transfer is running, from this thread or another one
+        return self._transfer_lock.locked()
+
+    def open(self):
+        """Open the SFTP session.
+
+        Raises:
+            SftpException: if the SFTP session could not be initialized
+        """
+        with self._lock:
+            if self.is_open():
+                return
+
+            sftp = api.Api.sftp_new(self._session)
+            if not sftp:
+                raise exceptions.SftpException(
+                    "SFTP session cannot be created: {}".format(
+                        self.get_error_message()
+                    )
+                )
+
+            ret = api.Api.sftp_init(sftp)
+            if ret != api.SSH_OK:
+                error = api.Api.sftp_get_error(sftp)
+                api.Api.sftp_free(sftp)
+                raise exceptions.SftpException(
+                    "SFTP session cannot be initialized (sftp error: {}): {}".format(
+                        error, self.get_error_message()
+                    )
+                )
+            self._sftp = sftp
+
+    def close(self):
+        """Close the SFTP session."""
+        with self._lock:
+            if self._sftp is not None:
+                api.Api.sftp_free(self._sftp)
+            self._sftp = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def upload(
+        self,
+        local_path,
+        remote_path,
+        mode=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_requests=DEFAULT_MAX_REQUESTS,
+        progress=None,
+    ):
+        """Copy a local file to the remote server, replacing the remote file if any.
+
+        Args:
+            local_path (str): path of the file to send
+            remote_path (str): path of the file to create on the remote server
+            mode (int): permissions of the remote file if it is created, defaults to the
+                        permissions of the local file
+            chunk_size (int): size in bytes of each write request
+            max_requests (int): maximum number of write requests waiting for a reply
+            progress: optional callable receiving the number of bytes sent so far, after
+                      each chunk
+
+        Returns:
+            int: the number of bytes sent
+
+        Raises:
+            SftpException: if the remote file cannot be opened or written
+        """
+        _check_transfer_options(chunk_size, max_requests)
+        with open(local_path, "rb") as local_file:
+            local_stat = os.fstat(local_file.fileno())
+            if mode is None:
+                mode = stat.S_IMODE(local_stat.st_mode)
+
+            with self._transfer_lock:
+                remote_file = self._open_file(
+                    remote_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode
+                )
+                try:
+                    if not local_stat.st_size:
+                        return 0
+                    with mmap.mmap(
+                        local_file.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as data:
+                        with api.Api.from_buffer(data, writable=False) as chars:
+                            if api.Api.has_sftp_aio():
+                                return self._write_pipelined(
+                                    remote_file,
+                                    chars,
+                                    len(data),
+                                    chunk_size,
+                                    max_requests,
+                                    progress,
+                                )
+                            return self._write(
+                                remote_file, chars, len(data), chunk_size, progress
+                            )
+                finally:
+                    self._close_file(remote_file)
+
+    def _write(self, remote_file, chars, size, chunk_size, progress):
+        offset = 0
+        while offset < size:
+            with self._lock:
+                ret = api.Api.sftp_write(
+                    remote_file, chars + offset, min(chunk_size, size - offset)
+                )
+            if ret < 0:
+                raise self._error("Write failed")
+            offset += ret
+            if progress:
+                progress(offset)
+        return offset
+
+    def _write_pipelined(
+        self, remote_file, chars, size, chunk_size, max_requests, progress
+    ):
+        pending = collections.deque()
+        offset = written = 0
+        try:
+            while offset < size or pending:
+                while offset < size and len(pending) < max_requests:
+                    aio = api.Api.new_pointer()
+                    with self._lock:
+                        ret = api.Api.sftp_aio_begin_write(
+                            remote_file,
+                            chars + offset,
+                            min(chunk_size, size - offset),
+                            aio,
+                        )
+                    if ret < 0:
+                        raise self._error("Write failed")
+                    pending.append(aio)
+                    offset += ret
+
+                # libssh frees the request once it is waited for, even on errors
+                aio = pending.popleft()
+                with self._lock:
+                    ret = api.Api.sftp_aio_wait_write(aio)
+                if ret < 0:
+                    raise self._error("Write failed")
+                written += ret
+                if progress:
+                    progress(written)
+        finally:
+            with self._lock:
+                for aio in pending:
+                    api.Api.sftp_aio_free(aio[0])
+        return written
+
+    def download(
+        self,
+        remote_path,
+        local_path,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_requests=DEFAULT_MAX_REQUESTS,
+        progress=None,
+    ):
+        """Copy a remote file to the local disk, replacing the local file if any.
+
+        Args:
+            remote_path (str): path of the file to get from the remote server
+            local_path (str): path of the local file to write
+            chunk_size (int): size in bytes of each read request
+            max_requests (int): maximum number of read requests waiting for a reply
+            progress: optional callable receiving the number of bytes received so far,
+                      after each chunk
+
+        Returns:
+            int: the number of bytes received
+
+        Raises:
+            SftpException: if the remote file cannot be opened or read
+        """
+        _check_transfer_options(chunk_size, max_requests)
+        with self._transfer_lock:
+            remote_file = self._open_file(remote_path, os.O_RDONLY, 0)
+            try:
+                # unbuffered, the data goes from the native buffer to the file directly
+                with open(local_path, "wb", buffering=0) as local_file:
+                    with self._buffer_pool.buffer(chunk_size) as buffer:
+                        return self._read(
+                            remote_file,
+                            local_file,
+                            buffer,
+                            chunk_size,
+                            max_requests,
+                            progress,
+                        )
+            finally:
+                self._close_file(remote_file)
+
+    def _read(
+        self, remote_file, local_file, buffer, chunk_size, max_requests, progress
+    ):
+        pending = collections.deque()
+        offset = received = 0
+        eof = False
+        while pending or not eof:
+            while not eof and len(pending) < max_requests:
+                pending.append((self._begin_read(remote_file, chunk_size), chunk_size))
+                offset += chunk_size
+
+            request, length = pending.popleft()
+            count = self._wait_read(remote_file, buffer, length, request)
+            while count:
+                _write_all(local_file, api.Api.to_buffer(buffer, count))
+                received += count
+                if progress:
+                    progress(received)
+                length -= count
+                if not length:
+                    break
+                # the server may reply with less data than requested, the rest is requested
+                # again right away to keep the data in order, until the end of the file
+                with self._lock:
+                    api.Api.sftp_seek64(remote_file, received)
+                    request = self._begin_read(remote_file, length)
+                    api.Api.sftp_seek64(remote_file, offset)
+                count = self._wait_read(remote_file, buffer, length, request)
+            eof = eof or count == 0
+        return received
+
+    def _begin_read(self, remote_file, length):
+        with self._lock:
+            request = api.Api.sftp_async_read_begin(remote_file, length)
+        if request < 0:
+            raise self._error("Read failed")
+        return request
+
+    def _wait_read(self, remote_file, buffer, length, request):
+        with self._lock:
+            count = api.Api.sftp_async_read(remote_file, buffer, length, request)
+        if count < 0:
+            raise self._error("Read failed")
+        return count
+
+    def _open_file(self, path, flags, mode):
+        with self._lock:
+            if not self.is_open():
+                raise exceptions.SftpException("The SFTP session is not open.")
+            remote_file = api.Api.sftp_open(self._sftp, str.encode(path), flags, mode)
+        if not remote_file:
+            raise self._error("Remote file '{}' cannot be opened".format(path))
+        return remote_file
+
+    def _close_file(self, remote_file):
+        with self._lock:
+            api.Api.sftp_close(remote_file)
+
+    def _error(self, message):
+        with self._lock:
+            error = api.Api.sftp_get_error(self._sftp)
+        return exceptions.SftpException(
+            "{} (sftp error: {}): {}".format(message, error, self.get_error_message())
+        )
+
+    def get_error_message(self):
+        """Tries to retrieve an error message in case of error.
+
+        Returns:
+            str: An error message
+        """
+        try:
+            with self._lock:
+                return api.Api.get_error_message(self._session)
+        except exceptions.UnknownException:
+            return "<error message irrecoverable>"
+
+
+def _write_all(local_file, data):
+    data = memoryview(data)
+    while data:
+        count = local_file.write(data)
+        data = data[count:]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""Timings and byte counts of connections and commands.
+
+They are only collected when a Session is created with ``instrument=True``, or with a
+callable which then receives each stats object once complete. Otherwise nothing is
+measured at all.
+
+Examples:
+
+    Find out which phase of the connection is slow.
+
+    >>> with Session('localhost', 'foo', 'bar', instrument=True) as ssh_session:
+    ...     print(ssh_session.connect_stats.handshake_time, ssh_session.connect_stats.auth_time)
+    ...     result = ssh_session.execute('ls')
+    ...     print(result.stats.time_to_first_byte, result.stats.stdout_bytes)
+
+    Send all the measures to a logger.
+
+    >>> ssh_session = Session('localhost', 'foo', 'bar', instrument=logger.info)
+
+The commands of a batch share a single shell, their Results have no stats.
+
+"""
+
+import time
+
+
+class _Stats:
+    def __init__(self, hook=None):
+        self._hook = hook
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """Record the time elapsed since the previous phase as the duration of ``phase``."""
+        now = time.perf_counter()
+        setattr(self, phase, now - self._last)
+        self._last = now
+
+    def _finish(self, total):
+        setattr(self, total, time.perf_counter() - self._start)
+        if self._hook is not None:
+            self._hook(self)
+
+    def as_dict(self):
+        """The measures as a dict, to be serialized."""
+        return {
+            name: value
+            for name, value in vars(self).items()
+            if not name.startswith("_")
+        }
+
+    def __repr__(self):
+        return "<{} {}>".format(
+            self.__class__.__name__,
+            " ".join(
+                "{}={!r}".format(name, value) for name, value in self.as_dict().items()
+            ),
+        )
+
+
+class ConnectStats(_Stats):
+    def __init__(self, hostname, hook=None):
+        """Timings of a connection, in seconds.
+
+        A phase that was not reached because of an error is None.
+
+        Attributes:
+            hostname (str): the server the connection was made to
+            setup_time (float): time spent creating the libssh's session and setting its options
+            handshake_time (float): time spent connecting and negotiating the SSH transport
+            auth_time (float): time spent loading the private key and authenticating
+            total_time (float): time spent in connect()
+            error (Exception): the exception raised by connect(), if any
+        """
+        super().__init__(hook)
+        self.hostname = hostname
+        self.setup_time = None
+        self.handshake_time = None
+        self.auth_time = None
+        self.total_time = None
+        self.error = None
+
+    def finish(self, error=None):
+        """Record the total time and give the stats to the hook, if any."""
+        self.error = error
+        self._finish("total_time")
+
+
+class CommandStats(_Stats):
+    def __init__(self, command, hook=None):
+        """Timings, in seconds, and byte counts of a command.
+
+        A phase that was not reached because of an error is None, and the byte counts are
+        those of the output received until the error.
+
+        Attributes:
+            command (str): the command that was run
+            channel_open_time (float): time spent opening the channel
+            exec_time (float): time spent requesting the execution of the command
+            time_to_first_byte (float): time elapsed between the execution request and the
+                                        first byte of output, None if there was no output
+            duration (float): time elapsed between the opening of the channel and the end of
+                              the command
+            stdout_bytes (int): size of the standard output
+            stderr_bytes (int): size of the standard error output
+            error (Exception): the exception that stopped the command, if any
+        """
+        super().__init__(hook)
+        self.command = command
+        self.channel_open_time = None
+        self.exec_time = None
+        self.time_to_first_byte = None
+        self.duration = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.error = None
+
+    def received(self, is_stderr, count):
+        """Count ``count`` bytes of output."""
+        if self.time_to_first_byte is None:
+            self.mark("time_to_first_byte")
+        if is_stderr:
+            self.stderr_bytes += count
+        else:
+            self.stdout_bytes += count
+
+    def finish(self, error=None):
+        """Record the duration of the command and give the stats to the hook, if any."""
+        self.error = error
+        self._finish("duration")
+
+
+def new_stats(instrument, stats_class, *args):
+    """Build a stats object if the instrumentation is enabled.
+
+    Args:
+        instrument: False to disable the instrumentation, True to enable it, or a callable
+                    to which the stats are given once complete
+        stats_class: ConnectStats or CommandStats
+        args: the arguments of the stats class, without the hook
+
+    Returns:
+        the stats object, or None if the instrumentation is disabled
+    """
+    if not instrument:
+        return None
+    return stats_class(*args, hook=instrument if callable(instrument) else None)
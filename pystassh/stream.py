@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+"""A ResultStream gives access to the output of a command while it is still running.
+
+Examples:
+
+    Print the output of a long running command line by line, as soon as it is available.
+
+    >>> with Session('localhost', 'foo', 'bar') as ssh_session:
+    ...     with ssh_session.execute_stream('find /') as stream:
+    ...         for is_stderr, line in stream.iter_lines():
+    ...             print(line)
+    ...     print(stream.return_code)
+
+"""
+
+import select
+import threading
+import time
+
+from . import api, exceptions
+from .buffers import DEFAULT_BUFFER_SIZE, BufferPool
+
+# maximum time to wait for the remote side before checking the channel again, in ms
+POLL_INTERVAL = 100
+
+
+def _read_error(channel, action="Read"):
+    try:
+        message = api.Api.get_error_message(api.Api.ssh_channel_get_session(channel))
+    except exceptions.UnknownException:
+        message = "<error message irrecoverable>"
+    return exceptions.ChannelException("{} failed: {}".format(action, message))
+
+
+def _wait(channel, lock, deadline=None):
+    """Wait for the remote side to send something, for at most POLL_INTERVAL ms and never
+    past the deadline."""
+    interval = POLL_INTERVAL
+    if deadline is not None:
+        interval = max(0, min(interval, int((deadline - time.monotonic()) * 1000)))
+    if lock is None:
+        ret = api.Api.ssh_channel_select(
+            api.Api.new_channels([channel]),
+            api.Api.NULL,
+            api.Api.NULL,
+            api.Api.new_timeval(interval),
+        )
+        if ret == api.SSH_ERROR:
+            raise _read_error(channel)
+        return
+
+    # the session is shared with other threads: wait on its socket without holding
+    # the lock, so that they can read their own channels in the meantime
+    with lock:
+        fd = api.Api.ssh_get_fd(api.Api.ssh_channel_get_session(channel))
+        if fd < 0:
+            raise _read_error(channel)
+    select.select([fd], [], [], interval / 1000)
+
+
+def _check_deadline(channel, lock, deadline):
+    """Kill the remote process once the deadline is passed.
+
+    Raises:
+        TimeoutException: if the deadline is passed
+    """
+    if deadline is None or time.monotonic() < deadline:
+        return
+    with lock or threading.Lock():
+        # servers may not support signals, the channel is closed by the caller anyway
+        api.Api.ssh_channel_request_send_signal(channel, b"KILL")
+    raise exceptions.TimeoutException("The command did not complete in time")
+
+
+def drain(channel, buffer, size=None, lock=None, wait=True, deadline=None):
+    """Read the standard output and the standard error of a channel together, until EOF.
+
+    Both streams share the same channel window: a remote process writing a lot on one of
+    them while only the other one is read would block forever. Available data is read from
+    whichever stream has some, and the channel is waited on when none has.
+
+    Args:
+        channel: the libssh's channel instance to read from
+        buffer: the native buffer in which the data is read
+        size (int): maximum number of bytes per read, defaults to the size of the buffer
+        lock: the lock of the session, if it is shared with other threads. It is only held
+              during the libssh calls, never while waiting for data.
+        wait (bool): wait for the remote side until EOF, or stop as soon as no data is available
+        deadline (float): time.monotonic() value after which the remote process is killed,
+                          None to wait forever
+
+    Yields:
+        tuple: ``(is_stderr, count)`` after each read of ``count`` bytes in ``buffer``. The
+               content of the buffer is only valid until the next iteration.
+
+    Raises:
+        ChannelException: if an error occurred while reading the channel
+        TimeoutException: if the deadline is passed before EOF
+    """
+    size = len(buffer) if size is None else size
+    session_lock = lock or threading.Lock()
+    streams = [False, True]
+    while streams:
+        _check_deadline(channel, lock, deadline)
+        has_read = False
+        for is_stderr in list(streams):
+            with session_lock:
+                available = api.Api.ssh_channel_poll(channel, int(is_stderr))
+                if available == api.SSH_EOF:
+                    streams.remove(is_stderr)
+                    continue
+                if available < 0:
+                    raise _read_error(channel)
+                if available == 0:
+                    continue
+
+                count = api.Api.ssh_channel_read(
+                    channel, buffer, min(available, size), int(is_stderr)
+                )
+                if count < 0:
+                    raise _read_error(channel)
+            if count > 0:
+                has_read = True
+                yield is_stderr, count
+
+        if streams and not has_read:
+            if not wait:
+                return
+            with session_lock:
+                if api.Api.ssh_channel_is_eof(channel):
+                    return
+            _wait(channel, lock, deadline)
+
+
+def iter_stdin(stdin, chunk_size=DEFAULT_BUFFER_SIZE):
+    """Iterate over the data to write to the standard input of a command.
+
+    Args:
+        stdin: a bytes-like object, a binary file object or an iterable of bytes-like objects
+        chunk_size (int): size of the chunks read from file objects
+
+    Yields:
+        the chunks of data, as bytes-like objects. A chunk read from a file object is only
+        valid until the next iteration.
+    """
+    if isinstance(stdin, (bytes, bytearray, memoryview)):
+        yield stdin
+    elif hasattr(stdin, "readinto"):
+        # the same buffer is used for every chunk, as each one is written before the next
+        view = memoryview(bytearray(chunk_size))
+        count = stdin.readinto(view)
+        while count:
+            yield view[:count]
+            count = stdin.readinto(view)
+    elif hasattr(stdin, "read"):
+        chunk = stdin.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = stdin.read(chunk_size)
+    else:
+        yield from stdin
+
+
+def pump(channel, stdin, buffer, size=None, lock=None, deadline=None):
+    """Write data to the standard input of a channel, then read its outputs until EOF.
+
+    The remote process may stop reading its input until its outputs are read: the data is
+    never written beyond the window of the channel, and the available output is read after
+    each write, so that neither side waits for the other forever. EOF is sent once all the
+    data is written. If the channel is closed by the remote side meanwhile, the remaining
+    data is dropped.
+
+    Args:
+        channel: the libssh's channel instance to write to and read from
+        stdin: the data to write, see iter_stdin()
+        buffer: the native buffer in which the outputs are read
+        size (int): maximum number of bytes per read, defaults to the size of the buffer
+        lock: the lock of the session, if it is shared with other threads
+        deadline (float): time.monotonic() value after which the remote process is killed,
+                          None to wait forever
+
+    Yields:
+        tuple: ``(is_stderr, count)`` after each read of ``count`` bytes in ``buffer``, see
+               drain()
+
+    Raises:
+        ChannelException: if an error occurred while writing or reading the channel
+        TimeoutException: if the deadline is passed before EOF
+    """
+    session_lock = lock or threading.Lock()
+    closed = False
+    for chunk in iter_stdin(stdin, size or len(buffer)):
+        data = memoryview(chunk).cast("B")
+        while data and not closed:
+            count = 0
+            with session_lock:
+                closed = bool(api.Api.ssh_channel_is_closed(channel))
+                window = 0 if closed else api.Api.ssh_channel_window_size(channel)
+                if window > 0:
+                    count = min(window, len(data))
+                    count = api.Api.ssh_channel_write(
+                        channel,
+                        api.Api.from_buffer(data[:count], writable=False),
+                        count,
+                    )
+                    if count == api.SSH_ERROR:
+                        raise _read_error(channel, "Write")
+            data = data[count:]
+
+            has_read = False
+            for is_stderr, read_count in drain(
+                channel, buffer, size, lock=lock, wait=False, deadline=deadline
+            ):
+                has_read = True
+                yield is_stderr, read_count
+            if not count and not has_read and not closed:
+                _wait(channel, lock, deadline)
+        if closed:
+            break
+
+    with session_lock:
+        if not api.Api.ssh_channel_is_closed(channel):
+            api.Api.ssh_channel_send_eof(channel)
+    yield from drain(channel, buffer, size, lock=lock, deadline=deadline)
+
+
+class ResultStream:
+    def __init__(
+        self,
+        channel,
+        command,
+        chunk_size=DEFAULT_BUFFER_SIZE,
+        buffer_pool=None,
+        stats=None,
+        stdin=None,
+        deadline=None,
+    ):
+        """A ResultStream is an iterator over the output chunks of a running command.
+
+        Each item is a ``(is_stderr, chunk)`` tuple, where ``chunk`` is a non-empty ``bytes``
+        object of at most ``chunk_size`` bytes. Chunks of both streams are yielded in the
+        order they arrive. Only one chunk is held in memory at a time, whatever the size of
+        the whole output is.
+
+        The channel is closed as soon as the stream is exhausted or explicitly closed.
+
+        Args:
+            channel (Channel): the channel in which the command is running
+            command (str): the command that is being run
+            chunk_size (int): maximum size of the chunks to read
+            buffer_pool (BufferPool): pool in which the read buffer is taken
+            stats (CommandStats): the stats in which the output is measured, if any
+            stdin: optional data to write to the standard input of the command, see
+                   iter_stdin() for the accepted types. It is written as the stream is
+                   iterated over.
+            deadline (float): time.monotonic() value after which the command is killed and
+                              TimeoutException raised by the iteration, None for no limit
+        """
+        if chunk_size <= 0:
+            raise ValueError(
+                "Chunk size must be positive but received '{}'".format(chunk_size)
+            )
+        self._channel = channel
+        self._command = command
+        self._chunk_size = chunk_size
+        self._buffer_pool = buffer_pool or BufferPool(capacity=0)
+        self._buffer = None
+        self._stats = stats
+        self._stdin = stdin
+        self._deadline = deadline
+        self._return_code = None
+        self._closed = False
+        self._chunks = self._read_chunks()
+
+    def _read_chunks(self):
+        self._buffer = self._buffer_pool.acquire(self._chunk_size)
+        channel = self._channel._channel
+        lock = self._channel._session_lock
+        if self._stdin is None:
+            outputs = drain(
+                channel,
+                self._buffer,
+                self._chunk_size,
+                lock=lock,
+                deadline=self._deadline,
+            )
+        else:
+            outputs = pump(
+                channel,
+                self._stdin,
+                self._buffer,
+                self._chunk_size,
+                lock=lock,
+                deadline=self._deadline,
+            )
+        try:
+            for is_stderr, count in outputs:
+                if self._stats:
+                    self._stats.received(is_stderr, count)
+                yield is_stderr, api.Api.to_bytes(self._buffer, count)
+            with self._channel._lock:
+                self._return_code = api.Api.ssh_channel_get_exit_status(channel)
+        except Exception as error:
+            if self._stats:
+                self._stats.finish(error)
+            self.close()
+            raise
+        if self._stats:
+            self._stats.finish()
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        return next(self._chunks)
+
+    def iter_lines(self):
+        """Iterate over the output line by line.
+
+        Lines are split on ``b"\\n"``, which is kept at the end of each line. A last line
+        without a trailing newline is yielded once the output is over. A line longer than
+        the chunk size is yielded in several parts of the chunk size, so that memory stays
+        bounded whatever the output is.
+
+        Yields:
+            tuple: ``(is_stderr, line)`` where ``line`` is a ``bytes`` object
+        """
+        pending = {False: bytearray(), True: bytearray()}
+        for is_stderr, chunk in self:
+            line = pending[is_stderr]
+            start = 0
+            end = chunk.find(b"\n")
+            while end != -1:
+                stop = end + 1
+                line += chunk[start:stop]
+                yield is_stderr, bytes(line)
+                del line[:]
+                start = stop
+                end = chunk.find(b"\n", start)
+            line += chunk[start:]
+            while len(line) > self._chunk_size:
+                yield is_stderr, bytes(line[: self._chunk_size])
+                del line[: self._chunk_size]
+        for is_stderr in (False, True):
+            if pending[is_stderr]:
+                yield is_stderr, bytes(pending[is_stderr])
+
+    def close(self):
+        """Stop reading the output and close the channel."""
+        if not self._closed:
+            self._closed = True
+            self._channel.close()
+            if self._buffer is not None:
+                self._buffer_pool.release(self._buffer)
+                self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def command(self):
+        """The command from wich the current output comes from."""
+        return self._command
+
+    @property
+    def closed(self):
+        """Whether or not the stream is over."""
+        return self._closed
+
+    @property
+    def return_code(self):
+        """The return code of the command as an int, or None until the stream is exhausted."""
+        return self._return_code
+
+    @property
+    def stats(self):
+        """The CommandStats of the command, or None if the session is not instrumented."""
+        return self._stats
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+"""Tasks drive libssh operations in nonblocking mode.
+
+A task never blocks: each call to its step() method makes as much progress as
+possible and returns. A TaskRunner steps a set of tasks until none of them can
+progress anymore, at which point the caller should wait for the sockets of the
+sessions to be ready before running them again. This is the building block of
+the asynchronous front-ends of pystassh.
+"""
+
+import time
+
+from . import api, exceptions
+from .buffers import DEFAULT_BUFFER_SIZE, BufferPool
+from .output import OutputCollector, map_output
+from .result import Result
+from .stats import CommandStats, ConnectStats, new_stats
+from .stream import POLL_INTERVAL, _read_error, iter_stdin
+
+
+class Task:
+    def __init__(self):
+        """A Task is a libssh operation run in nonblocking mode, one step at a time."""
+        self.done = False
+        self.result = None
+        self.paused = False
+        self.handle = None
+        self._step = None
+
+    def step(self):
+        """Make as much progress as possible without blocking.
+
+        Resources held by the task are released if an error occurs.
+
+        Returns:
+            bool: whether or not some progress was made
+        """
+        try:
+            return self._step()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        """Release the resources held by the task."""
+        pass
+
+
+class ConnectTask(Task):
+    def __init__(self, session):
+        """Connect and authenticate a Session in nonblocking mode.
+
+        The libssh's session instance is left in nonblocking mode once connected.
+
+        Args:
+            session (Session): the session to connect
+        """
+        super().__init__()
+        self._session = session
+        self._key = None
+        self._stats = new_stats(
+            session._instrument, ConnectStats, session._hostname.decode()
+        )
+        session._connect_stats = self._stats
+        self._step = self._start
+
+    def step(self):
+        try:
+            return super().step()
+        except Exception as error:
+            if self._stats:
+                self._stats.finish(error)
+            raise
+
+    def _start(self):
+        self.handle = self._session._new_session()
+        api.Api.ssh_set_blocking(self.handle, 0)
+        if self._stats:
+            self._stats.mark("setup_time")
+        self._step = self._connect
+        return True
+
+    def _connect(self):
+        ret = api.Api.ssh_connect(self.handle)
+        if ret == api.SSH_AGAIN:
+            return False
+        self._session._check_connect(ret, self.handle)
+        if self._stats:
+            self._stats.mark("handshake_time")
+        self._key = self._session._import_key(self.handle)
+        self._step = self._authenticate
+        return True
+
+    def _authenticate(self):
+        ret = self._session._userauth(self.handle, self._key)
+        if ret == api.SSH_AUTH_AGAIN:
+            return False
+        self._free_key()
+        self._session._check_userauth(ret, self.handle)
+        self._session._attach(self.handle)
+        if self._stats:
+            self._stats.mark("auth_time")
+            self._stats.finish()
+        self.done = True
+        return True
+
+    def _free_key(self):
+        self._session._release_key(self._key)
+        self._key = None
+
+    def close(self):
+        self._free_key()
+        if not self.done and self.handle is not None:
+            api.Api.ssh_free(self.handle)
+            self.handle = None
+
+
+class CommandTask(Task):
+    def __init__(
+        self,
+        handle,
+        command,
+        buffer_pool=None,
+        on_output=None,
+        instrument=False,
+        stdin=None,
+        limits=None,
+        deadline=None,
+    ):
+        """Run a command in a new channel of a nonblocking session.
+
+        Once done, ``result`` holds the Result object of the command. If ``on_output`` is
+        given, it is called with each ``(is_stderr, chunk)`` as it is read, and the output
+        is not kept in the Result.
+
+        Args:
+            handle: the libssh's session instance, in nonblocking mode
+            command (str): the command to run
+            buffer_pool (BufferPool): pool in which the read buffer is taken
+            on_output (callable): optional callback receiving the output chunks
+            instrument: True to collect the CommandStats of the command, or a callable
+                        receiving them once complete
+            stdin: optional data to write to the standard input of the command, see
+                   stream.iter_stdin() for the accepted types. It is written within the
+                   window of the channel as the output is read, then EOF is sent.
+            limits (OutputLimits): limits on the outputs kept in the Result, none by default
+            deadline (float): time.monotonic() value after which the command is killed and
+                              a TimeoutException raised, None to wait for it forever
+        """
+        super().__init__()
+        self.handle = handle
+        self._command = command
+        self._buffer_pool = buffer_pool or BufferPool(capacity=0)
+        self._on_output = on_output
+        self._channel = None
+        self._buffer = None
+        self._streams = [False, True]
+        self._contents = [
+            OutputCollector(limits, "standard output"),
+            OutputCollector(limits, "standard error"),
+        ]
+        self._stdin = None if stdin is None else iter_stdin(stdin, DEFAULT_BUFFER_SIZE)
+        self._data = memoryview(b"")
+        self._deadline = deadline
+        self._stats = new_stats(instrument, CommandStats, command)
+        self._step = self._open
+
+    def step(self):
+        try:
+            return super().step()
+        except Exception as error:
+            if self._stats:
+                self._stats.finish(error)
+            raise
+
+    def _error_message(self):
+        try:
+            return api.Api.get_error_message(self.handle)
+        except exceptions.UnknownException:
+            return "<error message irrecoverable>"
+
+    def _open(self):
+        if self._channel is None:
+            channel = api.Api.ssh_channel_new(self.handle)
+            if not channel:
+                raise exceptions.ChannelException(
+                    "Channel cannot be created: {}".format(self._error_message())
+                )
+            self._channel = channel
+
+        ret = api.Api.ssh_channel_open_session(self._channel)
+        if ret == api.SSH_AGAIN:
+            return False
+        if ret != api.SSH_OK:
+            raise exceptions.ChannelException(
+                "Channel cannot be opened: {}".format(self._error_message())
+            )
+        if self._stats:
+            self._stats.mark("channel_open_time")
+        self._step = self._exec
+        return True
+
+    def _exec(self):
+        ret = api.Api.ssh_channel_request_exec(self._channel, str.encode(self._command))
+        if ret == api.SSH_AGAIN:
+            return False
+        if ret != api.SSH_OK:
+            raise exceptions.ChannelException(
+                "Command cannot be executed (return code: {}): {}".format(
+                    self._command, self._error_message()
+                )
+            )
+        if self._stats:
+            self._stats.mark("exec_time")
+        self._buffer = self._buffer_pool.acquire()
+        self._step = self._read
+        return True
+
+    def _check_deadline(self):
+        if self._deadline is None or time.monotonic() < self._deadline:
+            return
+        # servers may not support signals, the channel is closed anyway
+        api.Api.ssh_channel_request_send_signal(self._channel, b"KILL")
+        raise exceptions.TimeoutException(
+            "The command did not complete in time",
+            stdout=map_output(self._contents[False].getvalue()),
+            stderr=map_output(self._contents[True].getvalue()),
+        )
+
+    def _write(self):
+        """Write the standard input within the window of the channel, without blocking.
+
+        Returns:
+            bool: whether or not some data was written
+        """
+        has_written = False
+        while self._stdin is not None:
+            if not self._data:
+                chunk = next(self._stdin, None)
+                if chunk is None:
+                    api.Api.ssh_channel_send_eof(self._channel)
+                    self._stdin = None
+                    return True
+                self._data = memoryview(chunk).cast("B")
+                continue
+
+            if api.Api.ssh_channel_is_closed(self._channel):
+                # the remote side does not read its input anymore, the rest is dropped
+                self._stdin = None
+                self._data = memoryview(b"")
+                return has_written
+            count = min(api.Api.ssh_channel_window_size(self._channel), len(self._data))
+            if count <= 0:
+                return has_written
+            count = api.Api.ssh_channel_write(
+                self._channel,
+                api.Api.from_buffer(self._data[:count], writable=False),
+                count,
+            )
+            if count == api.SSH_ERROR:
+                raise _read_error(self._channel, "Write")
+            if count <= 0:
+                return has_written
+            self._data = self._data[count:]
+            has_written = True
+        return has_written
+
+    def _read(self):
+        self._check_deadline()
+        if self.paused:
+            return False
+
+        has_read = self._write()
+        for is_stderr in list(self._streams):
+            available = api.Api.ssh_channel_poll(self._channel, int(is_stderr))
+            if available == api.SSH_EOF:
+                self._streams.remove(is_stderr)
+                continue
+            if available < 0:
+                raise _read_error(self._channel)
+            if available == 0:
+                continue
+
+            count = api.Api.ssh_channel_read_nonblocking(
+                self._channel,
+                self._buffer,
+                min(available, len(self._buffer)),
+                int(is_stderr),
+            )
+            if count == api.SSH_EOF:
+                self._streams.remove(is_stderr)
+            elif count < 0:
+                raise _read_error(self._channel)
+            elif count > 0:
+                has_read = True
+                self._output(is_stderr, count)
+
+        if self._streams:
+            return has_read
+        self._buffer_pool.release(self._buffer)
+        self._buffer = None
+        self._step = self._exit_status
+        return True
+
+    def _output(self, is_stderr, count):
+        if self._stats:
+            self._stats.received(is_stderr, count)
+        if self._on_output is None:
+            self._contents[is_stderr].write(api.Api.to_buffer(self._buffer, count))
+        else:
+            self._on_output(is_stderr, api.Api.to_bytes(self._buffer, count))
+
+    def _exit_status(self):
+        # the exit status may be sent by the server after the EOF: it is final
+        # once received, or once the channel has been closed by the server
+        return_code = api.Api.ssh_channel_get_exit_status(self._channel)
+        if return_code < 0 and not api.Api.ssh_channel_is_closed(self._channel):
+            self._check_deadline()
+            return False
+
+        if self._stats:
+            self._stats.finish()
+        stdout, stderr = self._contents
+        self.result = Result.from_output(
+            self._command,
+            map_output(stdout.getvalue()),
+            map_output(stderr.getvalue()),
+            return_code,
+            stats=self._stats,
+            truncated=stdout.truncated or stderr.truncated,
+        )
+        self._contents = None
+        self.close()
+        self.done = True
+        return True
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer_pool.release(self._buffer)
+            self._buffer = None
+        if self._channel is not None:
+            api.Api.ssh_channel_send_eof(self._channel)
+            api.Api.ssh_channel_free(self._channel)
+            self._channel = None
+
+
+class TaskRunner:
+    def __init__(self):
+        """A TaskRunner steps a set of tasks until none of them can make progress."""
+        self._tasks = []
+        self._last_run = float("-inf")
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, task, callback):
+        """Add a task to run.
+
+        Args:
+            task (Task): the task to run
+            callback (callable): called with ``(task, error)`` once the task is over, where
+                                 ``error`` is the exception raised by the task or None
+        """
+        self._tasks.append((task, callback))
+
+    def cancel(self, task):
+        """Stop running a task and release its resources.
+
+        The callback of the task is called with a PystasshException.
+        """
+        for entry in list(self._tasks):
+            if entry[0] is task:
+                self._tasks.remove(entry)
+                self._cancel(*entry)
+
+    def cancel_all(self):
+        """Stop running all the tasks and release their resources."""
+        entries, self._tasks = self._tasks, []
+        for entry in entries:
+            self._cancel(*entry)
+
+    def _cancel(self, task, callback):
+        task.close()
+        callback(task, exceptions.PystasshException("The task was cancelled"))
+
+    def run(self):
+        """Step all the tasks until none of them can make progress."""
+        self._last_run = time.monotonic()
+        has_progressed = True
+        while has_progressed:
+            has_progressed = False
+            for entry in list(self._tasks):
+                # a callback may have cancelled the task meanwhile
+                if entry not in self._tasks:
+                    continue
+                task, callback = entry
+                try:
+                    has_progressed = task.step() or has_progressed
+                except Exception as error:
+                    self._tasks.remove(entry)
+                    callback(task, error)
+                    continue
+                if task.done:
+                    self._tasks.remove(entry)
+                    callback(task, None)
+
+    def waiting_sockets(self):
+        """The sockets to wait for before running the tasks again.
+
+        Paused tasks are not taken into account.
+
+        Returns:
+            list: ``(fd, wants_write)`` tuples, one per libssh's session instance
+        """
+        sockets = {}
+        for task, _ in self._tasks:
+            if task.paused or task.handle is None:
+                continue
+            fd = api.Api.ssh_get_fd(task.handle)
+            if fd < 0:
+                continue
+            flags = api.Api.ssh_get_poll_flags(task.handle)
+            sockets[fd] = sockets.get(fd, False) or bool(flags & api.SSH_WRITE_PENDING)
+        return list(sockets.items())
+
+    def poll_deadline(self):
+        """The time at which the tasks must be run again, even if their sockets are not ready.
+
+        Data may already be waiting in the libssh's buffers, in which case the sockets do
+        not become ready: the tasks are run again POLL_INTERVAL ms after their last run
+        whatever happens.
+
+        Returns:
+            float: a time.monotonic() value
+        """
+        return self._last_run + POLL_INTERVAL / 1000
+
+    def poll_timeout(self):
+        """The number of seconds to wait for the sockets before running the tasks again, see
+        poll_deadline().
+
+        Returns:
+            float: the timeout, 0 if the tasks must be run now
+        """
+        return max(0.0, self.poll_deadline() - time.monotonic())
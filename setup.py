@@ -1,13 +1,41 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 
 from setuptools import find_packages, setup
+from setuptools.command.build_ext import build_ext
 
 current_directory = os.path.abspath(os.path.dirname(__file__))
 with open(os.path.join(current_directory, "README.md")) as f:
     long_description = f.read()
 
+
+class OptionalBuildExt(build_ext):
+    """Build the compiled module if possible, pystassh falls back to the ABI mode otherwise."""
+
+    def run(self):
+        try:
+            super().run()
+        except Exception as e:
+            self._warn(e)
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except Exception as e:
+            self._warn(e)
+
+    def _warn(self, error):
+        if getattr(self, "_warned", False):
+            return
+        self._warned = True
+        sys.stderr.write(
+            "WARNING: the compiled module of pystassh could not be built ({}), "
+            "libssh will be loaded in ABI mode\n".format(error)
+        )
+
+
 setup(
     name="pystassh",
     version="1.2.2",
@@ -20,4 +48,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     install_requires=["cffi"],
+    setup_requires=["cffi"],
+    cffi_modules=["pystassh/_build_ffi.py:ffibuilder"],
+    cmdclass={"build_ext": OptionalBuildExt},
 )
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import pystassh.api
+import pystassh.keys
+
+
+class FakeRemote:
+    def __init__(self, stdout=(), stderr=(), window=None, stdin_window=None):
+        """Simulate the output of a remote command on a libssh channel.
+
+        The remote sends its stdout and stderr chunks alternately, but never more than
+        ``window`` bytes can be waiting to be read, like with a real SSH channel.
+
+        If ``stdin_window`` is given, the remote behaves like ``cat``: it sends back on its
+        standard output what is written to its standard input, until EOF is sent. It stops
+        reading its input while ``stdin_window`` bytes are waiting to be sent.
+
+        Args:
+            stdout (list): chunks sent on the standard output
+            stderr (list): chunks sent on the standard error
+            window (int): maximum number of bytes that can wait to be read
+            stdin_window (int): maximum number of bytes that can wait to be sent back
+        """
+        self.pending = {False: list(stdout), True: list(stderr)}
+        self.received = {False: bytearray(), True: bytearray()}
+        self.window = window
+        self.stdin_window = stdin_window
+        self.stdin = bytearray()
+        self.stdin_eof = stdin_window is None
+        self.closed = False
+        self.signals = []
+
+    @property
+    def eof(self):
+        return (
+            not self.pending[False]
+            and not self.pending[True]
+            and (self.stdin_eof or self.closed)
+        )
+
+    def _receive(self):
+        for is_stderr in (False, True):
+            if not self.pending[is_stderr]:
+                continue
+            chunk = self.pending[is_stderr][0]
+            waiting = len(self.received[False]) + len(self.received[True])
+            if self.window is not None and waiting + len(chunk) > self.window:
+                continue
+            self.received[is_stderr] += self.pending[is_stderr].pop(0)
+
+    def ssh_channel_poll(self, _, is_stderr):
+        self._receive()
+        received = self.received[bool(is_stderr)]
+        if not received and self.eof:
+            return pystassh.api.SSH_EOF
+        return len(received)
+
+    def ssh_channel_read(self, _, buffer, size, is_stderr):
+        self._receive()
+        received = self.received[bool(is_stderr)]
+        if not received:
+            if self.eof:
+                return 0
+            raise AssertionError("This read would block")
+        count = min(size, len(received))
+        buffer[0:count] = bytes(received[:count])
+        del received[:count]
+        return count
+
+    def ssh_channel_read_nonblocking(self, _, buffer, size, is_stderr):
+        self._receive()
+        received = self.received[bool(is_stderr)]
+        if not received:
+            return pystassh.api.SSH_EOF if self.eof else 0
+        return self.ssh_channel_read(_, buffer, size, is_stderr)
+
+    def ssh_channel_select(self, *_):
+        self._receive()
+        return pystassh.api.SSH_OK
+
+    def ssh_channel_is_eof(self, _):
+        return self.eof and not self.received[False] and not self.received[True]
+
+    def ssh_channel_window_size(self, _):
+        waiting = sum(len(chunk) for chunk in self.pending[False])
+        return max(0, self.stdin_window - waiting)
+
+    def ssh_channel_write(self, channel, data, size):
+        if self.closed or self.stdin_eof:
+            return pystassh.api.SSH_ERROR
+        if size > self.ssh_channel_window_size(channel):
+            raise AssertionError("This write would block")
+        data = pystassh.api.Api.to_bytes(data, size)
+        self.stdin += data
+        self.pending[False].append(data)
+        return size
+
+    def ssh_channel_send_eof(self, _):
+        self.stdin_eof = True
+        return pystassh.api.SSH_OK
+
+    def ssh_channel_is_closed(self, _):
+        return int(self.closed)
+
+    def ssh_channel_request_send_signal(self, _, signal):
+        self.signals.append(signal)
+        return pystassh.api.SSH_OK
+
+
+@pytest.fixture()
+def fake_remote(monkeypatch):
+    """Install a FakeRemote in place of the libssh's channel reads."""
+
+    def _fake_remote(stdout=(), stderr=(), window=None, stdin_window=None):
+        remote = FakeRemote(stdout, stderr, window, stdin_window)
+        names = [
+            "ssh_channel_poll",
+            "ssh_channel_read",
+            "ssh_channel_read_nonblocking",
+            "ssh_channel_select",
+            "ssh_channel_is_eof",
+            "ssh_channel_request_send_signal",
+        ]
+        if stdin_window is not None:
+            names += [
+                "ssh_channel_window_size",
+                "ssh_channel_write",
+                "ssh_channel_send_eof",
+                "ssh_channel_is_closed",
+            ]
+        for name in names:
+            monkeypatch.setattr(
+                "pystassh.api.Api.{}".format(name), getattr(remote, name)
+            )
+        monkeypatch.setattr("pystassh.api.Api.new_channels", list)
+        return remote
+
+    return _fake_remote
+
+
+@pytest.fixture(autouse=True)
+def key_cache(monkeypatch):
+    """Give each test its own process-level cache of private keys."""
+    cache = pystassh.keys.KeyCache()
+    monkeypatch.setattr("pystassh.keys.default_cache", cache)
+    return cache
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.aio import AsyncChannel, AsyncResultStream, AsyncSession
+from pystassh.output import ABORT, OutputLimits
+
+
+@pytest.fixture()
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture()
+def session(monkeypatch, loop):
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_options_set", lambda *_: pystassh.api.SSH_OK
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_set_blocking", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", Mock(return_value=-1))
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_poll_flags", Mock(return_value=0))
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect",
+        Mock(side_effect=[pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK]),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_autopubkey",
+        Mock(return_value=pystassh.api.SSH_AUTH_SUCCESS),
+    )
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_new", Mock(return_value="<channel object>")
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=17)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_free", Mock())
+
+    session = AsyncSession(loop=loop)
+    yield session
+    session._session = None
+
+
+def test_async_session_connect(loop, session):
+    assert session.is_connected() is False
+    loop.run_until_complete(session.connect())
+    assert session.is_connected() is True
+    assert isinstance(session.channel, AsyncChannel)
+    assert pystassh.api.Api.ssh_connect.call_count == 2
+
+    loop.run_until_complete(session.connect())
+    assert pystassh.api.Api.ssh_connect.call_count == 2
+
+
+def test_async_session_connect_error(monkeypatch, loop, session):
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", Mock(return_value=-1))
+    with pytest.raises(pystassh.exceptions.ConnectionException):
+        loop.run_until_complete(session.connect())
+    assert session.is_connected() is False
+    pystassh.api.Api.ssh_free.assert_called_once_with("<session object>")
+
+
+def test_async_session_with_block(loop, session, fake_remote):
+    fake_remote(stdout=[b"foo\n"])
+
+    async def _run():
+        async with session:
+            assert session.is_connected()
+            return await session.execute("ls")
+
+    result = loop.run_until_complete(_run())
+    assert result.stdout == "foo"
+    assert result.return_code == 17
+    assert session.is_connected() is False
+
+    with pytest.raises(TypeError):
+        with session:
+            pass
+
+
+def test_async_session_blocking_methods(loop, session):
+    loop.run_until_complete(session.connect())
+    for name, args in [
+        ("open_channel", ()),
+        ("execute_batch", (["ls"],)),
+        ("iter_execute_batch", (["ls"],)),
+        ("execute_pipelined", (["ls"],)),
+        ("iter_execute_pipelined", (["ls"],)),
+        ("open_sftp", ()),
+        ("upload", ("foo", "bar")),
+        ("download", ("foo", "bar")),
+    ]:
+        with pytest.raises(TypeError):
+            getattr(session, name)(*args)
+
+
+def test_async_session_execute(loop, session, fake_remote):
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        loop.run_until_complete(session.execute("ls"))
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.execute_stream("ls")
+
+    loop.run_until_complete(session.connect())
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+
+    result = loop.run_until_complete(session.execute("ls"))
+    assert result.command == "ls"
+    assert result.raw_stdout == b"foobar"
+    assert result.raw_stderr == b"baz"
+    assert result.return_code == 17
+    assert len(session._runner) == 0
+
+
+def test_async_session_execute_options(loop, session, fake_remote):
+    loop.run_until_complete(session.connect())
+    fake_remote(stderr=[b"error"], stdin_window=4)
+
+    result = loop.run_until_complete(
+        session.execute("cat", stdin=[b"foo", b"bar"], limits=OutputLimits(max_bytes=5))
+    )
+    assert result.raw_stdout == b"fooba"
+    assert result.raw_stderr == b"error"
+    assert result.truncated
+
+    remote = fake_remote(stdout=[b"foo"], stdin_window=1000)
+    with pytest.raises(pystassh.exceptions.TimeoutException) as error:
+        loop.run_until_complete(session.execute("cat", timeout=0.05))
+    assert error.value.stdout == b"foo"
+    assert remote.signals == [b"KILL"]
+
+    fake_remote(stdout=[b"foo"])
+    with pytest.raises(pystassh.exceptions.OutputLimitException):
+        loop.run_until_complete(
+            session.execute("ls", limits=OutputLimits(max_bytes=2, overflow=ABORT))
+        )
+    assert len(session._runner) == 0
+
+
+def test_async_session_execute_concurrently(loop, session, fake_remote):
+    loop.run_until_complete(session.connect())
+    fake_remote()
+
+    async def _run():
+        return await asyncio.gather(*(session.execute(str(i)) for i in range(10)))
+
+    results = loop.run_until_complete(_run())
+    assert [result.command for result in results] == [str(i) for i in range(10)]
+    assert pystassh.api.Api.ssh_channel_free.call_count == 10
+
+
+def test_async_session_execute_waits_for_the_socket(
+    monkeypatch, loop, session, fake_remote
+):
+    loop.run_until_complete(session.connect())
+    fake_remote(stdout=[b"foo"])
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", Mock(return_value=42))
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_get_poll_flags",
+        Mock(return_value=pystassh.api.SSH_WRITE_PENDING),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(side_effect=[pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK]),
+    )
+    loop.add_reader = Mock()
+    loop.remove_reader = Mock()
+    loop.add_writer = Mock()
+    loop.remove_writer = Mock()
+
+    result = loop.run_until_complete(session.execute("ls"))
+    assert result.raw_stdout == b"foo"
+    loop.add_reader.assert_called_with(42, session._drive)
+    loop.add_writer.assert_called_with(42, session._drive)
+    loop.remove_reader.assert_called_once_with(42)
+    loop.remove_writer.assert_called_once_with(42)
+
+
+def test_async_session_disconnect_cancels_commands(monkeypatch, loop, session):
+    loop.run_until_complete(session.connect())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_AGAIN),
+    )
+
+    async def _run():
+        future = asyncio.ensure_future(session.execute("ls"))
+        await asyncio.sleep(0)
+        session.disconnect()
+        return await future
+
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        loop.run_until_complete(_run())
+    assert len(session._runner) == 0
+    pystassh.api.Api.ssh_channel_free.assert_called_once_with("<channel object>")
+
+
+def test_async_session_cancelled_command(monkeypatch, loop, session):
+    loop.run_until_complete(session.connect())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_AGAIN),
+    )
+
+    async def _run():
+        await asyncio.wait_for(session.execute("ls"), 0.01)
+
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(_run())
+    loop.run_until_complete(asyncio.sleep(0))
+    assert len(session._runner) == 0
+    assert session._timer is None
+    pystassh.api.Api.ssh_channel_free.assert_called_once_with("<channel object>")
+
+
+def test_async_result_stream(loop, session, fake_remote):
+    loop.run_until_complete(session.connect())
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+
+    async def _run():
+        chunks = []
+        async with session.execute_stream("ls") as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+        return stream, chunks
+
+    stream, chunks = loop.run_until_complete(_run())
+    assert chunks == [(False, b"foo"), (True, b"baz"), (False, b"bar")]
+    assert stream.command == "ls"
+    assert stream.return_code == 17
+
+
+def test_async_result_stream_pauses(loop, session, fake_remote):
+    loop.run_until_complete(session.connect())
+    fake_remote(stdout=[b"x"] * 10)
+
+    with pytest.raises(ValueError):
+        AsyncResultStream(session.channel, "ls", max_pending=0)
+
+    async def _run():
+        stream = session.execute_stream("ls", max_pending=2)
+        await asyncio.sleep(0.01)
+        assert len(stream._chunks) == 2
+        assert stream._task.paused is True
+        return [chunk async for chunk in stream]
+
+    chunks = loop.run_until_complete(_run())
+    assert all(is_stderr is False for is_stderr, _ in chunks)
+    assert b"".join(chunk for _, chunk in chunks) == b"x" * 10
+
+
+def test_async_result_stream_error(monkeypatch, loop, session):
+    loop.run_until_complete(session.connect())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec", Mock(return_value=-1)
+    )
+
+    async def _run():
+        async for _ in session.execute_stream("ls"):
+            pass
+
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        loop.run_until_complete(_run())
+
+
+def test_async_result_stream_close(monkeypatch, loop, session, fake_remote):
+    loop.run_until_complete(session.connect())
+    fake_remote(stdout=[b"foo"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_AGAIN),
+    )
+
+    async def _run():
+        stream = session.execute_stream("ls")
+        stream.close()
+        return [chunk async for chunk in stream]
+
+    assert loop.run_until_complete(_run()) == []
+    assert len(session._runner) == 0
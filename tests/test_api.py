@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import subprocess
+import sys
+import types
 from unittest.mock import Mock
 
 import cffi.model
@@ -21,17 +24,120 @@ def test_api_getattr():
 
 
 def test_init_api(monkeypatch):
+    # without the compiled module, libssh is loaded in ABI mode
+    monkeypatch.setitem(sys.modules, "pystassh._pystassh_ffi", None)
     monkeypatch.setattr("ctypes.util.find_library", Mock(return_value=None))
+    monkeypatch.setattr("pystassh.api._resolved_path", None)
 
     with pytest.raises(pystassh.exceptions.PystasshException):
         pystassh.api._init_api()
 
 
+def test_init_api_compiled_module(monkeypatch):
+    compiled_module = types.ModuleType("pystassh._pystassh_ffi")
+    compiled_module.ffi, compiled_module.lib = "<ffi object>", "<lib object>"
+    monkeypatch.setitem(sys.modules, "pystassh._pystassh_ffi", compiled_module)
+    monkeypatch.setattr("ctypes.util.find_library", Mock(return_value=None))
+
+    assert pystassh.api._init_api() == ("<ffi object>", "<lib object>")
+
+
+def test_library_path(monkeypatch):
+    fake_find_library = Mock(return_value="libssh.so.4")
+    monkeypatch.setattr("ctypes.util.find_library", fake_find_library)
+    monkeypatch.setattr("pystassh.api._resolved_path", None)
+    monkeypatch.delenv(pystassh.api.LIBRARY_PATH_ENV, raising=False)
+
+    assert pystassh.api.library_path() == "libssh.so.4"
+    assert pystassh.api.library_path() == "libssh.so.4"
+    fake_find_library.assert_called_once_with("ssh")
+
+    monkeypatch.setattr("pystassh.api._resolved_path", None)
+    monkeypatch.setenv(pystassh.api.LIBRARY_PATH_ENV, "/opt/libssh.so")
+    assert pystassh.api.library_path() == "/opt/libssh.so"
+
+    monkeypatch.setattr("pystassh.api._resolved_path", None)
+    monkeypatch.setattr("pystassh.api._configured_path", "/usr/lib/libssh.so")
+    assert pystassh.api.library_path() == "/usr/lib/libssh.so"
+    fake_find_library.assert_called_once_with("ssh")
+
+
+def test_init_api_explicit_path(monkeypatch):
+    # an explicit path is loaded in ABI mode, even if the compiled module is built
+    compiled_module = types.ModuleType("pystassh._pystassh_ffi")
+    compiled_module.ffi, compiled_module.lib = "<ffi object>", "<lib object>"
+    monkeypatch.setitem(sys.modules, "pystassh._pystassh_ffi", compiled_module)
+    monkeypatch.setattr("pystassh.api._configured_path", "/opt/libssh.so")
+    monkeypatch.setattr("pystassh.api._resolved_path", None)
+
+    with pytest.raises(OSError):
+        pystassh.api._init_api()
+
+
+def test_configure(monkeypatch):
+    pystassh.api.Api.lib  # make sure libssh is loaded
+    assert pystassh.api.is_loaded()
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        pystassh.api.configure("/opt/libssh.so")
+
+    monkeypatch.delattr(pystassh.api.Api, "lib")
+    monkeypatch.setattr("pystassh.api._configured_path", None)
+    monkeypatch.setattr("pystassh.api._resolved_path", "libssh.so.4")
+    assert not pystassh.api.is_loaded()
+    pystassh.api.configure("/opt/libssh.so")
+    assert pystassh.api.library_path() == "/opt/libssh.so"
+
+
+def test_import_does_not_load_libssh():
+    # importing pystassh must stay cheap: libssh is searched for and loaded on first use
+    code = "\n".join(
+        [
+            "import ctypes.util, sys, time",
+            "ctypes.util.find_library = None",
+            "start = time.perf_counter()",
+            "import pystassh, pystassh.pool, pystassh.fleet",
+            "print(time.perf_counter() - start)",
+            "assert not pystassh.api.is_loaded()",
+            "assert 'cffi' not in sys.modules",
+        ]
+    )
+    output = subprocess.check_output([sys.executable, "-c", code])
+    assert float(output) < 1
+
+
 def test_api_to_string(monkeypatch):
     s = cffi.FFI().new("char[]", b"foo")
     assert pystassh.api.Api.to_string(s) == b"foo"
 
 
+def test_api_to_bytes():
+    s = cffi.FFI().new("char[]", b"foo\x00bar\x00baz")
+    assert pystassh.api.Api.to_bytes(s, 7) == b"foo\x00bar"
+    assert pystassh.api.Api.to_bytes(s, 0) == b""
+    assert bytes(pystassh.api.Api.to_buffer(s, 5)) == b"foo\x00b"
+
+
+def test_api_from_buffer():
+    buffer = bytearray(4)
+    chars = pystassh.api.Api.from_buffer(buffer)
+    chars[1] = b"x"
+    assert buffer == b"\x00x\x00\x00"
+
+    with pytest.raises(BufferError):
+        pystassh.api.Api.from_buffer(b"foo")
+
+
+def test_api_new_channels():
+    channels = pystassh.api.Api.new_channels([pystassh.api.Api.NULL] * 2)
+    assert len(channels) == 3
+    assert channels[2] == pystassh.api.Api.NULL
+
+
+def test_api_new_timeval():
+    timeval = pystassh.api.Api.new_timeval(2500)
+    assert (timeval.tv_sec, timeval.tv_usec) == (2, 500000)
+
+
 def test_api_get_error_message(monkeypatch):
     monkeypatch.setattr("pystassh.api.Api.ssh_get_error", Mock(side_effect=ValueError))
     with pytest.raises(pystassh.exceptions.UnknownException):
@@ -40,3 +146,55 @@ def test_api_get_error_message(monkeypatch):
     error = cffi.FFI().new("char[]", b"foo")
     monkeypatch.setattr("pystassh.api.Api.ssh_get_error", Mock(return_value=error))
     assert pystassh.api.Api.get_error_message("<session object>") == b"foo"
+
+
+def test_api_bind(monkeypatch):
+    class FakeLib:
+        ssh_foo = "<ssh_foo function>"
+        ssh_patched = "<ssh_patched function>"
+        other = "<other object>"
+
+        @property
+        def ssh_missing(self):
+            raise AttributeError("function/symbol 'ssh_missing' not found in library")
+
+    class FakeApi(metaclass=pystassh.api.ApiMetaclass):
+        ssh_patched = "<fake function>"
+
+    monkeypatch.setattr("pystassh.api._init_api", lambda: (cffi.FFI(), FakeLib()))
+    assert not hasattr(FakeApi, "__wrapped__")
+    assert "lib" not in FakeApi.__dict__
+
+    assert FakeApi.ssh_foo == "<ssh_foo function>"
+    assert FakeApi.__dict__["ssh_foo"] == "<ssh_foo function>"
+    assert FakeApi.ssh_patched == "<fake function>"
+    assert "other" not in FakeApi.__dict__
+    assert "ssh_missing" not in FakeApi.__dict__
+    with pytest.raises(AttributeError):
+        FakeApi.ssh_missing
+
+
+def test_api_bound_functions_can_be_patched(monkeypatch):
+    function = pystassh.api.Api.ssh_channel_read
+    assert pystassh.api.Api.__dict__["ssh_channel_read"] is function
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_read", "<fake function>")
+    assert pystassh.api.Api.ssh_channel_read == "<fake function>"
+    monkeypatch.undo()
+    assert pystassh.api.Api.ssh_channel_read is function
+
+
+def test_api_has_sftp_aio(monkeypatch):
+    class FakeLib:
+        PYSTASSH_SFTP_AIO = 0
+
+    # compiled module: decided by the version of the headers
+    monkeypatch.setattr("pystassh.api.Api.lib", FakeLib())
+    assert pystassh.api.Api.has_sftp_aio() is False
+
+    # ABI mode: decided by the functions found in the library
+    monkeypatch.setattr("pystassh.api.Api.lib", object())
+    monkeypatch.setattr("pystassh.api.Api.sftp_aio_begin_write", "<function>")
+    assert pystassh.api.Api.has_sftp_aio() is True
+    monkeypatch.delattr("pystassh.api.Api.sftp_aio_begin_write")
+    assert pystassh.api.Api.has_sftp_aio() is False
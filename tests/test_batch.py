@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh import batch
+from pystassh.channel import Channel
+from pystassh.session import Session
+
+TOKEN = "PYSTASSH-TOKEN"
+COMMANDS = [
+    "echo foo",
+    "printf 'no newline'; echo bar >&2; exit 3",
+    "printf 'a\\0b\\n\\n'",
+    "echo 'unbalanced",
+    "cat",
+    "true",
+]
+
+
+def run_script(commands):
+    """Run the script of a batch in a local shell, as a remote shell would."""
+    script = "".join(
+        [batch.preamble(TOKEN)]
+        + [
+            batch.script(TOKEN, index, command)
+            for index, command in enumerate(commands)
+        ]
+        + ["exit\n"]
+    )
+    process = subprocess.run(
+        ["sh"], input=str.encode(script), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return b"startup noise\n" + process.stdout, process.stderr
+
+
+def chunks(data, size):
+    return [data[index:][:size] for index in range(0, len(data), size)]
+
+
+def check_results(results):
+    assert [result.command for result in results] == COMMANDS
+    assert [result.raw_stdout for result in results] == [
+        b"foo\n",
+        b"no newline",
+        b"a\x00b\n\n",
+        b"",
+        b"",
+        b"",
+    ]
+    assert results[1].raw_stderr == b"bar\n"
+    assert results[3].raw_stderr
+    assert [result.return_code for result in results] == [0, 3, 0, 2, 0, 0]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100000])
+def test_batch_parser(chunk_size):
+    stdout, stderr = run_script(COMMANDS)
+    parser = batch.BatchParser(COMMANDS, str.encode(TOKEN))
+
+    results = []
+    stdout_chunks, stderr_chunks = chunks(stdout, chunk_size), chunks(
+        stderr, chunk_size
+    )
+    for index in range(max(len(stdout_chunks), len(stderr_chunks))):
+        for is_stderr, output_chunks in enumerate((stdout_chunks, stderr_chunks)):
+            if index < len(output_chunks):
+                parser.feed(bool(is_stderr), output_chunks[index])
+        results.extend(parser.results())
+        assert parser.done == (len(results) == len(COMMANDS))
+
+    check_results(results)
+
+
+def test_channel_execute_batch(monkeypatch, fake_remote):
+    stdout, stderr = run_script(COMMANDS)
+    fake_remote(
+        stdout=chunks(stdout, 10),
+        stderr=[stderr],
+    )
+    fake_write = Mock()
+    fake_close = Mock()
+    monkeypatch.setattr("pystassh.batch.new_token", lambda: TOKEN)
+    monkeypatch.setattr("pystassh.channel.Channel.open", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.request_shell", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.write", fake_write)
+    monkeypatch.setattr("pystassh.channel.Channel.close", fake_close)
+
+    channel = Channel(Session())
+    check_results(channel.execute_batch(COMMANDS))
+    written = "".join(call[0][0] for call in fake_write.call_args_list)
+    assert written.startswith(batch.preamble(TOKEN))
+    assert written.endswith("exit\n")
+    fake_close.assert_called_once_with()
+
+
+def test_channel_execute_batch_interrupted(monkeypatch, fake_remote):
+    stdout, stderr = run_script(COMMANDS[:2])
+    fake_remote(stdout=[stdout], stderr=[stderr])
+    monkeypatch.setattr("pystassh.batch.new_token", lambda: TOKEN)
+    monkeypatch.setattr("pystassh.channel.Channel.open", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.request_shell", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.write", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.close", Mock())
+
+    results = []
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        for result in Channel(Session()).iter_execute_batch(COMMANDS):
+            results.append(result)
+    assert [result.command for result in results] == COMMANDS[:2]
+
+
+def test_session_execute_batch(monkeypatch):
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+    monkeypatch.setattr(
+        "pystassh.channel.Channel.iter_execute_batch",
+        lambda _, commands: iter(["<result of {}>".format(c) for c in commands]),
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
+
+    session = Session()
+    session._session = "<session object>"
+    assert session.execute_batch(["ls", "id"]) == ["<result of ls>", "<result of id>"]
+    assert list(session.iter_execute_batch(["ls"])) == ["<result of ls>"]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pystassh.buffers import BufferPool
+
+
+def test_buffer_pool_init():
+    with pytest.raises(ValueError):
+        BufferPool(buffer_size=0)
+    with pytest.raises(ValueError):
+        BufferPool(capacity=-1)
+
+    buffer_pool = BufferPool(buffer_size=42, capacity=3)
+    assert buffer_pool.buffer_size == 42
+    assert buffer_pool.capacity == 3
+    assert buffer_pool.stats == {"allocations": 0, "reuses": 0, "available": 0}
+
+
+def test_buffer_pool_acquire_release():
+    buffer_pool = BufferPool(buffer_size=8, capacity=1)
+
+    first = buffer_pool.acquire()
+    second = buffer_pool.acquire(4)
+    assert len(first) == len(second) == 8
+    assert first is not second
+    assert buffer_pool.stats == {"allocations": 2, "reuses": 0, "available": 0}
+
+    buffer_pool.release(first)
+    buffer_pool.release(second)
+    assert buffer_pool.stats == {"allocations": 2, "reuses": 0, "available": 1}
+
+    assert buffer_pool.acquire() is first
+    assert buffer_pool.stats == {"allocations": 2, "reuses": 1, "available": 0}
+
+
+def test_buffer_pool_oversized_buffer():
+    buffer_pool = BufferPool(buffer_size=8, capacity=1)
+
+    buffer = buffer_pool.acquire(16)
+    assert len(buffer) == 16
+    buffer_pool.release(buffer)
+    assert buffer_pool.stats == {"allocations": 1, "reuses": 0, "available": 0}
+
+
+def test_buffer_pool_with_block():
+    buffer_pool = BufferPool(buffer_size=8, capacity=1)
+
+    with buffer_pool.buffer() as buffer:
+        assert len(buffer) == 8
+        assert buffer_pool.stats["available"] == 0
+    assert buffer_pool.stats["available"] == 1
+
+    with pytest.raises(RuntimeError):
+        with buffer_pool.buffer() as other:
+            assert other is buffer
+            raise RuntimeError
+    assert buffer_pool.stats == {"allocations": 1, "reuses": 1, "available": 1}
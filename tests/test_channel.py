@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import time
 from unittest.mock import Mock
 
 import pytest
 
 import pystassh.api
+import pystassh.buffers
 import pystassh.exceptions
 import pystassh.result
+import pystassh.stream
 from pystassh.channel import Channel
+from pystassh.output import OutputLimits
 from pystassh.session import Session
 
 
@@ -127,9 +131,20 @@ def test_channel_with_block(monkeypatch, session):
 
 
 def test_channel_execute(monkeypatch, session):
-    def fake_result_init(self, channel, command):
+    # Result has slots, the arguments it received are kept aside
+    arguments = {}
+
+    def fake_result_init(
+        self, channel, command, buffer_pool, lock, stats, stdin, limits, deadline
+    ):
         self._channel = channel
         self._command = command
+        arguments[id(self)] = {
+            "buffer_pool": buffer_pool,
+            "stdin": stdin,
+            "limits": limits,
+            "deadline": deadline,
+        }
 
     monkeypatch.setattr("pystassh.channel.Channel.open", Mock())
     monkeypatch.setattr("pystassh.channel.Channel.close", Mock())
@@ -151,6 +166,21 @@ def test_channel_execute(monkeypatch, session):
     assert isinstance(res, pystassh.result.Result)
     assert res._command == "ls"
     assert res._channel == channel._channel
+    assert arguments[id(res)]["buffer_pool"] is channel._buffer_pool
+    assert arguments[id(res)]["stdin"] is None
+
+    res = channel.execute("cat", stdin=b"foo")
+    assert arguments[id(res)]["stdin"] == b"foo"
+
+    limits = OutputLimits(max_bytes=10)
+    res = channel.execute("ls", limits=limits)
+    assert arguments[id(res)]["limits"] is limits
+    assert arguments[id(res)]["deadline"] is None
+
+    res = channel.execute("ls", timeout=10)
+    assert 0 < arguments[id(res)]["deadline"] - time.monotonic() <= 10
+    with pytest.raises(ValueError):
+        channel.execute("ls", timeout=-1)
 
 
 def test_channel_request_shell_error(monkeypatch, session):
@@ -304,7 +334,7 @@ def test_channel_read_write_error(monkeypatch, session, read_method):
 def test_channel_read_write(monkeypatch, session, read_method):
     channel = Channel(session)
     monkeypatch.setattr("pystassh.api.Api.new_chars", lambda sz: [0] * sz)
-    monkeypatch.setattr("pystassh.api.Api.to_string", lambda buf: buf[0])
+    monkeypatch.setattr("pystassh.api.Api.to_bytes", lambda buf, size: buf[0])
     monkeypatch.setattr(
         "pystassh.api.Api.ssh_channel_new", Mock(return_value="<channel object>")
     )
@@ -321,11 +351,8 @@ def test_channel_read_write(monkeypatch, session, read_method):
     )
 
     def _fake_read(ch, buf, sz, stderr):
-        sz = len(buf)
         buf[0] = "<read {} bytes from {}>".format(sz, ch)
-        import pystassh.api
-
-        return pystassh.api.SSH_OK
+        return sz
 
     _fake_write = Mock()
 
@@ -349,6 +376,50 @@ def test_channel_read_write(monkeypatch, session, read_method):
     _fake_write.assert_called_once_with("<channel object>", b"foo", 3)
 
 
+def test_channel_read_timeout(monkeypatch, session):
+    channel = Channel(session)
+    channel._channel = "<channel object>"
+    channel._shell_requested = True
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+    fake_read = Mock(return_value=0)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_read_timeout", fake_read)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_eof", Mock(return_value=0))
+
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        channel.read(16, timeout=0.5)
+    assert fake_read.call_args[0][2:] == (16, 0, 500)
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        channel.readinto(bytearray(16), from_stderr=True, timeout=0.5)
+    assert fake_read.call_args[0][2:] == (16, 1, 500)
+
+    # nothing is read at the end of the output
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_eof", Mock(return_value=1))
+    assert channel.read(16, timeout=0.5) == b""
+    assert channel.readinto(bytearray(16), timeout=0.5) == 0
+
+
+def test_channel_expect(monkeypatch, session, fake_remote):
+    fake_remote(stdout=[b"$ ", b"foo\n$ "])
+    channel = Channel(session)
+
+    # channel is not open
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        channel.expect("$ ")
+
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+    channel._channel = "<channel object>"
+    channel._shell_requested = True
+
+    assert channel.expect(r"\$ ").before == b""
+    assert channel.expect(r"\$ ").before == b"foo\n"
+    assert channel._expecter is not None
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_free", Mock())
+    channel.close()
+    assert channel._expecter is None
+
+
 def test_channel_is_eof(monkeypatch, session):
     channel = Channel(session)
 
@@ -369,3 +440,148 @@ def test_channel_get_error_message_error(monkeypatch, session):
     )
     channel = Channel(session)
     assert channel.get_error_message() == "<error message irrecoverable>"
+
+
+def test_channel_execute_stream(monkeypatch, session):
+    fake_close = Mock()
+    monkeypatch.setattr("pystassh.channel.Channel.open", Mock())
+    monkeypatch.setattr("pystassh.channel.Channel.close", fake_close)
+    channel = Channel(session)
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec", Mock(return_value=-1)
+    )
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        channel.execute_stream("ls")
+    fake_close.assert_called_once_with()
+    fake_close.reset_mock()
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    stream = channel.execute_stream("ls", chunk_size=42)
+    assert isinstance(stream, pystassh.stream.ResultStream)
+    assert stream.command == "ls"
+    assert stream._channel is channel
+    assert stream._chunk_size == 42
+    fake_close.assert_not_called()
+
+
+@pytest.mark.parametrize("read_method", ["read", "read_nonblocking"])
+def test_channel_read_binary(monkeypatch, session, read_method):
+    channel = Channel(session)
+    channel._channel = "<channel object>"
+    channel._shell_requested = True
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+
+    def _fake_read(_, buf, size, from_stderr):
+        buf[0:6] = b"\x1f\x8b\x00\x00ab"
+        return 6
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_{}".format(read_method), _fake_read
+    )
+    assert getattr(channel, read_method)(10) == b"\x1f\x8b\x00\x00ab"
+
+
+def test_channel_read_nonblocking_nothing_available(monkeypatch, session):
+    channel = Channel(session)
+    channel._channel = "<channel object>"
+    channel._shell_requested = True
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_read_nonblocking", Mock(return_value=0)
+    )
+    assert channel.read_nonblocking(10) == b""
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_read_nonblocking",
+        Mock(return_value=pystassh.api.SSH_EOF),
+    )
+    assert channel.read_nonblocking(10) == b""
+
+
+def test_channel_readinto(monkeypatch, session):
+    channel = Channel(session)
+    buffer = bytearray(8)
+
+    with pytest.raises(
+        pystassh.exceptions.ChannelException, match="The channel is not open"
+    ):
+        channel.readinto(buffer)
+
+    channel._channel = "<channel object>"
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+    with pytest.raises(
+        pystassh.exceptions.ChannelException,
+        match="No shell was requested for this channel",
+    ):
+        channel.readinto(buffer)
+
+    channel._shell_requested = True
+    with pytest.raises(ValueError):
+        channel.readinto(bytearray())
+    with pytest.raises(BufferError):
+        channel.readinto(b"read-only")
+
+    def _fake_read(ch, buf, size, from_stderr):
+        assert ch == "<channel object>"
+        assert size == 4
+        assert from_stderr == 1
+        buf[0:3] = b"a\x00b"
+        return 3
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_read", _fake_read)
+    assert channel.readinto(memoryview(buffer)[2:6], from_stderr=True) == 3
+    assert buffer == b"\x00\x00a\x00b\x00\x00\x00"
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_read", Mock(return_value=pystassh.api.SSH_ERROR)
+    )
+    with pytest.raises(pystassh.exceptions.ChannelException, match="Read failed"):
+        channel.readinto(buffer)
+
+
+def test_channel_read_reuses_buffers(monkeypatch, session):
+    buffer_pool = pystassh.buffers.BufferPool(buffer_size=16, capacity=1)
+    channel = Channel(session, buffer_pool=buffer_pool)
+    channel._channel = "<channel object>"
+    channel._shell_requested = True
+    monkeypatch.setattr(channel, "_is_open", Mock(return_value=True))
+
+    buffers = []
+
+    def _fake_read(_, buf, size, from_stderr):
+        buffers.append(buf)
+        return 0
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_read", _fake_read)
+    for _ in range(3):
+        channel.read(8)
+    channel.read(32)
+
+    assert buffers[0] is buffers[1] is buffers[2]
+    assert buffers[3] is not buffers[0]
+    assert buffer_pool.stats == {"allocations": 2, "reuses": 2, "available": 1}
+
+
+def test_channel_one_command_at_a_time(monkeypatch, session):
+    monkeypatch.setattr("pystassh.channel.Channel.open", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_free", Mock())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    channel = Channel(session)
+
+    stream = channel.execute_stream("ls")
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        channel.execute("ls")
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        channel.execute_stream("ls")
+
+    stream.close()
+    assert channel.execute_stream("ls").command == "ls"
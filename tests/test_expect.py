@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+import pytest
+
+import pystassh.exceptions
+from pystassh.expect import Expecter, ExpectMatch
+
+
+def test_expecter_init():
+    for max_size, search_window in [(100, 0), (100, -1), (10, 100)]:
+        with pytest.raises(ValueError):
+            Expecter("<channel object>", max_size=max_size, search_window=search_window)
+
+
+def test_expect_patterns(fake_remote):
+    fake_remote(stdout=[b"login: ", b"foo"] * 3)
+    expecter = Expecter("<channel object>")
+
+    assert expecter.expect("login: ").before == b""
+    assert expecter.expect(b"log").before == b"foo"
+    assert expecter.expect(re.compile(b"in: ")).match.group() == b"in: "
+    assert expecter.expect(["bar", "(f)oo"]).match.group(1) == b"f"
+
+    with pytest.raises(TypeError):
+        expecter.expect(re.compile("foo"))
+    with pytest.raises(ValueError):
+        expecter.expect([])
+    with pytest.raises(ValueError):
+        expecter.expect("foo", timeout=-1)
+
+
+def test_expect_across_chunks(fake_remote):
+    fake_remote(
+        stdout=[b"Welcome\nswi", b"tch", b"> show", b" version\nv1.2\nswitch> "]
+    )
+    expecter = Expecter("<channel object>")
+
+    found = expecter.expect(r"switch> ")
+    assert isinstance(found, ExpectMatch)
+    assert (found.index, found.before) == (0, b"Welcome\n")
+    found = expecter.expect(r"switch> ")
+    assert found.before == b"show version\nv1.2\n"
+
+
+def test_expect_earliest_match(fake_remote):
+    fake_remote(stdout=[b"foo --More-- bar # "])
+    expecter = Expecter("<channel object>")
+
+    found = expecter.expect([r"# $", r"--More--"])
+    assert (found.index, found.before) == (1, b"foo ")
+    found = expecter.expect([r"bar", r"ba"])
+    assert (found.index, found.match.group()) == (0, b"bar")
+    assert expecter.expect(r"#").before == b" "
+
+
+def test_expect_search_window(fake_remote):
+    fake_remote(stdout=[b"x" * 30, b"y" * 30, b"z" * 30, b"$"], window=30)
+    expecter = Expecter("<channel object>", max_size=40, search_window=10)
+
+    found = expecter.expect(r"z+\$")
+    # the output beyond the search window is not searched again
+    assert found.match.group() == b"z" * 10 + b"$"
+    # the output beyond the max size is dropped
+    assert found.before == b"y" * 9 + b"z" * 20
+
+
+def test_expect_stderr(fake_remote):
+    fake_remote(stdout=[b"foo"], stderr=[b"bar"])
+    expecter = Expecter("<channel object>")
+
+    assert expecter.expect("ar", from_stderr=True).before == b"b"
+    assert expecter.expect("o+").before == b"f"
+
+
+def test_expect_other_output_full(fake_remote):
+    # the standard error fills the window of the channel, the standard output can only
+    # arrive once it is read
+    fake_remote(
+        stdout=[b"x" * 10, b"y" * 90 + b"$"], stderr=[b"e" * 90] * 3, window=100
+    )
+    expecter = Expecter("<channel object>")
+
+    assert expecter.expect(r"\$", timeout=1).before == b"x" * 10 + b"y" * 90
+    assert expecter.expect(r"e{90}", from_stderr=True).before == b""
+
+
+def test_expect_eof(fake_remote):
+    fake_remote(stdout=[b"foo"])
+    expecter = Expecter("<channel object>")
+
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        expecter.expect("bar")
+
+
+def test_expect_timeout(fake_remote):
+    remote = fake_remote(stdout=[b"foo"], stdin_window=1000)
+    expecter = Expecter("<channel object>")
+
+    with pytest.raises(pystassh.exceptions.TimeoutException) as exc_info:
+        expecter.expect("bar", timeout=0.05)
+    assert exc_info.value.stdout == b"foo"
+    assert exc_info.value.stderr == b""
+
+    with pytest.raises(pystassh.exceptions.TimeoutException) as exc_info:
+        expecter.expect("bar", timeout=0, from_stderr=True)
+    assert (exc_info.value.stdout, exc_info.value.stderr) == (b"foo", b"")
+
+    # the output received meanwhile is still searched
+    remote.pending[False].append(b"bar")
+    assert expecter.expect("bar", timeout=0).before == b"foo"
+
+
+def test_expect_timeout_continuous_output(monkeypatch, fake_remote):
+    remote = fake_remote(stdin_window=1000)
+    expecter = Expecter("<channel object>")
+
+    def endless_poll(channel, is_stderr):
+        remote.pending[False].append(b"foo")
+        return type(remote).ssh_channel_poll(remote, channel, is_stderr)
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_poll", endless_poll)
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        expecter.expect("bar", timeout=0.05)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+import pystassh.exceptions
+from pystassh import Session
+from pystassh.fleet import Fleet
+from pystassh.pool import SessionPool
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    disconnected = []
+
+    def fake_connect(self):
+        if self._hostname == b"down":
+            raise pystassh.exceptions.ConnectionException("down")
+        self._session = "<session object>"
+
+    def fake_execute(self, command):
+        if self._hostname == b"broken":
+            raise pystassh.exceptions.ChannelException("broken")
+        return "<result of {} on {}>".format(command, self._hostname.decode())
+
+    def fake_disconnect(self):
+        if self._session is not None:
+            disconnected.append(self._hostname)
+        self._session = None
+
+    monkeypatch.setattr(Session, "connect", fake_connect)
+    monkeypatch.setattr(Session, "execute", fake_execute)
+    monkeypatch.setattr(Session, "disconnect", fake_disconnect)
+    monkeypatch.setattr(Session, "is_connected", lambda self: bool(self._session))
+    return disconnected
+
+
+def test_fleet_init():
+    with pytest.raises(ValueError):
+        Fleet(["foo"], max_workers=0)
+    assert Fleet(iter(["foo", "bar"])).hosts == ["foo", "bar"]
+    with pytest.raises(ValueError, match="foo"):
+        Fleet(["foo", "bar", "foo"])
+    with pytest.raises(TypeError):
+        Fleet(["foo"], hostname="bar")
+
+
+def test_fleet_execute(fake_sessions):
+    outcomes = Fleet(["foo", "down", "broken"], username="bar").execute("ls")
+
+    assert outcomes["foo"] == "<result of ls on foo>"
+    assert isinstance(outcomes["down"], pystassh.exceptions.ConnectionException)
+    assert isinstance(outcomes["broken"], pystassh.exceptions.ChannelException)
+    assert sorted(fake_sessions) == [b"broken", b"foo"]
+
+
+def test_fleet_iter_execute(fake_sessions):
+    host_results = list(Fleet(["foo", "down", "broken"]).iter_execute("ls"))
+    host_results = {host_result.hostname: host_result for host_result in host_results}
+
+    assert host_results["foo"].ok
+    assert host_results["foo"].result == "<result of ls on foo>"
+    assert not host_results["down"].ok and host_results["down"].result is None
+    assert not host_results["broken"].ok
+    for host_result in host_results.values():
+        assert host_result.connect_time >= 0
+        assert host_result.execute_time >= 0
+
+
+def test_fleet_iter_execute_in_parallel(fake_sessions, monkeypatch):
+    barrier = threading.Barrier(4, timeout=5)
+
+    def fake_execute(self, command):
+        barrier.wait()
+        return command
+
+    monkeypatch.setattr(Session, "execute", fake_execute)
+    outcomes = Fleet(["foo", "bar", "baz", "qux"], max_workers=4).execute("ls")
+    assert outcomes == {"foo": "ls", "bar": "ls", "baz": "ls", "qux": "ls"}
+
+
+def test_fleet_with_pool(fake_sessions):
+    pool = SessionPool()
+    fleet = Fleet(["foo", "broken"], pool=pool)
+    fleet.execute("ls")
+    fleet.execute("ls")
+
+    assert pool.stats["hits"] == 1
+    assert pool.stats["idle"] == 1
+    assert fake_sessions == [b"broken", b"broken"]
+    pool.close()
+
+
+def test_fleet_with_pool_arguments():
+    pool = SessionPool()
+    Fleet(["foo"], pool=pool, username="bar", port=2222, timeout=1)
+    with pytest.raises(TypeError, match="buffer_size, instrument"):
+        Fleet(["foo"], pool=pool, instrument=True, buffer_size=1024)
+    pool.close()
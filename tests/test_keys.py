@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.keys import KeyCache
+from pystassh.session import Session
+
+
+class FakeKeys:
+    def __init__(self, delay=0):
+        """Simulate the import of private keys, each import giving a new key."""
+        self.imports = []
+        self.freed = []
+        self.delay = delay
+
+    def ssh_pki_import_privkey_file(self, path, passphrase, _a, _b, pkey):
+        time.sleep(self.delay)
+        if not os.path.exists(path):
+            return -1
+        self.imports.append((path, passphrase))
+        pkey[0] = "<key {}>".format(len(self.imports))
+        return pystassh.api.SSH_OK
+
+    def ssh_key_free(self, key):
+        self.freed.append(key)
+
+
+@pytest.fixture()
+def fake_keys(monkeypatch):
+    def _fake_keys(delay=0):
+        keys = FakeKeys(delay)
+        monkeypatch.setattr(
+            "pystassh.api.Api.ssh_pki_import_privkey_file",
+            keys.ssh_pki_import_privkey_file,
+        )
+        monkeypatch.setattr("pystassh.api.Api.ssh_key_free", keys.ssh_key_free)
+        monkeypatch.setattr("pystassh.api.Api.new_key_pointer", lambda: [None])
+        return keys
+
+    return _fake_keys
+
+
+@pytest.fixture()
+def key_file(tmp_path):
+    path = tmp_path / "id_ed25519"
+    path.write_bytes(b"<private key>")
+    return str.encode(str(path))
+
+
+def test_key_cache_reuses_keys(fake_keys, key_file):
+    keys = fake_keys()
+    cache = KeyCache()
+    key = cache.acquire(key_file, b"passphrase")
+    cache.release(key)
+    assert cache.acquire(key_file, b"passphrase") == key
+    assert keys.imports == [(key_file, b"passphrase")]
+
+    # another passphrase is another key
+    other_key = cache.acquire(key_file, b"")
+    assert other_key != key
+    cache.release(other_key)
+    cache.release(key)
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0, "size": 2}
+    assert not keys.freed
+
+    with pytest.raises(ValueError):
+        cache.release(key)
+    with pytest.raises(ValueError):
+        KeyCache(capacity=0)
+
+
+def test_key_cache_import_error(fake_keys, tmp_path):
+    fake_keys()
+    cache = KeyCache()
+    with pytest.raises(pystassh.exceptions.AuthenticationException):
+        cache.acquire(str.encode(str(tmp_path / "missing")), b"")
+    assert cache.stats["size"] == 0
+
+    with pytest.raises(
+        pystassh.exceptions.AuthenticationException, match="irrecoverable"
+    ):
+        cache.acquire(str.encode(str(tmp_path / "missing")), b"", "<session object>")
+
+
+def test_key_cache_invalidated_on_modification(fake_keys, key_file):
+    keys = fake_keys()
+    cache = KeyCache()
+    key = cache.acquire(key_file, b"")
+
+    stat = os.stat(key_file)
+    os.utime(key_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    new_key = cache.acquire(key_file, b"")
+    assert new_key != key
+    assert len(keys.imports) == 2
+
+    # the old key is still in use, it is freed once released
+    assert not keys.freed
+    cache.release(key)
+    assert keys.freed == [key]
+    cache.release(new_key)
+    assert keys.freed == [key]
+
+
+def test_key_cache_eviction(fake_keys, tmp_path):
+    keys = fake_keys()
+    cache = KeyCache(capacity=2)
+    paths = []
+    for index in range(3):
+        path = tmp_path / "key{}".format(index)
+        path.write_bytes(b"<private key>")
+        paths.append(str.encode(str(path)))
+
+    first_key = cache.acquire(paths[0], b"")
+    cache.release(first_key)
+    cache.release(cache.acquire(paths[1], b""))
+    cache.release(cache.acquire(paths[0], b""))
+    cache.release(cache.acquire(paths[2], b""))
+
+    # the least recently used key is freed
+    assert keys.freed == ["<key 2>"]
+    assert cache.stats["evictions"] == 1
+    assert cache.acquire(paths[0], b"") == first_key
+
+    cache.clear()
+    assert keys.freed == ["<key 2>", "<key 3>"]
+    cache.release(first_key)
+    assert keys.freed == ["<key 2>", "<key 3>", first_key]
+    assert cache.stats["size"] == 0
+
+
+def test_key_cache_concurrent_imports(fake_keys, key_file):
+    keys = fake_keys(delay=0.05)
+    cache = KeyCache()
+    acquired = []
+    threads = [
+        threading.Thread(target=lambda: acquired.append(cache.acquire(key_file, b"")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the threads waited for the first import instead of importing the key again
+    assert len(keys.imports) == 1
+    assert acquired == ["<key 1>"] * 8
+    for key in acquired:
+        cache.release(key)
+    # nothing is kept about the imports once they are over
+    assert cache._imports == {}
+
+
+def test_key_cache_forgets_passphrases(fake_keys, key_file):
+    fake_keys()
+    cache = KeyCache()
+    cache.release(cache.acquire(key_file, b"secret"))
+    with pytest.raises(pystassh.exceptions.AuthenticationException):
+        cache.acquire(b"/missing", b"secret")
+
+    assert cache._imports == {}
+    assert all(b"secret" not in name for name in cache._entries)
+
+
+def test_session_connect_shares_key(monkeypatch, fake_keys, key_file, key_cache):
+    keys = fake_keys()
+    fake_userauth = Mock(return_value=pystassh.api.SSH_AUTH_SUCCESS)
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_options_set", lambda *_: pystassh.api.SSH_OK
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", lambda *_: pystassh.api.SSH_OK)
+    monkeypatch.setattr("pystassh.api.Api.ssh_userauth_publickey", fake_userauth)
+    monkeypatch.setattr("pystassh.session.Session.is_connected", lambda _: False)
+
+    for _ in range(3):
+        Session(privkey_file=key_file.decode(), passphrase="foo").connect()
+    assert keys.imports == [(key_file, b"foo")]
+    assert [call.args[2] for call in fake_userauth.call_args_list] == ["<key 1>"] * 3
+    assert key_cache.stats["hits"] == 2
+    assert not keys.freed
+
+    # without cache, the key is imported and freed on each connection
+    for _ in range(2):
+        Session(
+            privkey_file=key_file.decode(), passphrase="foo", key_cache=False
+        ).connect()
+    assert len(keys.imports) == 3
+    assert keys.freed == ["<key 2>", "<key 3>"]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh import Session
+from pystassh.options import FAST_CIPHERS, Options
+
+
+@pytest.fixture()
+def options_set(monkeypatch):
+    calls = []
+
+    def fake_options_set(session, option, value):
+        if isinstance(value, bytes):
+            calls.append((option, value))
+        else:
+            calls.append((option, value[0]))
+        return pystassh.api.SSH_OK
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_options_set", fake_options_set)
+    return calls
+
+
+def test_options_init():
+    options = Options(ciphers="aes128-ctr,aes256-ctr", macs=["hmac-sha2-256"])
+    assert options.ciphers == ("aes128-ctr", "aes256-ctr")
+    assert options.macs == ("hmac-sha2-256",)
+    assert options.compression is None
+
+    with pytest.raises(ValueError):
+        Options(ciphers=[])
+    with pytest.raises(ValueError):
+        Options(ciphers="aes128-ctr,")
+    with pytest.raises(ValueError):
+        Options(compression_level=10)
+    with pytest.raises(ValueError):
+        Options(timeout=-1)
+    with pytest.raises(TypeError):
+        Options(timeout="1")
+    with pytest.raises(TypeError):
+        Options(nodelay=1)
+
+
+def test_options_equality():
+    assert Options(ciphers=FAST_CIPHERS) == Options(ciphers=",".join(FAST_CIPHERS))
+    assert hash(Options(nodelay=True)) == hash(Options(nodelay=True))
+    assert Options(nodelay=True) != Options(nodelay=False)
+    assert Options() == Options()
+    assert repr(Options(nodelay=True)) == "<Options nodelay=True>"
+
+
+def test_options_apply(options_set):
+    Options().apply("<session object>")
+    assert options_set == []
+
+    Options(
+        ciphers=FAST_CIPHERS,
+        macs="hmac-sha2-256",
+        key_exchange="curve25519-sha256",
+        host_key_types="ssh-ed25519",
+        compression=False,
+        compression_level=6,
+        nodelay=True,
+        timeout=2.5,
+        rekey_data=1 << 32,
+        rekey_time=3600,
+    ).apply("<session object>")
+    ciphers = b"aes128-gcm@openssh.com,chacha20-poly1305@openssh.com"
+    assert options_set == [
+        (pystassh.api.SSH_OPTIONS_CIPHERS_C_S, ciphers),
+        (pystassh.api.SSH_OPTIONS_CIPHERS_S_C, ciphers),
+        (pystassh.api.SSH_OPTIONS_HMAC_C_S, b"hmac-sha2-256"),
+        (pystassh.api.SSH_OPTIONS_HMAC_S_C, b"hmac-sha2-256"),
+        (pystassh.api.SSH_OPTIONS_KEY_EXCHANGE, b"curve25519-sha256"),
+        (pystassh.api.SSH_OPTIONS_HOSTKEYS, b"ssh-ed25519"),
+        (pystassh.api.SSH_OPTIONS_COMPRESSION, b"no"),
+        (pystassh.api.SSH_OPTIONS_COMPRESSION_LEVEL, 6),
+        (pystassh.api.SSH_OPTIONS_NODELAY, 1),
+        (pystassh.api.SSH_OPTIONS_TIMEOUT, 2),
+        (pystassh.api.SSH_OPTIONS_TIMEOUT_USEC, 500000),
+        (pystassh.api.SSH_OPTIONS_REKEY_DATA, 1 << 32),
+        (pystassh.api.SSH_OPTIONS_REKEY_TIME, 3600000),
+    ]
+
+
+def test_options_apply_error(monkeypatch):
+    monkeypatch.setattr("pystassh.api.Api.ssh_options_set", Mock(return_value=-1))
+    monkeypatch.setattr("pystassh.api.Api.get_error_message", lambda _: "unknown")
+    with pytest.raises(pystassh.exceptions.ConnectionException) as error:
+        Options(ciphers="foo").apply("<session object>")
+    assert "'ciphers'" in str(error.value)
+
+
+def test_session_options(monkeypatch, options_set):
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+
+    session = Session("foo", options=Options(nodelay=True))
+    assert session.options == Options(nodelay=True)
+    session._new_session()
+    assert options_set[-1] == (pystassh.api.SSH_OPTIONS_NODELAY, 1)
+
+    assert Session().options == Options()
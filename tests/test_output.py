@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+
+import pytest
+
+import pystassh.exceptions
+from pystassh.output import ABORT, OutputCollector, OutputLimits, map_output
+
+
+def test_output_limits_validation():
+    with pytest.raises(ValueError):
+        OutputLimits(max_bytes=-1)
+    with pytest.raises(ValueError):
+        OutputLimits(spill_threshold=-1)
+    with pytest.raises(ValueError):
+        OutputLimits(overflow="ignore")
+
+
+def test_output_collector_unlimited():
+    collector = OutputCollector()
+    collector.write(b"foo")
+    collector.write(bytearray(b"bar"))
+    assert collector.getvalue() == b"foobar"
+    assert isinstance(collector.getvalue(), bytes)
+    assert collector.size == 6
+    assert not collector.truncated
+
+
+def test_output_collector_truncate():
+    collector = OutputCollector(OutputLimits(max_bytes=5))
+    for chunk in (b"foo", b"bar", b"baz"):
+        collector.write(chunk)
+    assert collector.getvalue() == b"fooba"
+    assert collector.truncated
+
+    collector = OutputCollector(OutputLimits(max_bytes=0))
+    collector.write(b"foo")
+    assert collector.getvalue() == b""
+    assert collector.truncated
+
+
+def test_output_collector_abort():
+    collector = OutputCollector(OutputLimits(max_bytes=5, overflow=ABORT), "stdout")
+    collector.write(b"foo")
+    with pytest.raises(pystassh.exceptions.OutputLimitException, match="stdout"):
+        collector.write(b"bar")
+
+
+def test_output_collector_spill(tmp_path):
+    limits = OutputLimits(max_bytes=10000, spill_threshold=100, spill_dir=str(tmp_path))
+    collector = OutputCollector(limits)
+    collector.write(b"x" * 60)
+    collector.write(b"y" * 60)
+    for _ in range(1000):
+        collector.write(b"z" * 10)
+
+    output = collector.getvalue()
+    assert not isinstance(output, bytes)
+    data = map_output(output)
+    assert isinstance(data, mmap.mmap)
+    assert data[:] == b"x" * 60 + b"y" * 60 + b"z" * 9880
+    assert collector.truncated
+    assert map_output(data) is data
+    assert map_output(b"foo") == b"foo"
+    # the temporary file is anonymous
+    assert list(tmp_path.iterdir()) == []
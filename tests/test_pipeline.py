@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.pipeline import iter_pipelined
+from pystassh.session import Session
+
+
+class FakeServer:
+    def __init__(self, failing=()):
+        """Simulate a server replying to each request of a channel one round trip later."""
+        self.calls = []
+        self.channels = {}
+        self.open_channels = 0
+        self.max_open_channels = 0
+        self._failing = failing
+
+    def _reply(self, channel, request):
+        # the first call sends the request, the next one gets the reply
+        self.calls.append((request, channel))
+        state = self.channels[channel]
+        if state.get(request):
+            return pystassh.api.SSH_OK
+        state[request] = True
+        return pystassh.api.SSH_AGAIN
+
+    def ssh_channel_new(self, _):
+        channel = "<channel {}>".format(len(self.channels))
+        self.channels[channel] = {}
+        self.open_channels += 1
+        self.max_open_channels = max(self.max_open_channels, self.open_channels)
+        return channel
+
+    def ssh_channel_open_session(self, channel):
+        return self._reply(channel, "open")
+
+    def ssh_channel_request_exec(self, channel, command):
+        if command in self._failing:
+            return -1
+        self.channels[channel]["command"] = command
+        return self._reply(channel, "exec")
+
+    def ssh_channel_poll(self, channel, is_stderr):
+        return pystassh.api.SSH_EOF
+
+    def ssh_channel_get_exit_status(self, channel):
+        return len(self.channels[channel]["command"])
+
+    def ssh_channel_free(self, channel):
+        self.open_channels -= 1
+
+
+@pytest.fixture()
+def fake_server(monkeypatch):
+    server = FakeServer()
+    for name in (
+        "ssh_channel_new",
+        "ssh_channel_open_session",
+        "ssh_channel_request_exec",
+        "ssh_channel_poll",
+        "ssh_channel_get_exit_status",
+        "ssh_channel_free",
+    ):
+        monkeypatch.setattr("pystassh.api.Api.{}".format(name), getattr(server, name))
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_set_blocking", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_is_blocking", Mock(return_value=1))
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", lambda _: -1)
+    monkeypatch.setattr("pystassh.api.Api.get_error_message", lambda _: "error")
+    return server
+
+
+def test_iter_pipelined(fake_server):
+    commands = ["a", "bb", "ccc"]
+    results = list(iter_pipelined("<session object>", commands, threading.Lock()))
+
+    assert sorted(index for index, _ in results) == [0, 1, 2]
+    for index, result in results:
+        assert result.command == commands[index]
+        assert result.return_code == len(commands[index])
+
+    # every channel is requested before any reply is waited for
+    requests = [request for request, _ in fake_server.calls]
+    assert requests[:3] == ["open"] * 3
+    assert fake_server.open_channels == 0
+    assert pystassh.api.Api.ssh_set_blocking.call_args_list[-1][0] == (
+        "<session object>",
+        1,
+    )
+
+
+def test_iter_pipelined_max_channels(fake_server):
+    commands = ["a"] * 7
+    results = list(
+        iter_pipelined("<session object>", commands, threading.Lock(), max_channels=3)
+    )
+    assert len(results) == 7
+    assert fake_server.max_open_channels == 3
+
+    for max_channels in (0, -1):
+        with pytest.raises(ValueError):
+            list(
+                iter_pipelined(
+                    "<session object>",
+                    commands,
+                    threading.Lock(),
+                    max_channels=max_channels,
+                )
+            )
+
+
+def test_iter_pipelined_nonblocking_session(fake_server):
+    pystassh.api.Api.ssh_is_blocking.return_value = 0
+    list(iter_pipelined("<session object>", ["a"], threading.Lock()))
+
+    # a session driven by an event loop stays nonblocking
+    assert {call[0] for call in pystassh.api.Api.ssh_set_blocking.call_args_list} == {
+        ("<session object>", 0)
+    }
+
+
+def test_iter_pipelined_error(fake_server):
+    fake_server._failing = (b"fail",)
+    with pytest.raises(pystassh.exceptions.ChannelException):
+        list(iter_pipelined("<session object>", ["a", "fail", "c"], threading.Lock()))
+    assert fake_server.open_channels == 0
+
+
+def test_session_execute_pipelined(monkeypatch, fake_server):
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
+
+    session = Session()
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.execute_pipelined(["ls"])
+
+    session._session = "<session object>"
+    results = session.execute_pipelined(iter(["ls", "id -u", "pwd"]))
+    assert [result.command for result in results] == ["ls", "id -u", "pwd"]
+    assert [result.return_code for result in results] == [2, 5, 3]
+
+
+def test_session_disconnect_during_pipeline(monkeypatch, fake_server):
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+
+    session = Session()
+    session._session = "<session object>"
+    results = session.iter_execute_pipelined(["ls", "id -u", "pwd"], max_channels=1)
+    next(results)
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.disconnect()
+    pystassh.api.Api.ssh_free.assert_not_called()
+
+    assert len(list(results)) == 2
+    session.disconnect()
+    pystassh.api.Api.ssh_free.assert_called_once_with("<session object>")
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+import pystassh.exceptions
+from pystassh import Session
+from pystassh.options import Options
+from pystassh.pool import SessionPool
+
+
+@pytest.fixture
+def fake_sessions(monkeypatch):
+    connected = set()
+    created = []
+
+    def fake_connect(self):
+        created.append(self)
+        connected.add(self)
+
+    monkeypatch.setattr(Session, "connect", fake_connect)
+    monkeypatch.setattr(Session, "disconnect", lambda self: connected.discard(self))
+    monkeypatch.setattr(Session, "is_connected", lambda self: self in connected)
+    return created, connected
+
+
+def test_pool_init():
+    with pytest.raises(ValueError):
+        SessionPool(max_per_key=0)
+    with pytest.raises(ValueError):
+        SessionPool(max_total=0)
+
+    pool = SessionPool()
+    assert pool.stats == {
+        "hits": 0,
+        "misses": 0,
+        "evictions": 0,
+        "idle": 0,
+        "in_use": 0,
+    }
+
+
+def test_pool_reuse(fake_sessions):
+    created, connected = fake_sessions
+    pool = SessionPool()
+
+    session = pool.acquire("foo", "bar", "baz")
+    assert session in connected
+    assert pool.stats["in_use"] == 1
+    pool.release(session)
+    assert pool.stats["idle"] == 1
+
+    assert pool.acquire("foo", "bar", "baz") is session
+    assert pool.stats["hits"] == 1 and pool.stats["misses"] == 1
+
+    # another user, port or authentication method gets another session
+    other_sessions = [
+        pool.acquire("foo", "qux", "baz"),
+        pool.acquire("foo", "bar", "baz", port=2222),
+        pool.acquire("foo", "bar", privkey_file="key"),
+        pool.acquire("foo", "bar", "baz", options=Options(compression=True)),
+    ]
+    assert len(set(other_sessions + [session])) == 5
+    assert pool.stats["misses"] == 5
+    assert len(created) == 5
+
+    # a session is only reused with the same secrets
+    pool.release(session)
+    pool.release(other_sessions[2])
+    wrong_secrets = [
+        pool.acquire("foo", "bar", "WRONG"),
+        pool.acquire("foo", "bar", privkey_file="key", passphrase="WRONG"),
+    ]
+    assert not set(wrong_secrets) & {session, other_sessions[2]}
+    assert pool.stats["misses"] == 7
+    assert pool.acquire("foo", "bar", privkey_file="key") is other_sessions[2]
+
+    # the default options are the same as no options
+    assert pool.acquire("foo", "bar", "baz", options=Options()) is session
+
+
+def test_pool_release_unknown_session(fake_sessions):
+    pool = SessionPool()
+    with pytest.raises(pystassh.exceptions.PoolException):
+        pool.release(Session())
+
+
+def test_pool_discard_disconnected_session(fake_sessions):
+    created, connected = fake_sessions
+    pool = SessionPool()
+
+    session = pool.acquire("foo")
+    pool.release(session)
+    connected.discard(session)
+
+    assert pool.acquire("foo") is not session
+    assert pool.stats["evictions"] == 1
+    assert pool.stats["in_use"] == 1
+
+    session = pool.acquire("foo")
+    pool.release(session, discard=True)
+    assert session not in connected
+    assert pool.stats["idle"] == 0
+
+
+def test_pool_idle_ttl(fake_sessions, monkeypatch):
+    created, connected = fake_sessions
+    now = [100.0]
+    monkeypatch.setattr("pystassh.pool.time.monotonic", lambda: now[0])
+    pool = SessionPool(idle_ttl=10)
+
+    session = pool.acquire("foo")
+    pool.release(session)
+    now[0] += 5
+    assert pool.evict_idle() == 0
+
+    now[0] += 5
+    assert pool.evict_idle() == 1
+    assert session not in connected
+    assert pool.stats["evictions"] == 1
+    assert pool.stats["idle"] == 0
+
+
+def test_pool_limits(fake_sessions):
+    created, connected = fake_sessions
+    pool = SessionPool(max_per_key=1, max_total=2, timeout=0.01)
+
+    first = pool.acquire("foo")
+    with pytest.raises(pystassh.exceptions.PoolException):
+        pool.acquire("foo")
+
+    second = pool.acquire("bar")
+    pool.release(second)
+
+    # the idle session is evicted to make room for a new one
+    third = pool.acquire("baz")
+    assert second not in connected
+    assert pool.stats["evictions"] == 1
+
+    with pytest.raises(pystassh.exceptions.PoolException):
+        pool.acquire("qux")
+
+    # a released session wakes up the waiting threads
+    acquired = []
+    thread = threading.Thread(
+        target=lambda: acquired.append(pool.acquire("foo", timeout=5))
+    )
+    thread.start()
+    pool.release(first)
+    thread.join()
+    assert acquired == [first]
+    pool.release(third)
+
+
+def test_pool_connect_error(fake_sessions, monkeypatch):
+    def fake_connect(_):
+        raise pystassh.exceptions.ConnectionException()
+
+    monkeypatch.setattr(Session, "connect", fake_connect)
+    pool = SessionPool(max_per_key=1)
+    with pytest.raises(pystassh.exceptions.ConnectionException):
+        pool.acquire("foo")
+    assert pool.stats["in_use"] == 0
+
+
+def test_pool_context_manager(fake_sessions):
+    created, connected = fake_sessions
+
+    with SessionPool() as pool:
+        with pool.session("foo") as session:
+            assert pool.stats["in_use"] == 1
+        assert pool.stats["idle"] == 1
+
+        with pytest.raises(pystassh.exceptions.ChannelException):
+            with pool.session("foo") as other_session:
+                assert other_session is session
+                raise pystassh.exceptions.ChannelException()
+        assert session not in connected
+
+        with pool.session("foo") as session:
+            pass
+
+    assert session not in connected
+    with pytest.raises(pystassh.exceptions.PoolException):
+        pool.acquire("foo")
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import selectors
+import socket
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh import Session
+from pystassh.reactor import Reactor
+
+
+@pytest.fixture()
+def session_api(monkeypatch):
+    handles = ("<session object {}>".format(i) for i in itertools.count())
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: next(handles))
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_options_set", lambda *_: pystassh.api.SSH_OK
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_set_blocking", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", Mock(return_value=-1))
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_poll_flags", Mock(return_value=0))
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect",
+        Mock(
+            side_effect=itertools.cycle([pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK])
+        ),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_autopubkey",
+        Mock(return_value=pystassh.api.SSH_AUTH_SUCCESS),
+    )
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_new", Mock(return_value="<channel object>")
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=17)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_free", Mock())
+
+    sessions = []
+    yield lambda: sessions.append(Session()) or sessions[-1]
+    for session in sessions:
+        session._session = None
+
+
+def test_reactor_connect(session_api):
+    session = session_api()
+    with Reactor() as reactor:
+        future = reactor.connect(session)
+        assert reactor.connect(session) is future
+        assert len(reactor) == 1
+        assert not future.done()
+
+        assert reactor.run() == 0
+        assert future.result() is None
+        assert session.is_connected()
+        assert pystassh.api.Api.ssh_connect.call_count == 2
+
+        assert reactor.connect(session).result() is None
+        assert pystassh.api.Api.ssh_connect.call_count == 2
+
+
+def test_reactor_execute(session_api, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+    session = session_api()
+    with Reactor() as reactor:
+        future = reactor.execute(session, "ls")
+        reactor.run()
+
+    result = future.result()
+    assert result.command == "ls"
+    assert result.raw_stdout == b"foobar"
+    assert result.raw_stderr == b"baz"
+    assert result.return_code == 17
+    pystassh.api.Api.ssh_set_blocking.assert_called_with(session._session, 0)
+    pystassh.api.Api.ssh_channel_free.assert_called_once_with("<channel object>")
+
+
+def test_reactor_execute_on_output(session_api, fake_remote):
+    fake_remote(stdout=[b"foo"], stderr=[b"bar"])
+    session = session_api()
+    chunks = []
+    with Reactor() as reactor:
+        future = reactor.execute(
+            session, "ls", on_output=lambda *chunk: chunks.append(chunk)
+        )
+        reactor.run()
+
+    assert sorted(chunks) == [(False, b"foo"), (True, b"bar")]
+    assert future.result().raw_stdout == b""
+
+
+def test_reactor_execute_many_sessions(session_api, fake_remote):
+    fake_remote()
+    sessions = [session_api() for _ in range(50)]
+    with Reactor() as reactor:
+        futures = [
+            reactor.execute(session, str(i))
+            for i, session in enumerate(sessions)
+            for _ in range(2)
+        ]
+        assert len(reactor) == 50
+        assert reactor.run() == 0
+
+    assert [future.result().command for future in futures] == [
+        str(i // 2) for i in range(100)
+    ]
+    assert len({session._session for session in sessions}) == 50
+    assert pystassh.api.Api.ssh_channel_free.call_count == 100
+
+
+def test_reactor_callbacks(session_api, fake_remote):
+    fake_remote()
+    session = session_api()
+    results = []
+
+    with Reactor() as reactor:
+
+        def _on_done(future):
+            results.append(future.result().command)
+            if len(results) < 3:
+                reactor.execute(session, str(len(results))).add_done_callback(_on_done)
+
+        reactor.execute(session, "0").add_done_callback(_on_done)
+        reactor.run()
+
+    assert results == ["0", "1", "2"]
+
+
+def test_reactor_connect_error(monkeypatch, session_api):
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", Mock(return_value=-1))
+    session = session_api()
+    with Reactor() as reactor:
+        future = reactor.execute(session, "ls")
+        reactor.run()
+
+    with pytest.raises(pystassh.exceptions.ConnectionException):
+        future.result()
+    assert session.is_connected() is False
+
+
+def test_reactor_cancel(session_api, fake_remote):
+    fake_remote(stdin_window=1000)
+    session = session_api()
+    with Reactor() as reactor:
+        reactor.connect(session)
+        reactor.run()
+
+        cancelled = reactor.execute(session, "ls")
+        assert cancelled.cancel()
+        assert reactor.run() == 0
+
+        future = reactor.execute(session, "cat")
+        assert reactor.run(timeout=0.05) == 1
+        assert not future.done()
+        reactor.cancel_all()
+        assert len(reactor) == 0
+
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        future.result()
+    # the cancelled command had not started yet
+    pystassh.api.Api.ssh_channel_free.assert_called_once_with("<channel object>")
+
+
+def test_reactor_cancel_while_connecting(session_api):
+    session = session_api()
+    with Reactor() as reactor:
+        future = reactor.execute(session, "ls")
+        reactor.connect(session).cancel()
+        reactor.run()
+
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        future.result()
+    pystassh.api.Api.ssh_channel_new.assert_not_called()
+
+
+def test_reactor_watches_sockets(monkeypatch, session_api, fake_remote):
+    fake_remote(stdin_window=1000)
+    local, remote = socket.socketpair()
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", lambda _: local.fileno())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_get_poll_flags",
+        lambda _: pystassh.api.SSH_WRITE_PENDING,
+    )
+    session = session_api()
+    try:
+        with Reactor() as reactor:
+            reactor.execute(session, "cat")
+            reactor.run(timeout=0.05)
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE
+            assert reactor._sockets == {session: (local.fileno(), events)}
+
+            reactor.cancel_all()
+            assert reactor._sockets == {}
+    finally:
+        local.close()
+        remote.close()
+
+
+def test_reactor_disconnect_pending(session_api, fake_remote):
+    fake_remote(stdin_window=1000)
+    session = session_api()
+    with Reactor() as reactor:
+        reactor.connect(session)
+        reactor.run()
+        reactor.execute(session, "cat")
+        reactor.run(timeout=0.05)
+        with pytest.raises(pystassh.exceptions.PystasshException):
+            session.disconnect()
+        pystassh.api.Api.ssh_free.assert_not_called()
+
+        reactor.cancel_all()
+        session.disconnect()
+    pystassh.api.Api.ssh_free.assert_called_once()
@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import mmap
+import time
 from unittest.mock import Mock
 
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.buffers import BufferPool
+from pystassh.output import ABORT, OutputLimits
 from pystassh.result import Result
+from pystassh.stats import CommandStats
 
 
 def test_result_init(monkeypatch):
     monkeypatch.setattr(
-        "pystassh.result.Result._read_stdout_or_stderr",
-        lambda _, b: b"bar\n" if b else b"foo\n",
+        "pystassh.result.Result._read_output", lambda *_: (b"foo\n", b"bar\n")
     )
     monkeypatch.setattr("pystassh.result.Result._read_return_code", lambda _: 0)
 
@@ -22,8 +30,7 @@ def test_result_init(monkeypatch):
 def test_result_properties(monkeypatch):
 
     monkeypatch.setattr(
-        "pystassh.result.Result._read_stdout_or_stderr",
-        lambda _, b: b"bar\n" if b else b"foo\n",
+        "pystassh.result.Result._read_output", lambda *_: (b"foo\n", b"bar\n")
     )
     monkeypatch.setattr("pystassh.result.Result._read_return_code", lambda _: 17)
 
@@ -38,20 +45,202 @@ def test_result_properties(monkeypatch):
 
 def test_result_read_return_code(monkeypatch):
 
-    monkeypatch.setattr("pystassh.result.Result._read_stdout_or_stderr", lambda *_: b"")
+    monkeypatch.setattr("pystassh.result.Result._read_output", lambda *_: (b"", b""))
     monkeypatch.setattr("pystassh.api.Api.ssh_channel_get_exit_status", lambda _: 17)
 
     result = Result("<channel object>", "ls")
     assert result._return_code == 17
 
 
-def test_result_read_stdout_or_stderr(monkeypatch):
+def test_result_read_output(monkeypatch, fake_remote):
     monkeypatch.setattr(
         "pystassh.result.Result._read_return_code", Mock(return_value=17)
     )
+    fake_remote(stdout=[b"foo", b"b\x00r"], stderr=[b"baz"])
+
+    result = Result("<channel object>", "ls")
+    assert result._stdout == b"foob\x00r"
+    assert isinstance(result._stdout, bytes)
+    assert result._stderr == b"baz"
+
+
+def test_result_read_output_stdin(monkeypatch, fake_remote):
     monkeypatch.setattr(
-        "pystassh.api.Api.ssh_channel_read", Mock(side_effect=[3, 0, 0])
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    remote = fake_remote(window=2000, stdin_window=1000)
+    data = b"x" * 100000
+
+    result = Result("<channel object>", "cat", stdin=data)
+    assert result.raw_stdout == remote.stdin == data
+    assert remote.stdin_eof
+
+
+def test_result_read_output_error(monkeypatch):
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_poll", Mock(return_value=pystassh.api.SSH_ERROR)
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_session", Mock(return_value="<session>")
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.get_error_message",
+        Mock(side_effect=pystassh.exceptions.UnknownException),
+    )
+
+    with pytest.raises(
+        pystassh.exceptions.ChannelException,
+        match="Read failed: <error message irrecoverable>",
+    ):
+        Result("<channel object>", "ls")
+
+
+def test_result_read_output_interleaved(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    # 20 MB on each stream, which could not fit in the channel window: reading
+    # one stream after the other would block forever
+    chunk_size = 64 * 1024
+    fake_remote(
+        stdout=[b"o" * chunk_size] * 320,
+        stderr=[b"e" * chunk_size] * 320,
+        window=4 * chunk_size,
     )
 
     result = Result("<channel object>", "ls")
-    assert result._stdout == b""
+    assert result.raw_stdout == b"o" * chunk_size * 320
+    assert result.raw_stderr == b"e" * chunk_size * 320
+
+
+def test_result_read_output_stderr_only(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    fake_remote(stderr=[b"e" * 1000] * 100, window=2000)
+
+    result = Result("<channel object>", "ls")
+    assert result.raw_stdout == b""
+    assert result.raw_stderr == b"e" * 100000
+
+
+def test_result_reuses_buffer_pool(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    buffer_pool = BufferPool(buffer_size=16, capacity=1)
+    buffers = []
+    for _ in range(2):
+        remote = fake_remote(stdout=[b"foo"], stderr=[b"bar"])
+
+        def _fake_read(channel, buffer, size, is_stderr, remote=remote):
+            buffers.append(buffer)
+            return remote.ssh_channel_read(channel, buffer, size, is_stderr)
+
+        monkeypatch.setattr("pystassh.api.Api.ssh_channel_read", _fake_read)
+        Result("<channel object>", "ls", buffer_pool=buffer_pool)
+
+    assert len(buffers) == 4
+    assert all(buffer is buffers[0] for buffer in buffers)
+    assert buffer_pool.stats == {"allocations": 1, "reuses": 1, "available": 1}
+
+
+def test_result_stats(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz!"])
+
+    assert Result("<channel object>", "ls").stats is None
+
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz!"])
+    hook = Mock()
+    stats = CommandStats("ls", hook=hook)
+    result = Result("<channel object>", "ls", stats=stats)
+    assert result.stats is stats
+    assert stats.stdout_bytes == 6
+    assert stats.stderr_bytes == 4
+    assert stats.time_to_first_byte is not None
+    assert stats.duration is not None
+    hook.assert_called_once_with(stats)
+
+
+def test_result_text_is_decoded_once():
+    result = Result.from_output("ls", b"caf\xc3\xa9\r\n\xff\n", b"error\n", 0)
+    assert not hasattr(result, "__dict__")
+    assert result.stdout == "café\r\n�"
+    assert result.stdout is result.stdout
+    assert result.stderr == "error"
+    assert result.stderr is result.stderr
+
+
+def test_result_iter_lines():
+    result = Result.from_output("ls", b"foo\r\n\nb\xc3\xa9r\nbaz", b"error\n", 0)
+    lines = list(result.iter_raw_lines())
+    assert all(isinstance(line, memoryview) for line in lines)
+    assert [bytes(line) for line in lines] == [b"foo", b"", b"b\xc3\xa9r", b"baz"]
+    assert list(result.iter_lines()) == ["foo", "", "bér", "baz"]
+    assert list(result.iter_lines()) == result.stdout.splitlines()
+    assert list(result.iter_lines(from_stderr=True)) == ["error"]
+
+    result = Result.from_output("ls", b"", b"\n\r\n", 0)
+    assert list(result.iter_lines()) == []
+    assert list(result.iter_lines(from_stderr=True)) == ["", ""]
+
+
+def test_result_read_output_limits(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    fake_remote(stdout=[b"o" * 1000] * 100, stderr=[b"e" * 10], window=2000)
+
+    result = Result("<channel object>", "ls", limits=OutputLimits(max_bytes=1500))
+    assert result.raw_stdout == b"o" * 1500
+    assert result.raw_stderr == b"e" * 10
+    assert result.truncated
+
+    fake_remote(stdout=[b"o" * 1000] * 100, window=2000)
+    with pytest.raises(pystassh.exceptions.OutputLimitException):
+        Result(
+            "<channel object>",
+            "ls",
+            limits=OutputLimits(max_bytes=1500, overflow=ABORT),
+        )
+
+
+def test_result_read_output_spill(monkeypatch, fake_remote):
+    monkeypatch.setattr(
+        "pystassh.result.Result._read_return_code", Mock(return_value=0)
+    )
+    fake_remote(stdout=[b"line\r\n" * 1000] * 10, stderr=[b"error\n"])
+
+    result = Result("<channel object>", "ls", limits=OutputLimits(spill_threshold=1000))
+    assert isinstance(result.raw_stdout, mmap.mmap)
+    assert result.raw_stdout[:] == b"line\r\n" * 10000
+    assert result.raw_stderr == b"error\n"
+    assert not result.truncated
+    assert result.stdout == "line\r\n" * 9999 + "line"
+    assert list(result.iter_lines()) == ["line"] * 10000
+
+
+def test_result_read_output_timeout(monkeypatch, fake_remote):
+    remote = fake_remote(stdout=[b"foo"], stderr=[b"bar"], stdin_window=1000)
+
+    with pytest.raises(pystassh.exceptions.TimeoutException) as error:
+        Result("<channel object>", "cat", deadline=time.monotonic() + 0.05)
+    assert error.value.stdout == b"foo"
+    assert error.value.stderr == b"bar"
+    assert remote.signals == [b"KILL"]
+
+
+def test_result_stats_on_error(fake_remote):
+    fake_remote(stdout=[b"foo"], stdin_window=1000)
+    hook = Mock()
+    stats = CommandStats("cat", hook=hook)
+
+    with pytest.raises(pystassh.exceptions.TimeoutException) as error:
+        Result("<channel object>", "cat", stats=stats, deadline=time.monotonic() + 0.05)
+    assert stats.error is error.value
+    assert stats.stdout_bytes == 3
+    assert stats.duration >= 0
+    hook.assert_called_once_with(stats)
@@ -20,6 +20,10 @@ def test_session_init():
     assert session._port == b"17"
     assert session._privkey_file == b"filename"
 
+    session = Session(buffer_size=42, buffer_pool_capacity=3)
+    assert session.buffer_pool.buffer_size == 42
+    assert session.buffer_pool.capacity == 3
+
 
 def test_session_is_connected(monkeypatch):
 
@@ -186,7 +190,7 @@ def test_session_connect_ssh_userauth_privkey_error(monkeypatch):
 
     fake_ssh_free = MagicMock()
     fake_ssh_key_free = MagicMock()
-    session = Session(privkey_file="filename")
+    session = Session(privkey_file="filename", key_cache=False)
     monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
     monkeypatch.setattr("pystassh.api.Api.ssh_free", fake_ssh_free)
     monkeypatch.setattr(
@@ -218,7 +222,9 @@ def test_session_connect_ssh_userauth_privkey_error(monkeypatch):
     fake_ssh_key_free.reset_mock()
 
     # same but with a passphrase
-    session = Session(privkey_file="filename", passphrase="pystassh rocks!")
+    session = Session(
+        privkey_file="filename", passphrase="pystassh rocks!", key_cache=False
+    )
     with pytest.raises(pystassh.exceptions.AuthenticationException):
         session.connect()
     assert session._session is None
@@ -231,7 +237,12 @@ def test_session_connect_ssh_userauth_privkey_error(monkeypatch):
 
     # same but now it is the load of the private key which fails
     monkeypatch.setattr("pystassh.api.Api.ssh_pki_import_privkey_file", lambda *_: -1)
-    with pytest.raises(pystassh.exceptions.AuthenticationException):
+    monkeypatch.setattr(
+        "pystassh.api.Api.get_error_message", lambda _: "Wrong passphrase"
+    )
+    with pytest.raises(
+        pystassh.exceptions.AuthenticationException, match="Wrong passphrase"
+    ):
         session.connect()
     assert session._session is None
     assert session.channel is None
@@ -278,7 +289,11 @@ def test_session_disconnect(monkeypatch):
     channel.reset_mock()
     fake_ssh_free.reset_mock()
 
-    monkeypatch.setattr("pystassh.session.Session.is_connected", lambda *_: True)
+    # sessions left by other tests may be garbage collected meanwhile
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected",
+        lambda self: self._session == "<session object>",
+    )
     monkeypatch.setattr(
         "pystassh.api.Api.ssh_disconnect", lambda *_: pystassh.api.SSH_OK
     )
@@ -292,6 +307,9 @@ def test_session_disconnect(monkeypatch):
 
 
 def test_session_del(monkeypatch):
+    # collect the garbage of the previous tests before mocking the api
+    gc.collect()
+
     fake_ssh_free = MagicMock()
     session = Session()
     channel = MagicMock()
@@ -338,7 +356,7 @@ def test_session_execute(monkeypatch):
     )
     monkeypatch.setattr(
         "pystassh.channel.Channel.execute",
-        lambda _, command: "<result of {}>".format(command),
+        lambda _, command, stdin, limits, timeout: "<result of {}>".format(command),
     )
     monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
     monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
@@ -355,3 +373,108 @@ def test_session_get_error_message_error(monkeypatch):
     monkeypatch.setattr("pystassh.api.Api.get_error_message", fake_get_error_message)
     session = Session()
     assert session.get_error_message() == "<error message irrecoverable>"
+
+
+def test_session_execute_stream(monkeypatch):
+    session = Session()
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.execute_stream("ls")
+
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+    monkeypatch.setattr(
+        "pystassh.channel.Channel.execute_stream",
+        lambda _, command, chunk_size, stdin, timeout: "<stream of {} by {}>".format(
+            command, chunk_size
+        ),
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
+
+    session._session = "<session object>"
+    session._channel = pystassh.channel.Channel(session._session)
+    assert session.execute_stream("ls", chunk_size=3) == "<stream of ls by 3>"
+
+
+def test_session_open_channel(monkeypatch):
+    session = Session()
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.open_channel()
+
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
+    fake_close = MagicMock()
+    monkeypatch.setattr("pystassh.channel.Channel.close", fake_close)
+
+    session._session = "<session object>"
+    first, second = session.open_channel(), session.open_channel()
+    assert first is not second
+    assert first._session == second._session == "<session object>"
+    assert first._buffer_pool is second._buffer_pool is session.buffer_pool
+    assert first._lock is second._lock is session._lock
+
+    # a channel still running a command is not freed
+    first._busy = True
+    with pytest.raises(pystassh.exceptions.PystasshException):
+        session.disconnect()
+    assert session._session == "<session object>"
+    fake_close.assert_not_called()
+
+    first._busy = False
+    session.disconnect()
+    assert fake_close.call_count == 2
+
+
+def test_session_connect_stats(monkeypatch):
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", lambda *_: None)
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_options_set", lambda *_: pystassh.api.SSH_OK
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", lambda *_: pystassh.api.SSH_OK)
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", lambda *_: None)
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_autopubkey",
+        lambda *_: pystassh.api.SSH_AUTH_SUCCESS,
+    )
+    monkeypatch.setattr(
+        "pystassh.session.Session.is_connected", lambda self: bool(self._session)
+    )
+
+    session = Session()
+    session.connect()
+    assert session.connect_stats is None
+    session.disconnect()
+
+    hook = MagicMock()
+    session = Session("foo", instrument=hook)
+    session.connect()
+    stats = session.connect_stats
+    hook.assert_called_once_with(stats)
+    assert stats.hostname == "foo"
+    assert stats.error is None
+    assert None not in (
+        stats.setup_time,
+        stats.handshake_time,
+        stats.auth_time,
+        stats.total_time,
+    )
+    assert session.open_channel()._instrument is hook
+    session.disconnect()
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect", lambda *_: pystassh.api.SSH_ERROR
+    )
+    monkeypatch.setattr("pystassh.api.Api.get_error_message", lambda *_: "error")
+    session = Session(instrument=True)
+    with pytest.raises(pystassh.exceptions.ConnectionException):
+        session.connect()
+    stats = session.connect_stats
+    assert isinstance(stats.error, pystassh.exceptions.ConnectionException)
+    assert stats.setup_time is not None
+    assert stats.handshake_time is None
+    assert stats.total_time is not None
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.session import Session
+from pystassh.sftp import Sftp
+
+
+class FakeFile:
+    def __init__(self, content):
+        self.content = content
+        self.offset = 0
+        self.eof = False
+        self.closed = False
+
+
+class FakeSftpServer:
+    def __init__(self, max_length=None):
+        """Simulate a SFTP server storing its files in memory.
+
+        The replies of the server are never longer than ``max_length`` bytes.
+        """
+        self.files = {}
+        self.opened = []
+        self.requests = {}
+        self.max_pending = 0
+        self.max_length = max_length
+
+    def _add_request(self, request):
+        request_id = len(self.requests)
+        self.requests[request_id] = request
+        pending = [r for r in self.requests.values() if r is not None]
+        self.max_pending = max(self.max_pending, len(pending))
+        return request_id
+
+    def _length(self, length):
+        return min(length, self.max_length or length)
+
+    def sftp_new(self, _):
+        return "<sftp object>"
+
+    def sftp_get_error(self, _):
+        return 2
+
+    def sftp_open(self, _, path, flags, mode):
+        if flags & os.O_CREAT:
+            self.files[path] = bytearray()
+        if path not in self.files:
+            return None
+        remote_file = FakeFile(self.files[path])
+        remote_file.mode = mode
+        self.opened.append(remote_file)
+        return remote_file
+
+    def sftp_close(self, remote_file):
+        remote_file.closed = True
+        return pystassh.api.SSH_OK
+
+    def sftp_seek64(self, remote_file, offset):
+        remote_file.offset = offset
+        return pystassh.api.SSH_OK
+
+    def sftp_write(self, remote_file, chars, size):
+        size = self._length(size)
+        remote_file.content += pystassh.api.Api.to_bytes(chars, size)
+        return size
+
+    def sftp_aio_begin_write(self, remote_file, chars, size, aio):
+        size = self._length(size)
+        data = pystassh.api.Api.to_bytes(chars, size)
+        aio[0] = self._add_request((remote_file, remote_file.offset, data))
+        remote_file.offset += size
+        return size
+
+    def sftp_aio_wait_write(self, aio):
+        remote_file, offset, data = self.requests[aio[0]]
+        self.requests[aio[0]] = None
+        end = offset + len(data)
+        remote_file.content[offset:end] = data
+        return len(data)
+
+    def sftp_async_read_begin(self, remote_file, length):
+        request_id = self._add_request((remote_file.offset, length))
+        remote_file.offset += length
+        return request_id
+
+    def sftp_async_read(self, remote_file, buffer, length, request_id):
+        if remote_file.eof:
+            return 0
+        offset, requested = self.requests[request_id]
+        self.requests[request_id] = None
+        assert requested == length
+        end = offset + self._length(length)
+        data = remote_file.content[offset:end]
+        if not data:
+            remote_file.eof = True
+            return 0
+        count = len(data)
+        buffer[0:count] = bytes(data)
+        return count
+
+
+@pytest.fixture()
+def fake_sftp(monkeypatch):
+    def _fake_sftp(max_length=None, aio=True):
+        server = FakeSftpServer(max_length)
+        for name in (
+            "sftp_new",
+            "sftp_get_error",
+            "sftp_open",
+            "sftp_close",
+            "sftp_seek64",
+            "sftp_write",
+            "sftp_aio_begin_write",
+            "sftp_aio_wait_write",
+            "sftp_async_read_begin",
+            "sftp_async_read",
+        ):
+            monkeypatch.setattr(
+                "pystassh.api.Api.{}".format(name), getattr(server, name)
+            )
+        monkeypatch.setattr("pystassh.api.Api.sftp_init", lambda _: 0)
+        monkeypatch.setattr("pystassh.api.Api.sftp_free", Mock())
+        monkeypatch.setattr("pystassh.api.Api.sftp_aio_free", Mock())
+        monkeypatch.setattr("pystassh.api.Api.new_pointer", lambda: [None])
+        monkeypatch.setattr("pystassh.api.Api.has_sftp_aio", lambda: aio)
+        monkeypatch.setattr("pystassh.api.Api.get_error_message", lambda _: "error")
+        return server
+
+    return _fake_sftp
+
+
+@pytest.fixture()
+def local_file(tmp_path):
+    path = tmp_path / "local"
+    path.write_bytes(bytes(range(256)) * 1000)
+    path.chmod(0o640)
+    return path
+
+
+def test_sftp_open_close(monkeypatch, fake_sftp):
+    fake_sftp()
+    sftp = Sftp("<session object>")
+    assert not sftp.is_open()
+    with sftp:
+        assert sftp.is_open()
+    assert not sftp.is_open()
+    pystassh.api.Api.sftp_free.assert_called_once_with("<sftp object>")
+
+    monkeypatch.setattr("pystassh.api.Api.sftp_init", lambda _: -1)
+    with pytest.raises(pystassh.exceptions.SftpException):
+        sftp.open()
+    assert not sftp.is_open()
+    assert pystassh.api.Api.sftp_free.call_count == 2
+
+    monkeypatch.setattr("pystassh.api.Api.sftp_new", lambda _: None)
+    with pytest.raises(pystassh.exceptions.SftpException):
+        sftp.open()
+
+
+@pytest.mark.parametrize("aio", [True, False])
+def test_sftp_upload(fake_sftp, local_file, aio):
+    server = fake_sftp(max_length=1000, aio=aio)
+    progress = []
+    with Sftp("<session object>") as sftp:
+        size = sftp.upload(
+            str(local_file), "/remote", chunk_size=4096, progress=progress.append
+        )
+
+    assert size == 256000
+    assert server.files[b"/remote"] == local_file.read_bytes()
+    assert progress[-1] == size
+    assert server.opened[0].mode == 0o640
+    assert server.opened[0].closed
+    if aio:
+        assert server.max_pending == 16
+
+
+def test_sftp_upload_empty(fake_sftp, tmp_path):
+    server = fake_sftp()
+    (tmp_path / "empty").write_bytes(b"")
+    with Sftp("<session object>") as sftp:
+        assert sftp.upload(str(tmp_path / "empty"), "/remote", mode=0o600) == 0
+    assert server.files[b"/remote"] == b""
+    assert server.opened[0].mode == 0o600
+
+
+def test_sftp_upload_error(monkeypatch, fake_sftp, local_file):
+    server = fake_sftp()
+    monkeypatch.setattr("pystassh.api.Api.sftp_aio_wait_write", lambda _: -1)
+    with Sftp("<session object>") as sftp:
+        with pytest.raises(pystassh.exceptions.SftpException):
+            sftp.upload(str(local_file), "/remote")
+        with pytest.raises(ValueError):
+            sftp.upload(str(local_file), "/remote", max_requests=0)
+    assert server.opened[0].closed
+    # the requests that were not waited for are freed
+    assert pystassh.api.Api.sftp_aio_free.call_count == 7
+
+
+@pytest.mark.parametrize("max_length", [None, 1000])
+def test_sftp_download(fake_sftp, local_file, tmp_path, max_length):
+    server = fake_sftp(max_length=max_length)
+    server.files[b"/remote"] = bytearray(local_file.read_bytes())
+    progress = []
+    with Sftp("<session object>") as sftp:
+        size = sftp.download(
+            "/remote",
+            str(tmp_path / "copy"),
+            chunk_size=4096,
+            max_requests=4,
+            progress=progress.append,
+        )
+
+    assert size == 256000
+    assert (tmp_path / "copy").read_bytes() == local_file.read_bytes()
+    assert progress[-1] == size
+    assert server.max_pending == 4
+    assert server.opened[0].closed
+
+
+def test_sftp_download_error(fake_sftp, tmp_path):
+    fake_sftp()
+    with Sftp("<session object>") as sftp:
+        with pytest.raises(pystassh.exceptions.SftpException) as error:
+            sftp.download("/missing", str(tmp_path / "copy"))
+    assert "'/missing'" in str(error.value)
+
+    with pytest.raises(pystassh.exceptions.SftpException):
+        sftp.download("/missing", str(tmp_path / "copy"))
+
+
+def test_session_upload_download(monkeypatch, fake_sftp, local_file, tmp_path):
+    server = fake_sftp()
+    monkeypatch.setattr("pystassh.api.Api.ssh_is_connected", lambda _: 1)
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+
+    session = Session()
+    session._session = "<session object>"
+    session.upload(str(local_file), "/remote")
+    session.download("/remote", str(tmp_path / "copy"))
+    assert (tmp_path / "copy").read_bytes() == local_file.read_bytes()
+    assert server.files[b"/remote"] == local_file.read_bytes()
+    # the same SFTP session is used for both transfers
+    pystassh.api.Api.sftp_free.assert_not_called()
+
+    session.disconnect()
+    pystassh.api.Api.sftp_free.assert_called_once_with("<sftp object>")
+
+
+def test_session_disconnect_during_transfer(monkeypatch, fake_sftp, local_file):
+    fake_sftp()
+    monkeypatch.setattr("pystassh.api.Api.ssh_is_connected", lambda _: 1)
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", Mock())
+
+    session = Session()
+    session._session = "<session object>"
+    errors = []
+
+    def progress(_):
+        try:
+            session.disconnect()
+        except pystassh.exceptions.PystasshException as error:
+            errors.append(error)
+
+    session.upload(str(local_file), "/remote", progress=progress)
+    assert errors
+    pystassh.api.Api.sftp_free.assert_not_called()
+    pystassh.api.Api.ssh_free.assert_not_called()
+
+    session.disconnect()
+    pystassh.api.Api.sftp_free.assert_called_once_with("<sftp object>")
+
+
+def test_sftp_transfers_are_serialized(fake_sftp, local_file, tmp_path):
+    fake_sftp()
+    sftp = Sftp("<session object>", lock=threading.RLock())
+    sftp.open()
+    threads = [
+        threading.Thread(target=sftp.upload, args=(str(local_file), "/remote"))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sftp.download("/remote", str(tmp_path / "copy"))
+    assert (tmp_path / "copy").read_bytes() == local_file.read_bytes()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import Mock
+
+from pystassh.stats import CommandStats, ConnectStats, new_stats
+
+
+def test_new_stats():
+    assert new_stats(False, ConnectStats, "foo") is None
+
+    stats = new_stats(True, ConnectStats, "foo")
+    assert isinstance(stats, ConnectStats)
+    assert stats.hostname == "foo"
+    assert stats._hook is None
+
+    hook = Mock()
+    stats = new_stats(hook, CommandStats, "ls")
+    assert stats.command == "ls"
+    stats.finish()
+    hook.assert_called_once_with(stats)
+
+
+def test_connect_stats():
+    stats = ConnectStats("foo")
+    stats.mark("setup_time")
+    stats.mark("handshake_time")
+    error = Exception()
+    stats.finish(error)
+
+    assert stats.setup_time >= 0
+    assert stats.handshake_time >= 0
+    assert stats.auth_time is None
+    assert stats.total_time >= stats.setup_time + stats.handshake_time
+    assert stats.error is error
+    assert set(stats.as_dict()) == {
+        "hostname",
+        "setup_time",
+        "handshake_time",
+        "auth_time",
+        "total_time",
+        "error",
+    }
+    assert repr(stats).startswith("<ConnectStats hostname='foo'")
+
+
+def test_command_stats():
+    stats = CommandStats("ls")
+    stats.mark("channel_open_time")
+    stats.mark("exec_time")
+    stats.received(False, 3)
+    first_byte = stats.time_to_first_byte
+    stats.received(True, 2)
+    stats.received(False, 4)
+    stats.finish()
+
+    assert stats.time_to_first_byte == first_byte >= 0
+    assert stats.stdout_bytes == 7
+    assert stats.stderr_bytes == 2
+    assert stats.duration >= stats.channel_open_time + stats.exec_time + first_byte
+    assert stats.error is None
+
+    stats = CommandStats("ls")
+    error = Exception()
+    stats.finish(error)
+    assert stats.error is error
+    assert stats.channel_open_time is None
+    assert stats.duration >= 0
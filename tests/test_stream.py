@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+import io
+import socket
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh.stats import CommandStats
+from pystassh.stream import ResultStream, drain, iter_stdin, pump
+
+
+@pytest.fixture()
+def channel():
+    channel = Mock()
+    channel._channel = "<channel object>"
+    channel._session_lock = None
+    channel._lock = threading.RLock()
+    return channel
+
+
+def test_result_stream_init(channel):
+    with pytest.raises(ValueError):
+        ResultStream(channel, "ls", chunk_size=0)
+
+    stream = ResultStream(channel, "ls")
+    assert stream.command == "ls"
+    assert stream.return_code is None
+    assert stream.closed is False
+
+
+def test_result_stream_iter(monkeypatch, channel, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=17)
+    )
+
+    stream = ResultStream(channel, "ls", chunk_size=3)
+    assert list(stream) == [(False, b"foo"), (True, b"baz"), (False, b"bar")]
+    assert stream.return_code == 17
+    assert stream.closed is True
+    channel.close.assert_called_once_with()
+    assert list(stream) == []
+
+
+def test_result_stream_iter_interleaved(monkeypatch, channel, fake_remote):
+    chunk_size = 64 * 1024
+    fake_remote(
+        stdout=[b"o" * chunk_size] * 320,
+        stderr=[b"e" * chunk_size] * 320,
+        window=4 * chunk_size,
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=0)
+    )
+
+    sizes = {False: 0, True: 0}
+    with ResultStream(channel, "ls", chunk_size=chunk_size) as stream:
+        for is_stderr, chunk in stream:
+            assert len(chunk) <= chunk_size
+            assert chunk == (b"e" if is_stderr else b"o") * len(chunk)
+            sizes[is_stderr] += len(chunk)
+    assert sizes == {False: chunk_size * 320, True: chunk_size * 320}
+    assert stream.return_code == 0
+
+
+def test_result_stream_iter_lines(monkeypatch, channel, fake_remote):
+    fake_remote(stdout=[b"fo", b"o\nb", b"ar\n", b"baz"], stderr=[b"qux\n"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=0)
+    )
+
+    stream = ResultStream(channel, "ls", chunk_size=4)
+    assert list(stream.iter_lines()) == [
+        (True, b"qux\n"),
+        (False, b"foo\n"),
+        (False, b"bar\n"),
+        (False, b"baz"),
+    ]
+    assert stream.return_code == 0
+
+
+def test_result_stream_iter_long_lines(monkeypatch, channel, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar", b"ba", b"z\nq", b"ux"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=0)
+    )
+
+    stream = ResultStream(channel, "ls", chunk_size=3)
+    assert list(stream.iter_lines()) == [
+        (False, b"foo"),
+        (False, b"bar"),
+        (False, b"baz\n"),
+        (False, b"qux"),
+    ]
+
+
+def test_result_stream_with_block(channel, fake_remote):
+    fake_remote(stdout=[b"foo"])
+
+    with ResultStream(channel, "ls") as stream:
+        pass
+    assert stream.closed is True
+    assert stream.return_code is None
+    assert list(stream) == []
+    channel.close.assert_called_once_with()
+
+
+def test_drain_waits_for_data(monkeypatch):
+    fake_select = Mock(return_value=pystassh.api.SSH_OK)
+    monkeypatch.setattr("pystassh.api.Api.new_channels", list)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_select", fake_select)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_eof", Mock(return_value=0))
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_poll",
+        Mock(side_effect=[0, 0, 0, 2, pystassh.api.SSH_EOF, pystassh.api.SSH_EOF]),
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_read", Mock(return_value=2))
+
+    assert list(drain("<channel object>", [0] * 8)) == [(True, 2)]
+    fake_select.assert_called_once()
+    assert fake_select.call_args[0][0] == ["<channel object>"]
+
+
+def test_drain_stops_on_eof(monkeypatch):
+    fake_select = Mock()
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_select", fake_select)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_eof", Mock(return_value=1))
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_poll", Mock(return_value=0))
+
+    assert list(drain("<channel object>", [0] * 8)) == []
+    fake_select.assert_not_called()
+
+
+def test_drain_shared_lock(monkeypatch, fake_remote):
+    remote = fake_remote(stdout=[b"foo"])
+    sent = threading.Event()
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_poll",
+        lambda *args: remote.ssh_channel_poll(*args) if sent.is_set() else 0,
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_eof", Mock(return_value=0))
+
+    lock = threading.RLock()
+    reader, writer = socket.socketpair()
+    fake_select = Mock()
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_select", fake_select)
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_get_session", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", lambda _: reader.fileno())
+
+    chunks = []
+    thread = threading.Thread(
+        target=lambda: chunks.extend(drain("<channel object>", [0] * 8, lock=lock))
+    )
+    thread.start()
+
+    # the lock is not held while waiting for the remote side
+    with lock:
+        sent.set()
+    writer.send(b"x")
+    thread.join(5)
+    reader.close()
+    writer.close()
+
+    assert chunks == [(False, 3)]
+    fake_select.assert_not_called()
+
+
+def test_iter_stdin():
+    assert list(iter_stdin(b"foo")) == [b"foo"]
+    assert list(iter_stdin([b"foo", bytearray(b"bar")])) == [b"foo", b"bar"]
+    # file objects are read in chunks, into the same buffer when possible
+    assert [bytes(chunk) for chunk in iter_stdin(io.BytesIO(b"foobar"), 4)] == [
+        b"foob",
+        b"ar",
+    ]
+
+    class Reader:
+        def __init__(self):
+            self._file = io.BytesIO(b"foobar")
+
+        def read(self, size):
+            return self._file.read(size)
+
+    assert list(iter_stdin(Reader(), 4)) == [b"foob", b"ar"]
+
+
+def test_pump(fake_remote):
+    remote = fake_remote(window=3000, stdin_window=1000)
+    data = bytes(range(256)) * 400
+    buffer = pystassh.api.Api.new_chars(512)
+
+    output = bytearray()
+    for is_stderr, count in pump("<channel object>", io.BytesIO(data), buffer):
+        assert not is_stderr
+        output += pystassh.api.Api.to_buffer(buffer, count)
+    # the remote never had to wait for its input to be written, nor its output read
+    assert output == remote.stdin == data
+    assert remote.stdin_eof
+
+
+def test_pump_closed_channel(fake_remote):
+    remote = fake_remote(stdout=[b"foo"], stdin_window=1000)
+    remote.closed = True
+    buffer = pystassh.api.Api.new_chars(512)
+
+    counts = list(pump("<channel object>", [b"bar"] * 10, buffer))
+    assert counts == [(False, 3)]
+    assert remote.stdin == b""
+    assert not remote.stdin_eof
+
+
+def test_result_stream_stdin(monkeypatch, channel, fake_remote):
+    fake_remote(stdin_window=10)
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=0)
+    )
+
+    stream = ResultStream(channel, "cat", chunk_size=4, stdin=[b"foo", b"barbaz"])
+    assert b"".join(chunk for _, chunk in stream) == b"foobarbaz"
+
+
+def test_drain_deadline(fake_remote):
+    # the remote waits for its input forever
+    remote = fake_remote(stdout=[b"foo"], stdin_window=1000)
+    buffer = pystassh.api.Api.new_chars(512)
+
+    counts = []
+    start = time.monotonic()
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        for count in drain("<channel object>", buffer, deadline=start + 0.05):
+            counts.append(count)
+    assert time.monotonic() - start < 1
+    assert counts == [(False, 3)]
+    assert remote.signals == [b"KILL"]
+
+    remote = fake_remote(stdin_window=1000)
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        list(pump("<channel object>", [b"foo"], buffer, deadline=time.monotonic()))
+    assert remote.signals == [b"KILL"]
+
+
+def test_result_stream_timeout(monkeypatch, channel, fake_remote):
+    remote = fake_remote(stdout=[b"foo"], stdin_window=1000)
+
+    stream = ResultStream(channel, "cat", deadline=time.monotonic() + 0.05)
+    assert next(stream) == (False, b"foo")
+    with pytest.raises(pystassh.exceptions.TimeoutException):
+        next(stream)
+    assert stream.closed
+    assert remote.signals == [b"KILL"]
+    channel.close.assert_called_once()
+
+
+def test_result_stream_error(monkeypatch, channel, fake_remote):
+    fake_remote(stdout=[b"foo"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_read", Mock(return_value=pystassh.api.SSH_ERROR)
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_get_session", Mock())
+    monkeypatch.setattr(
+        "pystassh.api.Api.get_error_message", Mock(return_value="Socket error")
+    )
+    buffer_pool = Mock()
+    stats = CommandStats("ls")
+
+    stream = ResultStream(channel, "ls", buffer_pool=buffer_pool, stats=stats)
+    with pytest.raises(
+        pystassh.exceptions.ChannelException, match="Socket error"
+    ) as error:
+        next(stream)
+    assert stats.error is error.value
+    assert stats.duration >= 0
+    assert stream.closed
+    channel.close.assert_called_once_with()
+    buffer_pool.release.assert_called_once_with(buffer_pool.acquire.return_value)
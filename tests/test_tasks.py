@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import pystassh.api
+import pystassh.exceptions
+from pystassh import Session
+from pystassh.buffers import BufferPool
+from pystassh.stream import POLL_INTERVAL
+from pystassh.tasks import CommandTask, ConnectTask, Task, TaskRunner
+
+
+@pytest.fixture()
+def connect_api(monkeypatch):
+    fake_ssh_free = Mock()
+    monkeypatch.setattr("pystassh.api.Api.ssh_new", lambda *_: "<session object>")
+    monkeypatch.setattr("pystassh.api.Api.ssh_free", fake_ssh_free)
+    monkeypatch.setattr("pystassh.api.Api.ssh_disconnect", Mock())
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_options_set", lambda *_: pystassh.api.SSH_OK
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_set_blocking", Mock())
+    return fake_ssh_free
+
+
+@pytest.fixture()
+def channel_api(monkeypatch):
+    fake_ssh_channel_free = Mock()
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_new", Mock(return_value="<channel object>")
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(side_effect=[pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK]),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec",
+        Mock(side_effect=[pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK]),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(side_effect=[-1, 17])
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_is_closed", Mock(return_value=0))
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_send_eof", Mock())
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_free", fake_ssh_channel_free)
+    return fake_ssh_channel_free
+
+
+def run_task(task):
+    steps = []
+    while not task.done:
+        steps.append(task.step())
+    return steps
+
+
+def test_task_step_error():
+    task = Task()
+    task._step = Mock(side_effect=ValueError)
+    task.close = Mock()
+    with pytest.raises(ValueError):
+        task.step()
+    task.close.assert_called_once_with()
+
+
+def test_connect_task(monkeypatch, connect_api):
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect",
+        Mock(side_effect=[pystassh.api.SSH_AGAIN, pystassh.api.SSH_OK]),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_autopubkey",
+        Mock(side_effect=[pystassh.api.SSH_AUTH_AGAIN, pystassh.api.SSH_AUTH_SUCCESS]),
+    )
+    session = Session()
+    task = ConnectTask(session)
+
+    assert run_task(task) == [True, False, True, False, True]
+    pystassh.api.Api.ssh_set_blocking.assert_called_once_with("<session object>", 0)
+    assert session._session == "<session object>"
+    assert session.channel is not None
+    connect_api.assert_not_called()
+
+    task.close()
+    connect_api.assert_not_called()
+    session._session = None
+
+
+def test_connect_task_stats(monkeypatch, connect_api):
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect", Mock(return_value=pystassh.api.SSH_OK)
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_autopubkey",
+        Mock(return_value=pystassh.api.SSH_AUTH_SUCCESS),
+    )
+    session = Session(instrument=True)
+    run_task(ConnectTask(session))
+    stats = session.connect_stats
+    for name in ("setup_time", "handshake_time", "auth_time", "total_time"):
+        assert getattr(stats, name) >= 0
+    assert stats.error is None
+    session._session = None
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", Mock(return_value=-1))
+    with pytest.raises(pystassh.exceptions.ConnectionException) as exc_info:
+        run_task(ConnectTask(session))
+    assert session.connect_stats.handshake_time is None
+    assert session.connect_stats.error is exc_info.value
+
+
+def test_connect_task_error(monkeypatch, connect_api):
+    monkeypatch.setattr("pystassh.api.Api.ssh_connect", Mock(return_value=-1))
+    session = Session()
+    task = ConnectTask(session)
+
+    with pytest.raises(pystassh.exceptions.ConnectionException):
+        run_task(task)
+    assert session._session is None
+    connect_api.assert_called_once_with("<session object>")
+
+
+def test_connect_task_authentication_error(monkeypatch, connect_api):
+    def _fake_ssh_pki_import_privkey_file(filename, passphrase, _a, _b, pkey):
+        pkey[0] = pystassh.api.Api.NULL
+        return pystassh.api.SSH_OK
+
+    fake_ssh_key_free = Mock()
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_connect", Mock(return_value=pystassh.api.SSH_OK)
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_pki_import_privkey_file",
+        _fake_ssh_pki_import_privkey_file,
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_userauth_publickey",
+        Mock(side_effect=[pystassh.api.SSH_AUTH_AGAIN, -1]),
+    )
+    monkeypatch.setattr("pystassh.api.Api.ssh_key_free", fake_ssh_key_free)
+    session = Session(privkey_file="filename", key_cache=False)
+    task = ConnectTask(session)
+
+    with pytest.raises(pystassh.exceptions.AuthenticationException):
+        run_task(task)
+    assert session._session is None
+    fake_ssh_key_free.assert_called_once()
+    connect_api.assert_called_once_with("<session object>")
+
+
+def test_command_task(channel_api, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+    buffer_pool = BufferPool(buffer_size=16, capacity=1)
+    task = CommandTask("<session object>", "ls", buffer_pool=buffer_pool)
+
+    run_task(task)
+    assert task.result.command == "ls"
+    assert task.result.raw_stdout == b"foobar"
+    assert task.result.raw_stderr == b"baz"
+    assert task.result.return_code == 17
+    channel_api.assert_called_once_with("<channel object>")
+    assert buffer_pool.stats["available"] == 1
+
+
+def test_command_task_stats(channel_api, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+    hook = Mock()
+    task = CommandTask("<session object>", "ls", instrument=hook)
+
+    run_task(task)
+    stats = task.result.stats
+    hook.assert_called_once_with(stats)
+    assert stats.command == "ls"
+    assert (stats.stdout_bytes, stats.stderr_bytes) == (6, 3)
+    for name in ("channel_open_time", "exec_time", "time_to_first_byte", "duration"):
+        assert getattr(stats, name) >= 0
+
+    assert CommandTask("<session object>", "ls")._stats is None
+
+
+def test_command_task_closed_without_exit_status(monkeypatch, channel_api, fake_remote):
+    fake_remote(stdout=[b"foo"])
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_get_exit_status", Mock(return_value=-1)
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_is_closed", Mock(side_effect=[0, 1])
+    )
+    task = CommandTask("<session object>", "ls")
+
+    run_task(task)
+    assert task.result.raw_stdout == b"foo"
+    assert task.result.return_code == -1
+
+
+def test_command_task_on_output(channel_api, fake_remote):
+    fake_remote(stdout=[b"foo", b"bar"], stderr=[b"baz"])
+    chunks = []
+    task = CommandTask(
+        "<session object>",
+        "ls",
+        on_output=lambda is_stderr, chunk: chunks.append((is_stderr, chunk)),
+    )
+
+    run_task(task)
+    assert chunks == [(False, b"foo"), (True, b"baz"), (False, b"bar")]
+    assert task.result.raw_stdout == b""
+    assert task.result.return_code == 17
+
+
+def test_command_task_paused(channel_api, fake_remote):
+    fake_remote(stdout=[b"foo"])
+    task = CommandTask("<session object>", "ls")
+    while task._step != task._read:
+        task.step()
+
+    task.paused = True
+    assert task.step() is False
+    assert task.step() is False
+
+    task.paused = False
+    run_task(task)
+    assert task.result.raw_stdout == b"foo"
+
+
+def test_command_task_errors(monkeypatch, channel_api):
+    monkeypatch.setattr("pystassh.api.Api.get_error_message", lambda _: "oops")
+
+    monkeypatch.setattr("pystassh.api.Api.ssh_channel_new", Mock(return_value=None))
+    with pytest.raises(
+        pystassh.exceptions.ChannelException, match="Channel cannot be created: oops"
+    ):
+        run_task(CommandTask("<session object>", "ls"))
+    channel_api.assert_not_called()
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_new", Mock(return_value="<channel object>")
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session", Mock(return_value=-1)
+    )
+    with pytest.raises(
+        pystassh.exceptions.ChannelException, match="Channel cannot be opened: oops"
+    ):
+        run_task(CommandTask("<session object>", "ls"))
+    channel_api.assert_called_once_with("<channel object>")
+    channel_api.reset_mock()
+
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_open_session",
+        Mock(return_value=pystassh.api.SSH_OK),
+    )
+    monkeypatch.setattr(
+        "pystassh.api.Api.ssh_channel_request_exec", Mock(return_value=-1)
+    )
+    task = CommandTask("<session object>", "ls", instrument=True)
+    with pytest.raises(
+        pystassh.exceptions.ChannelException, match="Command cannot be executed"
+    ) as error:
+        run_task(task)
+    channel_api.assert_called_once_with("<channel object>")
+    assert task._stats.error is error.value
+    assert task._stats.channel_open_time >= 0
+    assert task._stats.exec_time is None
+
+
+def test_task_runner_run():
+    def _fake_task(steps):
+        task = Task()
+
+        def _step():
+            result = steps.pop(0) if steps else False
+            if isinstance(result, Exception):
+                raise result
+            task.done = result == "done"
+            return bool(result)
+
+        task._step = _step
+        return task
+
+    callback = Mock()
+    runner = TaskRunner()
+    first = _fake_task([True, True, "done"])
+    error = ValueError()
+    second = _fake_task([True, error])
+    waiting = _fake_task([])
+    for task in (first, second, waiting):
+        runner.add(task, callback)
+    assert len(runner) == 3
+
+    runner.run()
+    assert len(runner) == 1
+    callback.assert_any_call(first, None)
+    callback.assert_any_call(second, error)
+
+    # nothing can progress until the socket is ready
+    runner.run()
+    assert len(runner) == 1
+    assert callback.call_count == 2
+
+    waiting._step = Mock(return_value=True)
+    waiting.done = True
+    runner.run()
+    assert len(runner) == 0
+    callback.assert_any_call(waiting, None)
+
+
+def test_task_runner_cancel():
+    callback = Mock()
+    runner = TaskRunner()
+    tasks = [Task(), Task(), Task()]
+    for task in tasks:
+        task.close = Mock()
+        runner.add(task, callback)
+
+    runner.cancel(tasks[0])
+    assert len(runner) == 2
+    tasks[0].close.assert_called_once_with()
+    assert callback.call_args[0][0] is tasks[0]
+    assert isinstance(callback.call_args[0][1], pystassh.exceptions.PystasshException)
+
+    runner.cancel_all()
+    assert len(runner) == 0
+    tasks[1].close.assert_called_once_with()
+    tasks[2].close.assert_called_once_with()
+    assert callback.call_count == 3
+
+
+def test_task_runner_waiting_sockets(monkeypatch):
+    fds = {"<session 1>": 3, "<session 2>": 4, "<session 3>": -1}
+    flags = {"<session 1>": 0, "<session 2>": pystassh.api.SSH_WRITE_PENDING}
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_fd", fds.get)
+    monkeypatch.setattr("pystassh.api.Api.ssh_get_poll_flags", flags.get)
+
+    runner = TaskRunner()
+    for handle in ("<session 1>", "<session 1>", "<session 2>", "<session 3>", None):
+        task = Task()
+        task.handle = handle
+        runner.add(task, Mock())
+    paused = Task()
+    paused.handle = "<session 4>"
+    paused.paused = True
+    runner.add(paused, Mock())
+
+    assert sorted(runner.waiting_sockets()) == [(3, False), (4, True)]
+
+
+def test_task_runner_cancel_from_callback():
+    runner = TaskRunner()
+    first, second = Task(), Task()
+    first._step = Mock(return_value=True)
+    first.done = True
+    second._step = Mock(return_value=True)
+    runner.add(first, lambda *_: runner.cancel(second))
+    runner.add(second, Mock())
+
+    runner.run()
+    assert len(runner) == 0
+    second._step.assert_not_called()
+
+
+def test_task_runner_poll_timeout():
+    runner = TaskRunner()
+    # a runner that never ran must be run at once
+    assert runner.poll_timeout() == 0
+
+    runner.run()
+    assert 0 < runner.poll_timeout() <= POLL_INTERVAL / 1000
+    assert runner.poll_deadline() > time.monotonic()